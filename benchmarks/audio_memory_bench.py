@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Memory used by the audios of a corpus, as (name, ext, path) tuples and as Audio records.
+
+Run with: python -m benchmarks.audio_memory_bench
+"""
+
+import os
+import tracemalloc
+
+import setupam.speaker
+
+
+def file_paths(speakers, audios):
+    for spk in range(speakers):
+        dir_path = os.path.join('/data/voxforge/source', 'speaker-{:06}-20150101-abc'.format(spk), 'wav')
+        for audio in range(audios):
+            yield os.path.join(dir_path, 'a{:04}.wav'.format(audio))
+
+
+def as_tuples(paths):
+    return [(os.path.splitext(os.path.basename(p))[0], os.path.splitext(p)[1][1:], p) for p in paths]
+
+
+def as_records(paths):
+    return [setupam.speaker.Audio.from_path(p) for p in paths]
+
+
+def measure(build, speakers, audios):
+    tracemalloc.start()
+    data = build(file_paths(speakers, audios))  # Both representations own the strings they keep
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del data
+    return size
+
+
+def main(speakers=2000, audios=50):
+    count = speakers * audios
+    print('{} audios'.format(count))
+    for name, build in (('tuples', as_tuples), ('Audio records', as_records)):
+        size = measure(build, speakers, audios)
+        print('{:<14} {:8.1f} MB {:6.0f} B/audio'.format(name, size / 2 ** 20, size / count))
+
+
+if __name__ == '__main__':
+    main()
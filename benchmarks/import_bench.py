@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Cumulative import time of the command line, against the budget of its startup.
+
+Run with: python -m benchmarks.import_bench [--runs 5] [--budget 200]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The budget of the cumulative import time of setupam.cli, in ms. It was about 100 ms without chardet and NumPy,
+# and 275 ms with them.
+BUDGET = 200
+
+
+def import_times(module):
+    """Map the modules imported by module, in a fresh interpreter, to their cumulative import time in µs."""
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)], cwd=ROOT,
+                             stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of setupam.cli.')
+    parser.add_argument('--runs', default=5, type=int, help='The number of fresh interpreters; the best is kept.')
+    parser.add_argument('--budget', default=BUDGET, type=float, help='The budget of the import time, in ms.')
+    args = parser.parse_args()
+    times = [import_times('setupam.cli')['setupam.cli'] / 1000 for _ in range(args.runs)]
+    print('setupam.cli: best {:.1f} ms, worst {:.1f} ms, budget {:.0f} ms'.format(min(times), max(times), args.budget))
+    if min(times) > args.budget:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Throughput of the hot paths of setupam over synthetic source trees of several sizes.
+
+Run with: python -m benchmarks.suite [--scales 10,100,1000] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import benchmarks.synthetic
+import setupam.build
+import setupam.corpus
+import setupam.io
+import setupam.source
+import setupam.speaker
+
+
+class Result(object):
+    def __init__(self, name, scale, files, size, seconds):
+        self.name, self.scale, self.files, self.size, self.seconds = name, scale, files, size, seconds
+
+    def as_dict(self):
+        return {'name': self.name, 'speakers': self.scale, 'files': self.files, 'bytes': self.size,
+                'seconds': round(self.seconds, 4), 'files_per_s': round(self.files / self.seconds, 1),
+                'mb_per_s': round(self.size / 2 ** 20 / self.seconds, 2)}
+
+    def __str__(self):
+        d = self.as_dict()
+        return '{name:<18} {speakers:>7} spk {files:>9} files {seconds:>9.3f} s {files_per_s:>12.1f} files/s ' \
+               '{mb_per_s:>9.2f} MB/s'.format(**d)
+
+
+def timed(func):
+    start = time.perf_counter()
+    value = func()
+    return value, max(time.perf_counter() - start, 1e-9)
+
+
+def text_files(src_path):
+    for dir_path, _, filenames in os.walk(src_path):
+        for filename in filenames:
+            if not filename.endswith('.wav'):
+                yield os.path.join(dir_path, filename)
+
+
+def bench_scan(src_path, scale):
+    index, seconds = timed(lambda: setupam.source.scan_source(src_path))
+    files = [stat for spk in index.values() for dir_files in spk.dirs.values() for stat in dir_files.values()]
+    return Result('scan', scale, len(files), 0, seconds), index
+
+
+def bench_load(src_path, scale, index, jobs):
+    speakers, seconds = timed(lambda: setupam.build.load_speakers(src_path, sorted(index), jobs, source_index=index))
+    files = sum(len(spk.audios) + len(spk.prompts) for spk in speakers)
+    return Result('load (jobs={})'.format(jobs), scale, files, 0, seconds), speakers
+
+
+def bench_encoding(src_path, scale):
+    paths = list(text_files(src_path))
+    size = sum(os.path.getsize(p) for p in paths)
+    reader = setupam.speaker.SpeakerFileReader()
+    _, seconds = timed(lambda: [reader._read_text(p) for p in paths])
+    return Result('encoding', scale, len(paths), size, seconds)
+
+
+def bench_prompts(src_path, scale):
+    paths = [p for p in text_files(src_path) if p.endswith('prompts-original')]
+    size = sum(os.path.getsize(p) for p in paths)
+
+    def parse():
+        for p in paths:
+            setupam.speaker.Prompts().populate(p)
+
+    _, seconds = timed(parse)
+    return Result('prompts', scale, len(paths), size, seconds)
+
+
+def bench_compile(src_path, target_path, scale, speakers, materialize):
+    corpus = setupam.corpus.Corpus('bench', target_path, src_path=src_path)
+    corpus.suffix = setupam.corpus.Corpus.TRAIN_SUFFIX
+    corpus.materialize = materialize
+    corpus.set_up()
+    for speaker in speakers:
+        corpus.add_speaker(speaker)
+    audios = [audio for spk in speakers for audio in spk.audios if audio.name in spk.prompts]
+    size = sum(os.path.getsize(audio.path) for audio in audios)
+    _, seconds = timed(corpus.compile_corpus)
+    shutil.rmtree(corpus.corpus_path)
+    return Result('compile ({})'.format(materialize), scale, len(audios), size, seconds)
+
+
+def bench_store(target_path, scale, lines):
+    os.makedirs(target_path, exist_ok=True)
+    results = []
+    for streaming in (False, True):
+        writer = setupam.io.TranscriptionWriter(os.path.join(target_path, 'bench.transcription'), streaming=streaming)
+
+        def write():
+            for i in range(lines):
+                writer.add_content('para onde a senhora quer ir', 'user{:06}_{:03}'.format(i, i % 1000))
+            writer.store()
+
+        _, seconds = timed(write)
+        size = os.path.getsize(writer.file)
+        results.append(Result('store ({})'.format('stream' if streaming else 'memory'), scale, lines, size, seconds))
+    return results
+
+
+def run(scales, utterances=10, jobs=(1, 4)):
+    results = []
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = os.path.join(tmp_dir, 'src')
+            benchmarks.synthetic.generate_tree(src_path, scale, utterances)
+            result, index = bench_scan(src_path, scale)
+            results.append(result)
+            speakers = None
+            for job_count in jobs:
+                result, speakers = bench_load(src_path, scale, index, job_count)
+                results.append(result)
+            results.append(bench_encoding(src_path, scale))
+            results.append(bench_prompts(src_path, scale))
+            for materialize in ('copy', 'hardlink'):
+                results.append(bench_compile(src_path, os.path.join(tmp_dir, 'target'), scale, speakers, materialize))
+            results.extend(bench_store(os.path.join(tmp_dir, 'store'), scale, scale * utterances * 10))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='10,100,1000', help='The comma separated numbers of speakers.')
+    parser.add_argument('--utterances', default=10, type=int, help='The number of utterances of each speaker.')
+    parser.add_argument('--json', default=None, help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+    results = run([int(scale) for scale in args.scales.split(',')], args.utterances)
+    for result in results:
+        print(result)
+    if args.json:
+        with open(args.json, mode='w') as f:
+            json.dump([result.as_dict() for result in results], f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
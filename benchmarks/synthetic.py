@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Generator of synthetic VoxForge-like source trees."""
+
+import os
+import random
+import wave
+
+WORDS = ('amanhã', 'é', 'sexta', 'para', 'onde', 'a', 'senhora', 'quer', 'ir', 'que', 'horas', 'são', 'vou', 'tomar',
+         'um', 'pouquinho', "d'água", 'coração', 'ação', 'não', 'português', 'você', 'também', 'já')
+
+README = '''User Name:{user}
+
+Speaker Characteristics:
+
+Gender: {gender}
+Age Range: Adult
+Language: PT_BR
+Pronunciation dialect: Brazilian Portuguese
+
+Recording Information:
+
+Microphone make: n/a
+Sampling Rate: {rate}
+'''
+
+# The layouts of the transcriptions: a single prompts file in etc/, or one txt file per wav
+LAYOUTS = ('prompts', 'per-file')
+# The encodings of the text files and how often each one is used
+ENCODINGS = (('utf-8', 6), ('latin-1', 2), ('utf-16', 1), ('ascii', 1))
+SAMPLE_RATES = (8000, 16000, 44100, 48000)
+
+
+def make_prompt(rng, words=8):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, words))).capitalize() + rng.choice('.?!')
+
+
+def write_wav(file_path, sample_rate, seconds, channels=1, sample_width=2):
+    with wave.open(file_path, 'wb') as f:
+        f.setparams((channels, sample_width, sample_rate, 0, 'NONE', 'not compressed'))
+        f.writeframes(b'\x00' * int(channels * sample_width * sample_rate * seconds))
+
+
+def generate_speaker(spk_path, rng, utterances=10, seconds=0.5, layout=None, encoding=None):
+    """Write a speaker's directory, returning the number of files and bytes written."""
+    layout = layout or rng.choice(LAYOUTS)
+    encoding = encoding or rng.choices([enc for enc, _ in ENCODINGS], [weight for _, weight in ENCODINGS])[0]
+    sample_rate = rng.choice(SAMPLE_RATES)
+    wav_path, etc_path = os.path.join(spk_path, 'wav'), os.path.join(spk_path, 'etc')
+    os.makedirs(wav_path)
+    os.makedirs(etc_path)
+    prompts = []
+    for i in range(utterances):
+        audio_name = 'a{:04}'.format(i)
+        write_wav(os.path.join(wav_path, audio_name + '.wav'), sample_rate, seconds)
+        prompts.append((audio_name, make_prompt(rng)))
+
+    def write_text(file_path, text):
+        with open(file_path, mode='wb') as f:
+            f.write(text.encode(encoding, errors='replace'))
+
+    if layout == 'prompts':
+        write_text(os.path.join(etc_path, 'prompts-original'),
+                   ''.join('{} {}\n'.format(name[1:], prompt) for name, prompt in prompts))
+        # The wavs are named after the ids of the prompts file
+        for name, _ in prompts:
+            os.rename(os.path.join(wav_path, name + '.wav'), os.path.join(wav_path, name[1:] + '.wav'))
+    else:
+        for name, prompt in prompts:
+            write_text(os.path.join(spk_path, name + '.txt'), prompt + '\n')
+    write_text(os.path.join(etc_path, 'README'),
+               README.format(user='user{}'.format(rng.randint(0, 10 ** 6)), gender=rng.choice(('Male', 'Female')),
+                             rate=sample_rate))
+    files = sizes = 0
+    for dir_path, _, filenames in os.walk(spk_path):
+        for filename in filenames:
+            files += 1
+            sizes += os.path.getsize(os.path.join(dir_path, filename))
+    return files, sizes
+
+
+def generate_tree(src_path, speakers, utterances=10, seconds=0.5, seed=0):
+    """Write a source tree of speakers with mixed layouts, encodings and sample rates.
+
+    Returns the number of files and bytes written.
+    """
+    rng = random.Random(seed)
+    files = sizes = 0
+    for spk in range(speakers):
+        spk_files, spk_sizes = generate_speaker(
+            os.path.join(src_path, 'user{:06}-20150101-{:03x}'.format(spk, rng.randint(0, 4095))), rng,
+            utterances, seconds)
+        files += spk_files
+        sizes += spk_sizes
+    return files, sizes
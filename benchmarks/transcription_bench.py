@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Per-line cost of the transcription normalization.
+
+Run with: python -m benchmarks.transcription_bench
+"""
+
+import random
+import re
+import timeit
+
+import setupam.io
+
+PROMPTS = [
+    "vou tomar um pouquinho d'água.", 'para onde a senhora quer ir?', 'que horas são?', 'amanhã é sexta.',
+    'o rato roeu a roupa do rei de roma, e a rainha, com raiva, resolveu remendar.',
+]
+
+
+def legacy_formatter(*args):
+    return '<s> {0} </s> ({1})'.format(re.sub('\\S*[,.?!]+\\S*', ' ', args[0]), *args[1:])
+
+
+def main(lines=100000, distinct=2000, repeat=5):
+    rng = random.Random(0)
+    pool = ['{} {}'.format(rng.choice(PROMPTS), i) for i in range(distinct)]
+    prompts = [rng.choice(pool) for _ in range(lines)]
+    uncached = setupam.io.TranscriptNormalizer(cache_size=0)
+    cached = setupam.io.TranscriptNormalizer()
+    cases = [
+        ('legacy re.sub', lambda: [legacy_formatter(p, 'id') for p in prompts]),
+        ('precompiled', lambda: [setupam.io.transcription_formatter(p, 'id', normalizer=uncached) for p in prompts]),
+        ('precompiled + cache', lambda: [setupam.io.transcription_formatter(p, 'id', normalizer=cached)
+                                         for p in prompts]),
+        ('batch + cache', lambda: cached.normalize_batch(prompts)),
+    ]
+    print('{} lines, {} distinct prompts'.format(lines, distinct))
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print('{:<22} {:8.3f} us/line'.format(name, best / lines * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
 
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     name='setupam',
     version='0.1.3',
     packages=['setupam'],
+    python_requires='>=3.7',
     url='https://github.com/gabrielaraujof/setupam',
     license='GPL v2',
     author='Gabriel Araujo',
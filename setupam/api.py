@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+
+import setupam.build
+import setupam.corpus
+import setupam.metrics
+import setupam.source
+
+
+class BuildConfig(object):
+    """The options of a build, with the defaults of the command line."""
+
+    def __init__(self, source, model, target='.', ratio=0.1, jobs=1, copy_workers=4, copy_queue=0,
+                 materialize='copy', rebuild=False, encoding_cache=None, stats=True, split_by='speaker', seed=None,
+                 output_format='files', shard_size=1024, normalize_audio=False, audio_workers=0, dedup='off',
+                 resume=False, shard=None):
+        self.source = source
+        self.model = model
+        self.target = target
+        self.ratio = ratio
+        self.jobs = jobs
+        self.copy_workers = copy_workers
+        self.copy_queue = copy_queue
+        self.materialize = materialize
+        self.rebuild = rebuild
+        self.encoding_cache = encoding_cache
+        self.stats = stats
+        self.split_by = split_by
+        self.seed = seed
+        self.output_format = output_format
+        self.shard_size = shard_size
+        self.normalize_audio = normalize_audio
+        self.audio_workers = audio_workers
+        self.dedup = dedup
+        self.resume = resume
+        # A pair (i, N) to build only the shard i of N
+        self.shard = shard
+
+
+class BuildResult(object):
+    """The outcome of a build: the speakers and utterances of each part, the copy failures and the metrics."""
+
+    def __init__(self, corpus_path, speakers, utterances, copy_errors, metrics):
+        self.corpus_path = corpus_path
+        # Map the part, train or test, to its count
+        self.speakers = speakers
+        self.utterances = utterances
+        # The (src, dst, exception) of every audio that couldn't be placed
+        self.copy_errors = copy_errors
+        # The report of setupam.metrics.Metrics.as_dict
+        self.metrics = metrics
+
+    @property
+    def ok(self):
+        return not self.copy_errors
+
+    @property
+    def elapsed(self):
+        return self.metrics['elapsed']
+
+    def __repr__(self):
+        return '<BuildResult {} speakers={} utterances={} copy_errors={}>'.format(
+            self.corpus_path, self.speakers, self.utterances, len(self.copy_errors))
+
+
+def build(config):
+    """Set up the corpus described by config, a BuildConfig, and return its BuildResult.
+
+    Unlike setupam.cli.build_corpus, logging isn't configured, so the messages go to the handlers of the embedding
+    program, and the copy failures are returned in the result instead of raised. Each build records its own metrics
+    and encoding cache, so builds of different corpora can run in concurrent threads.
+    """
+    metrics = setupam.metrics.Metrics()
+    corpora, copy_errors = setupam.build.build_corpus(
+        ratio=config.ratio, source=config.source, model=config.model, target=config.target, jobs=config.jobs,
+        copy_workers=config.copy_workers, copy_queue=config.copy_queue, materialize=config.materialize,
+        rebuild=config.rebuild, encoding_cache=config.encoding_cache, stats=config.stats, split_by=config.split_by,
+        seed=config.seed, output_format=config.output_format, shard_size=config.shard_size,
+        normalize_audio=config.normalize_audio, audio_workers=config.audio_workers, dedup=config.dedup,
+        resume=config.resume, shard=config.shard, metrics=metrics)
+    return BuildResult(
+        os.path.abspath(os.path.join(config.target, config.model)),
+        {corpus.suffix: len(corpus.speakers) for corpus in corpora},
+        # The audios that couldn't be placed are left out of the fileids
+        {corpus.suffix: sum(1 for _, spk in corpus.speakers for audio in spk.audios if audio.name in spk.prompts)
+         - len(corpus.copy_errors) for corpus in corpora},
+        copy_errors, metrics.as_dict())
+
+
+def iter_utterances(source, normalizer=None, staging=None):
+    """Yield the (speaker_id, audio_id, source_path, transcript) of every transcribed audio of the source tree.
+
+    The speakers are read one at a time, as the utterances are consumed, and nothing is written to a corpus. The
+    IDs are numbered from 1 in the order of the speakers' names, as a corpus without a test part would be. The
+    transcripts are the prompts as read, or normalized with normalizer, a setupam.io.TranscriptNormalizer, when it's
+    given. The audios of the archives are extracted under staging, or under a temporary directory removed once the
+    generator is exhausted or closed.
+    """
+    source = os.path.abspath(source)
+    if not os.path.exists(source):
+        raise ValueError("The source directory {} doesn't exists.".format(source))
+    # Only the top directory is listed up front; each speaker is indexed when it's reached
+    entries = setupam.source.list_source(source)
+    speaker_ids, audio_ids = setupam.corpus.IdAllocator(), setupam.corpus.IdAllocator()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        staging = staging or tmp_dir
+        for spk_name in sorted(entries):
+            index = setupam.source.index_speaker(entries[spk_name])
+            root = staging if isinstance(index, setupam.source.ArchiveIndex) else source
+            speaker = setupam.build.read_speaker(spk_name, os.path.join(root, spk_name), index)
+            spk_id = next(speaker_ids)
+            for audio in speaker.audios:
+                if audio.name in speaker.prompts:
+                    prompt = speaker.prompts[audio.name]
+                    yield (spk_id, next(audio_ids), audio.path,
+                           normalizer.normalize(prompt).strip() if normalizer is not None else prompt)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import shutil
+import tarfile
+
+import setupam.metrics
+import setupam.speaker
+
+# The directories of the audios, in the order SpeakerBuilder.set_audios looks for them
+AUDIO_DIRS = ('wav', '')
+PROMPTS_FILE = os.path.join('etc', 'prompts-original')
+README_FILE = os.path.join('etc', 'README')
+
+
+def _member_path(spk_name, member_name):
+    """The path of a member relative to the speaker's directory, without the archive's top directory."""
+    parts = [part for part in member_name.replace('\\', '/').split('/') if part not in ('', '.')]
+    if len(parts) > 1 and parts[0] == spk_name:
+        parts = parts[1:]
+    if '..' in parts:
+        return None
+    return os.path.join(*parts) if parts else None
+
+
+def _stage_member(archive, member, staged_path):
+    os.makedirs(os.path.dirname(staged_path), exist_ok=True)
+    with archive.extractfile(member) as src, open(staged_path, mode='wb') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+
+def load_speaker(spk_name, archive_path, staging_path, audio_format='wav', metadata=False, encoding_cache=None,
+                 metrics=setupam.metrics.METRICS):
+    """Build a speaker from its archive in a single sequential pass over the members.
+
+    The text files are parsed from memory and the audios are written once, under staging_path, from where the
+    corpus moves them to their final location. The layout is resolved as SpeakerBuilder does for directories.
+    """
+    speaker = setupam.speaker.Speaker(spk_name)
+    speaker.archive = archive_path
+    audio_suffix = '.{}'.format(audio_format)
+    audios = {audio_dir: [] for audio_dir in AUDIO_DIRS}
+    texts = {}
+    with tarfile.open(archive_path, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            rel_path = _member_path(spk_name, member.name)
+            if rel_path is None:
+                continue
+            rel_dir, filename = os.path.split(rel_path)
+            if rel_dir in audios and filename.endswith(audio_suffix):
+                staged_path = os.path.join(staging_path, rel_path)
+                _stage_member(archive, member, staged_path)
+                audios[rel_dir].append(staged_path)
+            elif rel_path in (PROMPTS_FILE, README_FILE, '{}.txt'.format(spk_name)) or \
+                    (not rel_dir and filename.endswith('.txt')):
+                with archive.extractfile(member) as src:
+                    texts[rel_path] = src.read()
+    metrics.count('archives')
+    metrics.count('archive_bytes', os.path.getsize(archive_path))
+    metrics.count('text_files', len(texts))
+    metrics.count('text_bytes', sum(len(content) for content in texts.values()))
+
+    audio_paths = next((sorted(audios[audio_dir]) for audio_dir in AUDIO_DIRS if audios[audio_dir]), None)
+    if audio_paths is None:
+        raise ValueError('The archive {} has no {} audios.'.format(archive_path, audio_format))
+    speaker.audios = setupam.speaker.Audios(setupam.speaker.Audio.from_path(path) for path in audio_paths)
+
+    speaker.prompts = setupam.speaker.Prompts()
+    speaker.prompts.encoding_cache, speaker.prompts.metrics = encoding_cache, metrics
+    for prompts_file in (PROMPTS_FILE, '{}.txt'.format(spk_name)):
+        if prompts_file in texts:
+            speaker.prompts.populate_from_contents((os.path.join(archive_path, prompts_file), texts[prompts_file]))
+            break
+    else:
+        speaker.prompts.populate_from_contents(trans_files=[
+            (os.path.join(archive_path, rel_path), content) for rel_path, content in sorted(texts.items())
+            if not os.path.dirname(rel_path) and rel_path.endswith('.txt')
+        ])
+    if metadata and README_FILE in texts:
+        speaker.metadata = setupam.speaker.Metadata()
+        speaker.metadata.encoding_cache, speaker.metadata.metrics = encoding_cache, metrics
+        speaker.metadata.populate_from_content(os.path.join(archive_path, README_FILE), texts[README_FILE])
+    return speaker
+
+
+def extract_audios(speaker, staging_path, metrics=setupam.metrics.METRICS):
+    """Stage again the audios of a speaker read from its archive, under staging_path as load_speaker did.
+
+    It's for the speakers restored from a setupam.manifest.Manifest, whose audios aren't staged until their content
+    is needed. Only the missing audios are written, in a single pass over the members. The number written is returned.
+    """
+    missing = {audio.path for audio in speaker.audios if not os.path.exists(audio.path)}
+    if not missing:
+        return 0
+    count = 0
+    with tarfile.open(speaker.archive, mode='r|*') as archive:
+        for member in archive:
+            rel_path = _member_path(speaker.name, member.name) if member.isfile() else None
+            if rel_path is not None and os.path.join(staging_path, rel_path) in missing:
+                _stage_member(archive, member, os.path.join(staging_path, rel_path))
+                count += 1
+    metrics.count('archives')
+    metrics.count('archive_bytes', os.path.getsize(speaker.archive))
+    return count
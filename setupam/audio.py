@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import importlib.util
+import logging
+import os
+import struct
+import wave
+
+import setupam.io
+import setupam.stats
+
+# The format of the audios expected by Sphinx-Train
+TARGET_RATE = 16000
+TARGET_CHANNELS = 1
+TARGET_BITS = 16
+# The taps of the low-pass filter applied before downsampling
+FILTER_TAPS = 63
+
+
+def has_numpy():
+    """Whether NumPy is installed, without importing it."""
+    return importlib.util.find_spec('numpy') is not None
+
+
+def _numpy():
+    # NumPy is slow to import and only needed for converting the audios, so it's imported on the first conversion
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError('Converting the audios requires NumPy.')
+    return numpy
+
+
+def matches_target(header, rate=TARGET_RATE, channels=TARGET_CHANNELS, bits=TARGET_BITS):
+    return (header.sample_rate, header.channels, header.bits) == (rate, channels, bits)
+
+
+def _decode(frames, sample_width):
+    """Decode the PCM frames to floats in [-1, 1)."""
+    numpy = _numpy()
+    if sample_width == 1:
+        return (numpy.frombuffer(frames, dtype=numpy.uint8).astype(numpy.float64) - 128) / 128
+    if sample_width == 2:
+        return numpy.frombuffer(frames, dtype='<i2') / 32768.
+    if sample_width == 3:
+        raw = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return numpy.where(samples & 0x800000, samples - 0x1000000, samples) / 8388608.
+    if sample_width == 4:
+        return numpy.frombuffer(frames, dtype='<i4') / 2147483648.
+    raise ValueError('Unsupported sample width: {} bytes.'.format(sample_width))
+
+
+def _lowpass(samples, cutoff, taps=FILTER_TAPS):
+    """Filter the samples with a Hamming windowed sinc, cutoff given as a fraction of the sample rate."""
+    numpy = _numpy()
+    n = numpy.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * numpy.sinc(2 * cutoff * n) * numpy.hamming(taps)
+    return numpy.convolve(samples, kernel / kernel.sum(), mode='same')
+
+
+def _resample(samples, src_rate, dst_rate):
+    numpy = _numpy()
+    if src_rate == dst_rate or not len(samples):
+        return samples
+    if dst_rate < src_rate:
+        samples = _lowpass(samples, dst_rate / src_rate / 2)
+    length = int(round(len(samples) * dst_rate / src_rate))
+    return numpy.interp(numpy.arange(length) * (src_rate / dst_rate), numpy.arange(len(samples)), samples)
+
+
+def _encode(samples):
+    numpy = _numpy()
+    return numpy.clip(numpy.round(samples * 32768), -32768, 32767).astype('<i2').tobytes()
+
+
+def convert_wav(src, dst, rate=TARGET_RATE):
+    """Write src to dst as mono 16-bit PCM at rate, downmixing and resampling it with NumPy."""
+    _numpy()
+    with wave.open(src, 'rb') as audio:
+        channels, sample_width, src_rate = audio.getnchannels(), audio.getsampwidth(), audio.getframerate()
+        frames = audio.readframes(audio.getnframes())
+    samples = _decode(frames, sample_width)
+    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    samples = _resample(samples, src_rate, rate)
+    with wave.open(dst, 'wb') as audio:
+        audio.setnchannels(TARGET_CHANNELS)
+        audio.setsampwidth(TARGET_BITS // 8)
+        audio.setframerate(rate)
+        audio.writeframes(_encode(samples))
+
+
+def normalize_file(src, dst, mode='copy', rate=TARGET_RATE):
+    """Place src at dst in the target format, converting it only when its header doesn't match.
+
+    The matching audios are placed with setupam.io.materialize_file in mode, or moved when mode is 'move'. Returns
+    whether the audio was converted and the size of dst, for the metrics of the parent process.
+    """
+    try:
+        header = setupam.stats.read_header(src)
+    except (setupam.stats.HeaderError, struct.error):
+        header = None
+    if header is not None and matches_target(header, rate):
+        converted = False
+    else:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            convert_wav(src, dst, rate)
+            converted = True
+        except (wave.Error, EOFError, ValueError) as e:
+            logging.warning('Could not convert {}, placing it as it is: {}'.format(src, e))
+            converted = False
+    if not converted:
+        if mode == 'move':
+            setupam.io.move_file(src, dst)
+        else:
+            setupam.io.materialize_file(src, dst, mode)
+    elif mode == 'move':
+        os.remove(src)
+    return converted, os.path.getsize(dst)
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import random
+import shutil
+
+import setupam.archive
+import setupam.audio
+import setupam.cache
+import setupam.corpus
+import setupam.dedup
+import setupam.io
+import setupam.journal
+import setupam.manifest
+import setupam.metrics
+import setupam.source
+import setupam.speaker
+import setupam.split
+import setupam.stats
+
+# The encoding cache and the metrics of a worker process loading speakers, sent back to the build with each speaker
+_worker_cache = None
+_worker_metrics = None
+
+
+def _init_worker(encoding_cache_path):
+    global _worker_cache, _worker_metrics
+    _worker_metrics = setupam.metrics.Metrics()
+    _worker_cache = setupam.cache.StatCache.load(encoding_cache_path) if encoding_cache_path else None
+
+
+def read_speaker(spk_name, spk_path, index=None, metadata=False, encoding_cache=None,
+                 metrics=setupam.metrics.METRICS):
+    """Build the speaker from its directory, or from its archive when index is a setupam.source.ArchiveIndex.
+
+    The audios of an archive are written under spk_path. The encodings detected are kept in encoding_cache, and
+    the files read are counted in metrics.
+    """
+    if isinstance(index, setupam.source.ArchiveIndex):
+        return setupam.archive.load_speaker(spk_name, index.path, spk_path, metadata=metadata,
+                                            encoding_cache=encoding_cache, metrics=metrics)
+    builder = setupam.speaker.SpeakerBuilder(spk_name, spk_path, index, encoding_cache, metrics)
+    builder.set_audios()
+    builder.set_prompts()
+    if metadata:
+        builder.set_metadata()
+    return builder.speaker
+
+
+def _load_speaker(task, encoding_cache=None, metrics=None):
+    """Read the speaker of a task, with the encodings detected and the metrics recorded since the last one.
+
+    In a worker process, the encoding cache and the metrics of the worker are used, and their updates are sent back
+    with the speaker for the build to merge them. In the build's process, its own are given and updated directly.
+    """
+    spk_name, spk_path, metadata, index = task
+    if metrics is not None:
+        return read_speaker(spk_name, spk_path, index, metadata, encoding_cache, metrics), {}, {}
+    speaker = read_speaker(spk_name, spk_path, index, metadata, _worker_cache, _worker_metrics)
+    return (speaker, _worker_cache.pop_updates() if _worker_cache is not None else {},
+            _worker_metrics.pop_updates())
+
+
+def load_speakers(src_path, spk_path_list, jobs=1, metadata=False, source_index=None, manifest=None,
+                  staging_path=None, encoding_cache=None, metrics=setupam.metrics.METRICS):
+    """Build the speakers found in spk_path_list and return them in the same order.
+
+    The speakers' files are resolved from source_index, a mapping of the speakers to their
+    setupam.source.SpeakerIndex, when it's given. The speakers indexed by a setupam.source.ArchiveIndex are read
+    from their archives, with their audios written under staging_path. The speakers left unchanged since the build
+    recorded in the manifest are restored from it. The encodings detected are kept in encoding_cache, a
+    setupam.cache.StatCache, and the work done is recorded in metrics.
+
+    With jobs greater than one (or zero, for one per CPU), the speakers are built in a process pool. The
+    speakers are always returned in the order of spk_path_list, so the corpus is the same as in a serial run.
+    """
+    restored = [
+        manifest.restore_speaker(src_path, spk_path, staging_path) if manifest and manifest.is_unchanged(spk_path)
+        else None
+        for spk_path in spk_path_list
+    ]
+    source_index = source_index or {}
+    tasks = [
+        (spk_path, os.path.join(_speaker_root(src_path, staging_path, source_index.get(spk_path)), spk_path),
+         metadata, source_index.get(spk_path))
+        for spk_path, speaker in zip(spk_path_list, restored) if speaker is None
+    ]
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs > 1 and len(tasks) > 1:
+        if encoding_cache is not None:
+            encoding_cache.store()  # So the workers start from the current cache
+        chunk_size = max(1, len(tasks) // (jobs * 4))
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs, initializer=_init_worker,
+                initargs=(encoding_cache.file if encoding_cache is not None else None,)) as executor:
+            speakers = _merge_speakers(restored, executor.map(_load_speaker, tasks, chunksize=chunk_size),
+                                       encoding_cache, metrics)
+    else:
+        loaded = (_load_speaker(task, encoding_cache, metrics) for task in tasks)
+        speakers = _merge_speakers(restored, loaded, encoding_cache, metrics)
+    if encoding_cache is not None:
+        encoding_cache.store()
+    return speakers
+
+
+def _speaker_root(src_path, staging_path, index):
+    if isinstance(index, setupam.source.ArchiveIndex):
+        if staging_path is None:
+            raise ValueError('A staging directory is needed for reading the archive {}.'.format(index.path))
+        return staging_path
+    return src_path
+
+
+def _merge_speakers(restored, loaded, encoding_cache, metrics):
+    progress = setupam.metrics.Progress('Loading the speakers', len(restored), 'speakers')
+    speakers = []
+    for speaker in restored:
+        if speaker is None:
+            speaker, cache_updates, metrics_updates = next(loaded)
+            if encoding_cache is not None:
+                encoding_cache.update(cache_updates)
+            metrics.update(metrics_updates)
+            metrics.count('loaded_speakers')
+        else:
+            metrics.count('restored_speakers')
+        speakers.append(speaker)
+        progress.update()
+    return speakers
+
+
+def load_spk_content(corpus, spk_path_list, jobs=1, metadata=False, source_index=None):
+    """Build the speakers found in spk_path_list and add them to the corpus, as load_speakers does."""
+    for speaker in load_speakers(corpus.src, spk_path_list, jobs, metadata, source_index, corpus.manifest,
+                                 metrics=corpus.metrics):
+        corpus.add_speaker(speaker)
+
+
+def split_speakers(speakers_dir, ratio, manifest, weights=None, seed=None, hashed=False):
+    """Split the speakers in train and test parts, keeping the part of the speakers recorded in the manifest.
+
+    Without weights, the new speakers are chosen randomly to complete the test part by speaker count, with at
+    least one speaker in it. With weights (a mapping of the speakers to their utterance count or duration), the
+    test part is balanced by weight with setupam.split.balanced_split. With hashed, the part of each new speaker
+    is chosen by setupam.split.hashed_split, independently of the others. The speakers of each part are ordered by
+    their recorded ID, followed by the new ones.
+    """
+    known = sorted((name for name in speakers_dir if manifest.split(name)), key=manifest.speaker_id)
+    if hashed:
+        return setupam.split.hashed_split(known + [name for name in speakers_dir if not manifest.split(name)], ratio,
+                                          seed, {name: manifest.split(name) for name in known})
+    if weights is not None:
+        train, test = setupam.split.balanced_split(
+            weights, ratio, seed, {name: manifest.split(name) for name in known})
+        order = {name: i for i, name in enumerate(known)}
+        return (sorted(train, key=lambda name: order.get(name, len(order))),
+                sorted(test, key=lambda name: order.get(name, len(order))))
+    new = [name for name in speakers_dir if not manifest.split(name)]
+    random.Random(seed).shuffle(new)  # Choose speakers randomly
+    known_test = [name for name in known if manifest.split(name) == setupam.corpus.Corpus.TEST_SUFFIX]
+    # Compute the percentage of the tests base
+    spk_count_test = math.floor(ratio * len(speakers_dir))
+    if not spk_count_test:
+        spk_count_test = 1
+    new_count_test = min(len(new), max(0, spk_count_test - len(known_test)))
+    train = [name for name in known if name not in known_test] + new[new_count_test:]
+    test = known_test + new[:new_count_test]
+    return train, test
+
+
+STAGING_DIR = '.staging'
+
+
+def build_corpus(*, ratio, source, model, target, jobs=1, copy_workers=4, copy_queue=0, materialize='copy',
+                 rebuild=False, encoding_cache=None, stats=True, split_by='speaker', seed=None, output_format='files',
+                 shard_size=1024, normalize_audio=False, audio_workers=0, dedup='off', resume=False, shard=None,
+                 metrics=None):
+    """Set up the corpus and return its train and test setupam.corpus.Corpus along with the copy failures.
+
+    The build records its work in metrics, a setupam.metrics.Metrics of its own when it isn't given, and keeps the
+    encodings detected in a setupam.cache.StatCache of its own, so builds of different corpora can run at the same
+    time. The copy failures of each part are also left in the copy_errors of its corpus.
+    """
+    metrics = metrics if metrics is not None else setupam.metrics.Metrics()
+    logging.info('Checking source directory.')
+    if not os.path.isabs(source):
+        source = os.path.abspath(source)
+    if not os.path.exists(source):
+        raise ValueError("The source directory {} doesn't exists.".format(source))
+    if normalize_audio and not setupam.audio.has_numpy():
+        raise ValueError('Normalizing the audios requires NumPy.')
+    if normalize_audio and output_format != 'files':
+        raise ValueError('The audios can only be normalized for the files output format.')
+    if resume and rebuild:
+        raise ValueError('A build can be either resumed or rebuilt.')
+    if dedup == 'link' and output_format != 'files':
+        raise ValueError('The duplicate audios can only be linked for the files output format.')
+    if shard is not None and split_by != 'speaker':
+        raise ValueError('A sharded build can only split by speaker, since the shards must agree on the split.')
+
+    logging.info('Scanning for speaker directories...')
+    with metrics.phase('scan'):
+        source_index = setupam.source.scan_source(source)
+    if shard is not None:
+        source_index = {
+            spk_name: index for spk_name, index in source_index.items() if setupam.split.in_shard(spk_name, shard)}
+        logging.info('Building the shard {}/{}.'.format(*shard))
+    speakers_dir = sorted(source_index)
+    spk_count = len(speakers_dir)
+    metrics.count('speakers', spk_count)
+    metrics.count('source_files', sum(len(spk_index.files(source)) for spk_index in source_index.values()))
+    logging.info("Found {} possible speaker's directories.".format(spk_count))
+
+    metadata_path = os.path.join(target, model, setupam.corpus.Corpus.METADATA_DIR)
+    os.makedirs(metadata_path, exist_ok=True)
+    with metrics.phase('manifest'):
+        encoding_cache = setupam.cache.StatCache.load(encoding_cache or os.path.join(
+            metadata_path, '{}.{}'.format(model, setupam.corpus.Corpus.ENCODING_CACHE_EXT)))
+        manifest_path = os.path.join(metadata_path, '{}.{}'.format(model, setupam.corpus.Corpus.MANIFEST_EXT))
+        manifest = (setupam.manifest.Manifest(manifest_path) if rebuild
+                    else setupam.manifest.Manifest.load(manifest_path))
+        for spk_path in speakers_dir:
+            manifest.scan(source, spk_path, source_index[spk_path])
+        dropped = manifest.prune(speakers_dir)
+        audio_format = ((setupam.audio.TARGET_RATE, setupam.audio.TARGET_CHANNELS, setupam.audio.TARGET_BITS)
+                        if normalize_audio else None)
+        if manifest.set_audio_format(audio_format):
+            logging.info('The audios are converted {} since the last build, so they are all placed again.'.format(
+                'now' if normalize_audio else 'no longer'))
+    if dropped:
+        logging.info('Removed {} speakers no longer in the source directory.'.format(len(dropped)))
+        for spk_id in dropped.values():
+            shutil.rmtree(os.path.join(target, model, setupam.corpus.Corpus.AUDIO_DIR,
+                                       setupam.corpus.Corpus.format_speaker_id(spk_id)), ignore_errors=True)
+    logging.info('{} speakers are unchanged since the last build.'.format(
+        sum(1 for spk_path in speakers_dir if manifest.is_unchanged(spk_path))))
+    journal_path = os.path.join(metadata_path, '{}.{}'.format(model, setupam.corpus.Corpus.JOURNAL_EXT))
+    reservations = {}
+    if resume:
+        placed = setupam.journal.replay(journal_path, manifest, speakers_dir)
+        reservations = setupam.journal.reservations(journal_path)
+        logging.info('Resuming the interrupted build, which placed {} audios.'.format(placed))
+    elif os.path.exists(journal_path):
+        logging.warning('Discarding the journal of an interrupted build. Use --resume to continue it instead.')
+    max_spk_id, max_audio_id = manifest.max_ids()
+    speaker_ids = setupam.corpus.IdAllocator(max_spk_id + 1)
+    # The ranges reserved by the interrupted build are left to its parts
+    audio_ids = setupam.corpus.IdAllocator(max([max_audio_id + 1] + [stop for _, stop in reservations.values()]))
+
+    # The audios of the archives are extracted here once, and then moved to their place in the corpus
+    staging_path = os.path.join(target, model, STAGING_DIR)
+    shutil.rmtree(staging_path, ignore_errors=True)
+    logging.info("Loading speakers' content...")
+    with metrics.phase('load'):
+        speakers = dict(zip(speakers_dir, load_speakers(
+            source, speakers_dir, jobs, False, source_index, manifest, staging_path, encoding_cache, metrics)))
+    if dedup != 'off' or split_by == 'duration':
+        # The content of the audios is read, so the ones of the archives restored from the manifest are staged
+        for spk_path in speakers_dir:
+            if speakers[spk_path].archive is not None:
+                setupam.archive.extract_audios(speakers[spk_path], os.path.join(staging_path, spk_path), metrics)
+    duplicates = {}
+    if dedup != 'off':
+        with metrics.phase('dedup'):
+            duplicates = find_duplicates(speakers, speakers_dir, metadata_path, model, max(copy_workers, 1), metrics)
+        logging.info('Found {} duplicate audios.'.format(len(duplicates)))
+        if dedup == 'skip':
+            for speaker in speakers.values():
+                speaker.audios = setupam.speaker.Audios(
+                    audio for audio in speaker.audios if audio.path not in duplicates)
+    weights = None
+    with metrics.phase('split'):
+        if split_by != 'speaker':
+            logging.info('Weighing the speakers by {}...'.format(split_by))
+            header_cache = setupam.cache.StatCache.load(
+                os.path.join(metadata_path, '{}.{}'.format(model, setupam.corpus.Corpus.HEADER_CACHE_EXT)))
+            weights = setupam.split.speaker_weights(speakers, split_by, max(copy_workers, 1), header_cache)
+            header_cache.store()
+        train_speakers, test_speakers = split_speakers(speakers_dir, ratio, manifest, weights, seed, shard is not None)
+    logging.info(
+        'Selected {} for the train database, and {} for the tests database.'.format(
+            len(train_speakers), len(test_speakers))
+    )
+    if weights is not None:
+        total_weight = sum(weights.values())
+        logging.info('The tests database has {:.1%} of the {}.'.format(
+            sum(weights[name] for name in test_speakers) / total_weight if total_weight else 0., split_by))
+
+    # Every ID assigned and every audio placed is journaled, so an interrupted build can be resumed
+    journal = setupam.journal.Journal(journal_path).open(append=resume)
+    corpora = []
+    for suffix, spk_paths in ((setupam.corpus.Corpus.TRAIN_SUFFIX, train_speakers),
+                              (setupam.corpus.Corpus.TEST_SUFFIX, test_speakers)):
+        corpus = setupam.corpus.Corpus(model, target, src_path=source)
+        corpus.suffix = suffix
+        corpus.copy_workers, corpus.copy_queue_depth = copy_workers, copy_queue
+        corpus.materialize, corpus.manifest, corpus.journal = materialize, manifest, journal
+        corpus.staging = staging_path
+        corpus.output_format, corpus.shard_size = output_format, shard_size << 20
+        corpus.convert_audio, corpus.convert_workers = normalize_audio, audio_workers
+        corpus.duplicates = duplicates if dedup == 'link' else {}
+        corpus.speaker_ids, corpus.metrics = speaker_ids, metrics
+        logging.info('Setting up the {} corpus...'.format(suffix))
+        corpus.set_up()
+        for spk_path in spk_paths:
+            corpus.add_speaker(speakers[spk_path])
+        # Each part gets the audio IDs it would take in a sequential build
+        new_audios = corpus.new_audio_count()
+        corpus.audio_ids = (_resumed_reservation(manifest, reservations.get(suffix), new_audios)
+                            or audio_ids.reserve(new_audios))
+        journal.reserved(suffix, corpus.audio_ids.start, corpus.audio_ids.stop)
+        corpora.append(corpus)
+    copy_errors = []
+    try:
+        logging.info('Building the train and test corpora...')
+        with metrics.phase('compile'):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(corpora)) as executor:
+                for errors in [executor.submit(corpus.compile_corpus) for corpus in corpora]:
+                    copy_errors += errors.result()
+        copy_errors += setupam.corpus.link_duplicates(corpora)
+        with metrics.phase('manifest_store'):
+            manifest.store()
+    except BaseException:
+        journal.close()
+        raise
+    journal.close(commit=True)
+    shutil.rmtree(staging_path, ignore_errors=True)
+    metrics.count('copy_errors', len(copy_errors))
+
+    if stats and output_format != 'files':
+        logging.info('The corpus statistics are only reported for the files output format.')
+    elif stats:
+        logging.info('Reporting the corpus statistics...')
+        with metrics.phase('stats'):
+            write_stats(model, target, max(copy_workers, 1))
+    return corpora, copy_errors
+
+
+def _resumed_reservation(manifest, reserved, count):
+    """The rest of the audio IDs a part reserved in the interrupted build, if they're enough for count audios.
+
+    The part gives its IDs out in order, so the ones it didn't reach continue after the highest it assigned, as in
+    an uninterrupted build.
+    """
+    if reserved is None:
+        return None
+    start, stop = reserved
+    assigned = [utterance[0] for entry in manifest.speakers.values() for utterance in entry['utterances']
+                if start <= utterance[0] < stop]
+    next_id = max(assigned, default=start - 1) + 1
+    return setupam.corpus.IdAllocator(next_id, stop) if stop - next_id >= count else None
+
+
+def find_duplicates(speakers, speakers_dir, metadata_path, model, workers=8, metrics=setupam.metrics.METRICS):
+    """Find the transcribed audios with the same content of an audio of an earlier speaker, or earlier in its own.
+
+    The hashes are cached in the corpus' etc directory, and the duplicates found are listed there along with their
+    original, a pair of paths per line.
+    """
+    Corpus = setupam.corpus.Corpus
+    audio_paths = [
+        audio.path for spk_path in speakers_dir for audio in speakers[spk_path].audios
+        if audio.name in speakers[spk_path].prompts
+    ]
+    hash_cache = setupam.cache.StatCache.load(os.path.join(metadata_path, '{}.{}'.format(model, Corpus.HASH_CACHE_EXT)))
+    duplicates = setupam.dedup.find_duplicates(audio_paths, workers, hash_cache, metrics)
+    hash_cache.store()
+    metrics.count('duplicate_audios', len(duplicates))
+    report = setupam.io.FileWriter(
+        os.path.join(metadata_path, '{}.{}'.format(model, Corpus.DUPLICATES_EXT)), '{0}\t{1}'.format)
+    for audio_path in audio_paths:
+        if audio_path in duplicates:
+            report.add_content(audio_path, duplicates[audio_path])
+    report.store()
+    return duplicates
+
+
+def write_stats(model, target, workers=8, output=None):
+    """Write the statistics report of a compiled corpus as JSON and return it.
+
+    The headers read are cached in the corpus' etc directory by the size and mtime of each audio file.
+    """
+    Corpus = setupam.corpus.Corpus
+    metadata_path = os.path.join(target, model, Corpus.METADATA_DIR)
+    splits = {
+        suffix: os.path.join(metadata_path, '{}_{}.{}'.format(model, suffix, Corpus.FILEID_EXT))
+        for suffix in (Corpus.TRAIN_SUFFIX, Corpus.TEST_SUFFIX)
+    }
+    cache = setupam.cache.StatCache.load(os.path.join(metadata_path, '{}.{}'.format(model, Corpus.HEADER_CACHE_EXT)))
+    report = setupam.stats.corpus_report(os.path.join(target, model), splits, workers, cache)
+    cache.store()
+    if output == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        output = output or os.path.join(metadata_path, '{}.{}'.format(model, Corpus.STATS_EXT))
+        with open(output, mode='w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    logging.info('The corpus has {} hours in {} audio files ({} unreadable).'.format(
+        report['total']['hours'], report['total']['files'], report['unreadable']))
+    return report
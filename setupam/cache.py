@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import json
+import logging
+import os
+
+
+class StatCache(object):
+    """A persistent mapping of file paths to values, valid while the size and mtime of each file don't change.
+
+    The entries set since the last call of pop_updates are kept apart, so the work done by a worker process can
+    be merged back into the cache of the parent process with update.
+    """
+
+    def __init__(self, file_path=None):
+        self.file = file_path
+        self.entries = {}
+        self.updates = {}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, file_path):
+        cache = cls(file_path)
+        try:
+            with open(file_path, mode='r', encoding='utf-8') as f:
+                cache.entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logging.warning('Ignoring the invalid cache {}.'.format(file_path))
+        return cache
+
+    @staticmethod
+    def file_key(file_path, stat=None):
+        stat = stat or os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get(self, file_path, stat=None):
+        entry = self.entries.get(os.path.abspath(file_path))
+        if entry is None or entry[:2] != self.file_key(file_path, stat):
+            return None
+        return entry[2]
+
+    def set(self, file_path, value, stat=None):
+        entry = self.file_key(file_path, stat) + [value]
+        file_path = os.path.abspath(file_path)
+        self.entries[file_path] = self.updates[file_path] = entry
+        self._dirty = True
+
+    def pop_updates(self):
+        updates, self.updates = self.updates, {}
+        return updates
+
+    def update(self, updates):
+        if updates:
+            self.entries.update(updates)
+            self.updates.update(updates)
+            self._dirty = True
+
+    def store(self):
+        if not (self.file and self._dirty):
+            return
+        tmp_path = self.file + '.tmp'
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.file)
+        self._dirty = False
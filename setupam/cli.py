@@ -18,13 +18,15 @@
 
 import argparse
 import os
-import glob
-import math
-import random
 import logging
+import sys
 
+import setupam.build
 import setupam.corpus
-import setupam.speaker
+import setupam.dedup
+import setupam.io
+import setupam.metrics
+import setupam.split
 
 
 def setup_log(log_level):
@@ -43,67 +45,192 @@ def get_parser():
         '-r', '--ratio', default=0.1, type=float,
         help="The ratio of speakers selected for the train and tests base. Default to 10%.")
     parser.add_argument('-l', '--log', default='INFO', help='Print the debug messages.')
+    parser.add_argument(
+        '-j', '--jobs', default=1, type=int,
+        help="The number of worker processes used for loading the speakers' content. Use 0 for one per CPU.")
+    parser.add_argument(
+        '--copy-workers', default=4, type=int,
+        help='The number of threads copying the audio files. Use 0 to copy them in the main thread.')
+    parser.add_argument(
+        '--copy-queue', default=0, type=int,
+        help='The maximum number of pending audio copies. Default to four per copy worker.')
+    parser.add_argument(
+        '--materialize', default='copy', choices=sorted(setupam.io.MATERIALIZERS),
+        help='How the audio files are placed in the corpus. Falls back to copying when a link fails.')
+    parser.add_argument(
+        '--output-format', default='files', choices=setupam.corpus.Corpus.OUTPUT_FORMATS,
+        help='Write one file per audio, or tar shards with each audio next to its transcription.')
+    parser.add_argument(
+        '--shard-size', default=1024, type=int, help='The approximate size of each tar shard, in MB.')
+    parser.add_argument(
+        '--normalize-audio', action='store_true',
+        help='Convert the audios to 16 kHz mono 16-bit PCM, except the ones already in that format. Requires NumPy.')
+    parser.add_argument(
+        '--audio-workers', default=0, type=int,
+        help='The number of processes converting the audios. Default to one per CPU.')
+    parser.add_argument(
+        '--dedup', default='off', choices=setupam.dedup.DEDUP_MODES,
+        help='Skip the audios with the same content of another one, or hard link them to it. Default to off.')
+    parser.add_argument(
+        '--encoding-cache', default=None,
+        help="The file caching the encodings detected for the text files. Default to the corpus' etc directory.")
+    parser.add_argument(
+        '--rebuild', action='store_true',
+        help='Ignore the manifest of a previous build and set up the whole corpus again.')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='Continue an interrupted build from its journal, keeping its IDs and the audios already placed.')
+    parser.add_argument(
+        '--split-by', default='speaker', choices=setupam.split.SPLIT_MODES,
+        help='Balance the train-test ratio by speaker count, utterance count or duration. Default to speaker.')
+    parser.add_argument('--seed', default=None, type=int, help='The seed of the random train-test split.')
+    parser.add_argument(
+        '--shard', default=None, type=setupam.split.parse_shard,
+        help='Build only the speakers of the shard i/N (0 <= i < N), chosen by a stable hash of their names, for '
+             'merging the partial corpora of several machines with setupam merge.')
+    parser.add_argument(
+        '--no-stats', dest='stats', action='store_false', help="Don't report the corpus statistics after the build.")
+    parser.add_argument(
+        '--metrics-out', default=None,
+        help='Write the time of each phase of the build, its counters and its throughput to this JSON file.')
+    parser.add_argument(
+        '--profile', action='store_true',
+        help="Dump the cProfile stats of the build (worker processes excluded) in the corpus' etc directory.")
     parser.add_argument('model', help='The name of your model to be set up.')
     return parser
 
 
-def load_spk_content(corpus, spk_path_list):
-    for spk_path in spk_path_list:
-        builder = setupam.speaker.SpeakerBuilder(spk_path, os.path.join(corpus.src, spk_path))
-        builder.set_audios()
-        builder.set_prompts()
-        corpus.add_speaker(builder.speaker)
+def get_stats_parser():
+    parser = argparse.ArgumentParser(
+        prog='setupam stats', description='Report the duration and format of the audios of a compiled corpus.')
+    parser.add_argument('-t', '--target', default='.', help='The directory where the corpus was set up.')
+    parser.add_argument('-j', '--jobs', default=8, type=int, help='The number of threads reading the audio headers.')
+    parser.add_argument(
+        '-o', '--output', default=None,
+        help="The JSON file of the report, or - for the standard output. Default to the corpus' etc directory.")
+    parser.add_argument('-l', '--log', default='INFO', help='Print the debug messages.')
+    parser.add_argument('model', help='The name of the corpus.')
+    return parser
+
+
+def get_watch_parser():
+    parser = argparse.ArgumentParser(
+        prog='setupam watch', description='Append the speakers arriving in the source directory to a compiled corpus.')
+    parser.add_argument('-s', '--source', default='.', help='The source directory watched for new speakers.')
+    parser.add_argument('-t', '--target', default='.', help='The directory where the corpus was set up.')
+    parser.add_argument(
+        '-i', '--interval', default=2., type=float, help='The seconds between the polls of the source directory.')
+    parser.add_argument(
+        '--split', default=setupam.corpus.Corpus.TRAIN_SUFFIX,
+        choices=(setupam.corpus.Corpus.TRAIN_SUFFIX, setupam.corpus.Corpus.TEST_SUFFIX),
+        help='The part of the corpus the new speakers are added to. Default to train.')
+    parser.add_argument(
+        '--copy-workers', default=4, type=int,
+        help='The number of threads copying the audio files. Use 0 to copy them in the main thread.')
+    parser.add_argument(
+        '--materialize', default='copy', choices=sorted(setupam.io.MATERIALIZERS),
+        help='How the audio files are placed in the corpus. Falls back to copying when a link fails.')
+    parser.add_argument(
+        '--once', action='store_true', help='Add the new speakers found right away, and stop.')
+    parser.add_argument('-l', '--log', default='INFO', help='Print the debug messages.')
+    parser.add_argument('model', help='The name of the corpus.')
+    return parser
 
 
-def build_corpus(log, ratio, source, model, target):
-    setup_log(log)
+def get_merge_parser():
+    parser = argparse.ArgumentParser(
+        prog='setupam merge', description='Merge the partial corpora of a sharded build into a single corpus.')
+    parser.add_argument('-t', '--target', default='.', help='The directory where the merged corpus is set up.')
+    parser.add_argument(
+        '--materialize', default='hardlink', choices=sorted(setupam.io.MATERIALIZERS),
+        help='How the audio files of the partial corpora are placed. Default to hardlink. Unlike the build, the '
+             'merge never falls back to copying: use copy when the partial corpora are on another filesystem.')
+    parser.add_argument(
+        '--copy-workers', default=4, type=int,
+        help='The number of threads placing the audio files. Use 0 to place them in the main thread.')
+    parser.add_argument('-l', '--log', default='INFO', help='Print the debug messages.')
+    parser.add_argument('model', help='The name of the corpus.')
+    parser.add_argument('parts', nargs='+', help='The target directories of the partial corpora, in order.')
+    return parser
 
-    logging.info('Checking source directory.')
-    if not os.path.isabs(source):
-        source = os.path.abspath(source)
-    if not os.path.exists(source):
-        raise ValueError("The source directory {} doesn't exists.".format(source))
-
-    logging.info('Scanning for speaker directories...')
-    cwd = os.getcwd()
-    os.chdir(source)  # Changing working directory to source
-    speakers_dir = [cur_path for cur_path in glob.glob('*') if os.path.isdir(cur_path)]
-    spk_count = len(speakers_dir)
-    os.chdir(cwd)  # Returning to working directory
-    logging.info("Found {} possible speaker's directories.".format(spk_count))
-
-    # Compute the percentage of the tests base
-    spk_count_test = math.floor(ratio * spk_count)
-    if not spk_count_test:
-        spk_count_test = 1
-    spk_count_train = spk_count - spk_count_test
-    logging.info(
-        'Selected {} for the train database, and {} for the tests database.'.format(spk_count_train, spk_count_test)
-    )
-    random.shuffle(speakers_dir)  # Choose speakers randomly
-
-    train_corpus = setupam.corpus.Corpus(model, target, src_path=source)
-    train_corpus.suffix = setupam.corpus.Corpus.TRAIN_SUFFIX
-    logging.info('Setting up the training corpus...')
-    train_corpus.set_up()
-
-    logging.info("Loading speakers' content...")
-    load_spk_content(train_corpus, speakers_dir[:spk_count_train])
-    logging.info('Building train corpus...')
-    train_corpus.compile_corpus()
-
-    test_corpus = setupam.corpus.Corpus(model, target, src_path=source)
-    test_corpus.suffix = setupam.corpus.Corpus.TEST_SUFFIX
-    logging.info('Setting up the test corpus...')
-    test_corpus.set_up()
-    logging.info("Loading speakers' content...")
-    load_spk_content(test_corpus, speakers_dir[-spk_count_test:])
-    logging.info('Building test corpus...')
-    test_corpus.compile_corpus()
 
+def build_corpus(log, ratio, source, model, target, jobs=1, copy_workers=4, copy_queue=0, materialize='copy',
+                 rebuild=False, encoding_cache=None, stats=True, split_by='speaker', seed=None, metrics_out=None,
+                 profile=False, output_format='files', shard_size=1024, normalize_audio=False, audio_workers=0,
+                 dedup='off', resume=False, shard=None):
+    setup_log(log)
+    metrics = setupam.metrics.Metrics()
+    profiler = None
+    if profile:
+        import cProfile  # Only loaded when profiling, to keep the startup fast
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        _, copy_errors = setupam.build.build_corpus(
+            ratio=ratio, source=source, model=model, target=target, jobs=jobs, copy_workers=copy_workers,
+            copy_queue=copy_queue, materialize=materialize, rebuild=rebuild, encoding_cache=encoding_cache, stats=stats,
+            split_by=split_by, seed=seed, output_format=output_format, shard_size=shard_size,
+            normalize_audio=normalize_audio, audio_workers=audio_workers, dedup=dedup, resume=resume, shard=shard,
+            metrics=metrics)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile_path = os.path.join(target, model, setupam.corpus.Corpus.METADATA_DIR, '{}.prof'.format(model))
+            if os.path.isdir(os.path.dirname(profile_path)):
+                profiler.dump_stats(profile_path)
+                logging.info('The profile of the build was written to {}.'.format(profile_path))
+        logging.info('Phases: {}.'.format(metrics.summary()))
+        if metrics_out:
+            metrics.store(metrics_out)
+    if copy_errors:
+        raise setupam.corpus.CopyError(copy_errors)
     logging.info('Done.')
 
 
-def main():
-    args = vars(get_parser().parse_args())
-    build_corpus(**args)
+def report_stats(log, target, model, jobs=8, output=None):
+    setup_log(log)
+    setupam.build.write_stats(model, target, jobs, output)
+
+
+def watch_corpus(log, source, target, model, interval=2., split='train', copy_workers=4, materialize='copy',
+                 once=False):
+    setup_log(log)
+    import setupam.watch  # Only the watch command needs it
+    watcher = setupam.watch.Watcher(source, model, target, split, copy_workers, materialize, settle=not once)
+    if once:
+        watcher.poll()
+        return
+    logging.info('Watching {} for new speakers every {}s.'.format(watcher.source, interval))
+    try:
+        watcher.run(interval)
+    except KeyboardInterrupt:
+        logging.info('Stopped watching.')
+
+
+def merge_corpus(log, target, model, parts, materialize='hardlink', copy_workers=4):
+    setup_log(log)
+    import setupam.merge  # Only the merge command needs it
+    errors = setupam.merge.merge_corpora(model, target, parts, materialize, copy_workers)
+    if errors:
+        raise setupam.corpus.CopyError(errors)
+
+
+COMMANDS = {
+    'stats': (get_stats_parser, report_stats),
+    'watch': (get_watch_parser, watch_corpus),
+    'merge': (get_merge_parser, merge_corpus),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        get_command_parser, command = COMMANDS[argv[0]]
+        args = vars(get_command_parser().parse_args(argv[1:]))
+    else:
+        command, args = build_corpus, vars(get_parser().parse_args(argv))
+    try:
+        command(**args)
+    except setupam.corpus.CopyError as e:
+        logging.error(e)
+        sys.exit(1)
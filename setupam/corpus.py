@@ -16,19 +16,55 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import errno
+import functools
+import logging
 import os
-import shutil
-import sys
+import threading
 
+import setupam.archive
+import setupam.audio
 import setupam.speaker
 import setupam.io
+import setupam.metrics
+import setupam.shards
 
 
-def id_generator():
-    i = 1
-    while True:
-        yield i
-        i += 1
+class IdAllocator(object):
+    """Hand out increasing IDs from start, up to stop when it's given. Safe to share between threads.
+
+    A build owns its allocators and gives them to its corpora. reserve takes a range of IDs up front, as an
+    allocator of its own, so the corpora can allocate concurrently and still get the IDs of a sequential build.
+    """
+
+    def __init__(self, start=1, stop=None):
+        self.start, self.stop = start, stop
+        self._next = start
+        self._lock = threading.Lock()
+
+    def __next__(self):
+        with self._lock:
+            if self.stop is not None and self._next >= self.stop:
+                raise ValueError('The IDs from {} to {} are exhausted.'.format(self.start, self.stop - 1))
+            value = self._next
+            self._next += 1
+        return value
+
+    def reserve(self, count):
+        with self._lock:
+            if self.stop is not None and self._next + count > self.stop:
+                raise ValueError('Not enough IDs left to reserve {}.'.format(count))
+            reserved = IdAllocator(self._next, self._next + count)
+            self._next += count
+        return reserved
+
+
+class CopyError(IOError):
+    """Raised after a build when some of the audio files could not be copied."""
+
+    def __init__(self, errors):
+        super(CopyError, self).__init__('{} audio file(s) could not be copied.'.format(len(errors)))
+        self.errors = errors
 
 
 class Corpus(object):
@@ -42,9 +78,15 @@ class Corpus(object):
 
     FILEID_EXT = 'fileids'
     TRANSCRIPT_EXT = 'transcription'
+    MANIFEST_EXT = 'manifest'
+    ENCODING_CACHE_EXT = 'encodings'
+    HEADER_CACHE_EXT = 'headers'
+    HASH_CACHE_EXT = 'hashes'
+    DUPLICATES_EXT = 'duplicates'
+    JOURNAL_EXT = 'journal'
+    STATS_EXT = 'stats.json'
 
-    SPEAKER_ID = id_generator()
-    AUDIO_ID = id_generator()
+    OUTPUT_FORMATS = ('files', 'shards')
 
     def __init__(self, name, trg_path, src_path=None):
         self.name = name
@@ -52,22 +94,51 @@ class Corpus(object):
         self.src = src_path
         # Initialization
         self.speakers = []
+        # The IdAllocator of the speakers and audios without a recorded ID
+        self.speaker_ids = IdAllocator()
+        self.audio_ids = IdAllocator()
         self.suffix = self.trans_file = self.fileid_file = None
+        self.copy_workers = 4
+        self.copy_queue_depth = None
+        self.copy_errors = []
+        self.materialize = 'copy'
+        self.manifest = None
+        # The directory of the audios extracted from archives, which are moved instead of copied
+        self.staging = None
+        # With 'shards', the audios and their transcriptions are written in tar shards of about shard_size bytes
+        self.output_format = 'files'
+        self.shard_size = 1 << 30
+        # Append the metadata to the fileids and transcription files of the corpus instead of replacing them
+        self.append = False
+        # Convert the audios to 16 kHz mono 16-bit PCM in a pool of convert_workers processes (0 for one per CPU)
+        self.convert_audio = False
+        self.convert_workers = 0
+        # Map the audios with the same content of another one to it; they're linked by link_duplicates
+        self.duplicates = {}
+        self.placed = {}
+        self.pending_links = []
+        # A setupam.journal.Journal of the IDs assigned and the audios placed, for resuming an interrupted build
+        self.journal = None
+        # The setupam.metrics.Metrics of the build
+        self.metrics = setupam.metrics.METRICS
 
     @property
     def corpus_path(self):
         return os.path.join(self.target_path, self.name)
 
     def set_up(self):
-        self.create_folder(Corpus.AUDIO_DIR)
+        if self.output_format == 'files':
+            self.create_folder(Corpus.AUDIO_DIR)
         self.create_folder(Corpus.METADATA_DIR)
         trans_filename = self.format_filename(self.suffix, Corpus.TRANSCRIPT_EXT)
         self.trans_file = setupam.io.TranscriptionWriter(
-            os.path.join(self.corpus_path, Corpus.METADATA_DIR, trans_filename)
+            os.path.join(self.corpus_path, Corpus.METADATA_DIR, trans_filename), streaming=not self.append,
+            append=self.append
         )
         fileid_filename = self.format_filename(self.suffix, Corpus.FILEID_EXT)
         self.fileid_file = setupam.io.FileidWriter(
-            os.path.join(self.corpus_path, Corpus.METADATA_DIR, fileid_filename)
+            os.path.join(self.corpus_path, Corpus.METADATA_DIR, fileid_filename), streaming=not self.append,
+            append=self.append
         )
 
     def create_folder(self, folder_path, absolute=False):
@@ -84,38 +155,192 @@ class Corpus(object):
     def format_audio_id(spk_repr, audio_id):
         return '{}_{:03}'.format(spk_repr, audio_id)
 
-    @staticmethod
-    def _copy_audio(original_path, new_path):
-        try:
-            shutil.copy2(original_path, new_path)  # Copy audio file to the new location
-        except IOError as e:
-            print('I/O error({0}): {1} {2}'.format(e.errno, e.strerror, e.filename))
-            sys.exit(1)
+    def _is_staged(self, audio_path):
+        return self.staging is not None and audio_path.startswith(os.path.join(self.staging, ''))
+
+    def _source_key(self, audio_path):
+        if self._is_staged(audio_path):
+            return os.path.relpath(audio_path, self.staging)
+        return os.path.relpath(audio_path, self.src) if self.src else audio_path
+
+    def _archive_key(self, speaker):
+        if speaker.archive is None:
+            return None
+        return os.path.relpath(speaker.archive, self.src) if self.src else speaker.archive
+
+    def _stage_audios(self, speaker):
+        # The audios of a speaker restored from its archive are only extracted when one of them is placed
+        if speaker.archive is not None and self.staging is not None:
+            setupam.archive.extract_audios(speaker, os.path.join(self.staging, speaker.name), self.metrics)
+        return True
+
+    def _copy_func(self, original_path):
+        if not self.convert_audio:
+            return self._copy_audio
+        return functools.partial(setupam.audio.normalize_file,
+                                 mode='move' if self._is_staged(original_path) else self.materialize)
+
+    def _count_conversion(self, result):
+        converted, size = result
+        self.metrics.count('audio_files')
+        self.metrics.count('audio_bytes', size)
+        if converted:
+            self.metrics.count('converted_audios')
+
+    def _open_pool(self):
+        if self.convert_audio:
+            return setupam.io.CopyPool(self.convert_workers or os.cpu_count() or 1, self.copy_queue_depth,
+                                       processes=True, on_done=self._count_conversion)
+        return setupam.io.CopyPool(self.copy_workers, self.copy_queue_depth)
+
+    def _copy_audio(self, original_path, new_path):
+        # Copy or link the audio file to the new location
+        with self.metrics.timer('audio_copy'):
+            if self._is_staged(original_path):
+                setupam.io.move_file(original_path, new_path)
+            else:
+                setupam.io.materialize_file(original_path, new_path, self.materialize)
+        self.metrics.count('audio_files')
+        self.metrics.count('audio_bytes', os.path.getsize(new_path))
 
     def format_filename(self, suffix, ext):
         return '{0}_{1}.{2}'.format(self.name, suffix, ext)
 
     def add_speaker(self, speaker):
         if isinstance(speaker, setupam.speaker.Speaker):
-            self.speakers.append((next(self.SPEAKER_ID), speaker))
+            spk_id = (self.manifest.speaker_id(speaker.name) if self.manifest else None) or next(self.speaker_ids)
+            self.speakers.append((spk_id, speaker))
+            if self.journal is not None:
+                files = self.manifest.scans.get(speaker.name, {}) if self.manifest else {}
+                self.journal.speaker(speaker.name, spk_id, self.suffix, files)
         else:
             raise ValueError('Invalid speaker object. Given {}.'.format(speaker))
 
+    def new_audio_count(self):
+        """The number of audios of the corpus that will be given a new ID when it's compiled."""
+        count = 0
+        for _, spk in self.speakers:
+            recorded = self.manifest.utterances(spk.name) if self.manifest else {}
+            count += sum(1 for audio in spk.audios
+                         if audio.name in spk.prompts and self._source_key(audio.path) not in recorded)
+        return count
+
     def _store_files(self):
-        self.trans_file.store()
-        self.fileid_file.store()
+        with self.metrics.timer('metadata_store'):
+            self.trans_file.store()
+            self.fileid_file.store()
+
+    def _drop_failed(self, copy_errors):
+        """Drop the metadata of the audios that couldn't be placed, so no fileid is left without its audio.
+
+        They stay in the manifest, so the next build places them again under the same IDs.
+        """
+        failed = {os.path.splitext(os.path.basename(dst))[0] for _, dst, _ in copy_errors}
+        self.fileid_file.filter(lambda line: line.rsplit('/', 1)[-1] not in failed)
+        self.trans_file.filter(lambda line: line.rsplit('(', 1)[-1].rstrip(')') not in failed)
+
+    def _journal_utterance(self, spk_name, audio_id, source, audio_ext, prompt):
+        """Journal the ID assigned to the audio, returning the callback that journals its placement."""
+        if self.journal is None:
+            return lambda *_: None
+        self.journal.assigned(spk_name, audio_id, source, audio_ext, prompt)
+        return lambda *_: self.journal.placed(spk_name, source)
+
+    def _open_shards(self):
+        index_filename = self.format_filename(self.suffix, setupam.shards.INDEX_EXT)
+        return setupam.shards.ShardWriter(
+            self.create_folder(setupam.shards.SHARD_DIR), '{}_{}'.format(self.name, self.suffix),
+            os.path.join(self.corpus_path, Corpus.METADATA_DIR, index_filename), self.shard_size,
+            metrics=self.metrics)
 
     def compile_corpus(self):
-        for spk_id, spk in self.speakers:
-            spk_repr = self.format_speaker_id(spk_id)
-            spk_dir_path = self.create_folder(os.path.join(Corpus.AUDIO_DIR, spk_repr))
-            for audio_name, audio_ext, audio_old_path in spk.audios:
-                if audio_name in spk.prompts:  # Has transcription?
-                    audio_repr = self.format_audio_id(spk_repr, next(self.AUDIO_ID))
-                    audio_new_path = os.path.join(spk_dir_path, '{}.{}'.format(audio_repr, audio_ext))
-                    self._copy_audio(audio_old_path, audio_new_path)
-                    # Include transcription
-                    self.trans_file.add_content(spk.prompts[audio_name], audio_repr)
-                    # Include file_id
-                    self.fileid_file.add_content(spk_repr, audio_repr)
+        """Copy the audios and write the metadata files of the corpus.
+
+        The audios are copied by a pool of copy_workers threads while the metadata is generated. Copy failures
+        don't stop the compilation; they are logged at the end and returned. With a manifest, the utterances
+        recorded in it keep their IDs, and the unchanged ones aren't copied again. With the 'shards' output format,
+        every audio is written again into the shards, in the order of the fileids. With convert_audio, the audios
+        are converted by a pool of processes, except the ones already in the target format.
+        """
+        metrics = self.metrics
+        progress = setupam.metrics.Progress('Compiling the {} corpus'.format(self.suffix), len(self.speakers),
+                                            'speakers')
+        shards = self._open_shards() if self.output_format == 'shards' else None
+        with self._open_pool() as pool:
+            for spk_id, spk in self.speakers:
+                spk_repr = self.format_speaker_id(spk_id)
+                if shards is None:
+                    spk_dir_path = self.create_folder(os.path.join(Corpus.AUDIO_DIR, spk_repr))
+                recorded = self.manifest.utterances(spk.name) if self.manifest else {}
+                utterances = []
+                staged = False
+                for audio_name, audio_ext, audio_old_path in spk.audios:
+                    if audio_name in spk.prompts:  # Has transcription?
+                        source = self._source_key(audio_old_path)
+                        audio_id, unchanged = recorded.get(source, (None, False))
+                        audio_id = audio_id or next(self.audio_ids)
+                        audio_repr = self.format_audio_id(spk_repr, audio_id)
+                        placed = self._journal_utterance(spk.name, audio_id, source, audio_ext, spk.prompts[audio_name])
+                        if shards is not None:
+                            staged = staged or self._stage_audios(spk)
+                            shards.add(audio_old_path, '{}/{}.{}'.format(spk_repr, audio_repr, audio_ext),
+                                       audio_repr, spk.prompts[audio_name])
+                        else:
+                            audio_new_path = os.path.join(spk_dir_path, '{}.{}'.format(audio_repr, audio_ext))
+                            self.placed[audio_old_path] = audio_new_path
+                            if audio_old_path in self.duplicates:
+                                self.pending_links.append((audio_new_path, self.duplicates[audio_old_path]))
+                            elif not (unchanged and os.path.exists(audio_new_path)):
+                                staged = staged or self._stage_audios(spk)
+                                pool.submit(self._copy_func(audio_old_path), audio_old_path, audio_new_path, placed)
+                            else:
+                                metrics.count('unchanged_utterances')
+                                placed()
+                        # Include transcription
+                        self.trans_file.add_content(spk.prompts[audio_name], audio_repr)
+                        # Include file_id
+                        self.fileid_file.add_content(spk_repr, audio_repr)
+                        utterances.append((audio_id, source, audio_ext, spk.prompts[audio_name]))
+                    else:
+                        metrics.count('untranscribed_utterances')
+                metrics.count('utterances', len(utterances))
+                if self.manifest is not None:
+                    self.manifest.record(spk.name, spk_id, self.suffix, utterances, self._archive_key(spk))
+                progress.update()
+        self.copy_errors = pool.errors
+        if shards is not None:
+            shards.close()
+            self.copy_errors = shards.errors
+        if self.copy_errors:
+            self._drop_failed(self.copy_errors)
         self._store_files()
+        for src, dst, e in self.copy_errors:
+            logging.error('I/O error({0}): {1} {2} -> {3}'.format(e.errno, e.strerror, src, dst))
+        return self.copy_errors
+
+
+def link_duplicates(corpora):
+    """Hard link the duplicate audios of the compiled corpora to the audio placed for their original.
+
+    The links are made once every corpus is compiled, since the original may be in another one. The failures are
+    returned as the copy failures are, and added to the copy_errors of their corpus.
+    """
+    placed = {}
+    for corpus in corpora:
+        placed.update(corpus.placed)
+    errors = []
+    for corpus in corpora:
+        failed = []
+        for audio_path, original in corpus.pending_links:
+            try:
+                if original not in placed:
+                    raise FileNotFoundError(errno.ENOENT, 'The original audio was not placed', original)
+                setupam.io.materialize_file(placed[original], audio_path, 'hardlink')
+                corpus.metrics.count('linked_duplicates')
+            except OSError as e:
+                failed.append((original, audio_path, e))
+        corpus.copy_errors = corpus.copy_errors + failed
+        errors += failed
+    for src, dst, e in errors:
+        logging.error('I/O error({0}): {1} {2} -> {3}'.format(e.errno, e.strerror, src, dst))
+    return errors
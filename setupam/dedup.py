@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import collections
+import concurrent.futures
+import hashlib
+import mmap
+import os
+
+import setupam.metrics
+
+DEDUP_MODES = ('off', 'skip', 'link')
+
+
+def file_hash(file_path):
+    """The BLAKE2b digest of the file, read through a memory map."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, mode='rb') as f:
+        if os.fstat(f.fileno()).st_size:  # Empty files can't be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                digest.update(content)
+    return digest.hexdigest()
+
+
+def find_duplicates(file_paths, workers=8, cache=None, metrics=setupam.metrics.METRICS):
+    """Map every file with the same content of an earlier file of file_paths to that earlier file.
+
+    Only the files with the same size as another one are hashed. The hashes are kept in cache, a
+    setupam.cache.StatCache, when it's given, and counted in metrics. The files that can't be read are left out.
+    """
+    stats, by_size = {}, collections.defaultdict(list)
+    for file_path in file_paths:
+        if file_path in stats:
+            continue
+        try:
+            stats[file_path] = os.stat(file_path)
+        except OSError:
+            continue
+        by_size[stats[file_path].st_size].append(file_path)
+    candidates = [file_path for paths in by_size.values() if len(paths) > 1 for file_path in paths]
+
+    def digest(file_path):
+        cached = cache.get(file_path, stats[file_path]) if cache is not None else None
+        if cached is not None:
+            return cached
+        try:
+            value = file_hash(file_path)
+        except OSError:
+            return None
+        metrics.count('hashed_files')
+        metrics.count('hashed_bytes', stats[file_path].st_size)
+        if cache is not None:
+            cache.set(file_path, value, stats[file_path])
+        return value
+
+    if workers > 1 and len(candidates) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = list(executor.map(digest, candidates))
+    else:
+        digests = [digest(file_path) for file_path in candidates]
+    originals, duplicates = {}, {}
+    # The candidates keep the order of file_paths within each size, so the first file of each content is kept
+    for file_path, value in zip(candidates, digests):
+        if value is None:
+            continue
+        key = (stats[file_path].st_size, value)
+        if key in originals:
+            duplicates[file_path] = originals[key]
+        else:
+            originals[key] = file_path
+    return duplicates
@@ -16,44 +16,293 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import concurrent.futures
+import errno
+import functools
 import glob
+import logging
+import os
 import re
 import io
 import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+# The FICLONE ioctl request from linux/fs.h, for sharing the extents of a file on copy-on-write filesystems.
+FICLONE = 0x40049409
 
 
 def track_files(file_path, file_format):
     return glob.glob('{}/*.{}'.format(file_path, file_format))
 
 
-def transcription_formatter(*args):
-    return '<s> {0} </s> ({1})'.format(re.sub('\S*[,.?!]+\S*', ' ', args[0]), *args[1:])
+def read_file(file_path):
+    with open(file_path, mode='rb') as f:
+        return f.read()
+
+
+def read_files(file_paths, workers=8, min_files=16):
+    """Read the content of many small files, with a pool of threads when there are at least min_files."""
+    if workers > 1 and len(file_paths) >= min_files:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(read_file, file_paths))
+    return [read_file(file_path) for file_path in file_paths]
+
+
+def reflink_file(src, dst):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported on this platform', dst)
+    with open(src, mode='rb') as src_file, open(dst, mode='wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+def symlink_file(src, dst):
+    os.symlink(os.path.abspath(src), dst)
+
+
+MATERIALIZERS = {
+    'copy': shutil.copy2,
+    'hardlink': os.link,
+    'symlink': symlink_file,
+    'reflink': reflink_file,
+}
+
+
+def materialize_file(src, dst, mode='copy', fallback=True):
+    """Place src at dst by copying or linking it, falling back to a copy when the link can't be made.
+
+    Without fallback, the error of the link is raised instead.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode != 'copy':
+        try:
+            MATERIALIZERS[mode](src, dst)
+            return
+        except OSError as e:
+            if not fallback:
+                raise
+            logging.debug('Could not {} {}, copying it instead: {}'.format(mode, src, e))
+            if os.path.lexists(dst):
+                os.remove(dst)
+    shutil.copy2(src, dst)
+
+
+def move_file(src, dst):
+    """Move src to dst, with a rename when both are on the same filesystem."""
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        logging.debug('Could not rename {}, moving it instead: {}'.format(src, e))
+        shutil.move(src, dst)
+
+
+class TranscriptNormalizer(object):
+    """Normalize the prompts written to the transcription file.
+
+    The prompt is lowercased and then each of the precompiled (regex, replacement) rules is applied in order. The
+    default rule drops the words with punctuation. With a cache_size, the results of the last distinct prompts are
+    cached, since the same prompt texts are read by many speakers.
+    """
+
+    RULES = (
+        (re.compile(r'\S*[,.?!]+\S*'), ' '),
+    )
+
+    def __init__(self, rules=RULES, lower=True, cache_size=8192):
+        self.rules = tuple((re.compile(pattern), repl) for pattern, repl in rules)
+        self.lower = lower
+        if cache_size:
+            self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+        else:
+            self.normalize = self._normalize
+
+    def _normalize(self, prompt):
+        if self.lower:
+            prompt = prompt.lower()
+        for regex, repl in self.rules:
+            prompt = regex.sub(repl, prompt)
+        return prompt
+
+    def normalize_batch(self, prompts):
+        normalize = self.normalize
+        return [normalize(prompt) for prompt in prompts]
+
+
+DEFAULT_NORMALIZER = TranscriptNormalizer()
+
+
+def transcription_formatter(*args, normalizer=DEFAULT_NORMALIZER):
+    return '<s> {0} </s> ({1})'.format(normalizer.normalize(args[0]), *args[1:])
 
 
 class FileWriter(object):
-    def __init__(self, file_path, format_func='{0}'.format):
+    """Write the formatted lines of a metadata file.
+
+    By default the content is kept in memory until store. In streaming mode, the lines are written through a
+    buffered handle to a temporary file next to the target, flushed every flush_every lines, and store renames it
+    over the target atomically; the memory used doesn't depend on the number of lines. With append, the content is
+    kept in memory and store appends it to the target instead of replacing it.
+    """
+
+    def __init__(self, file_path, format_func='{0}'.format, streaming=False, buffer_size=1 << 20, flush_every=10000,
+                 append=False):
+        if streaming and append:
+            raise ValueError('A streaming FileWriter replaces its file, so it can not append to it.')
         self.file = file_path
         self.format_line = format_func
-        self.content = io.StringIO()
+        self.streaming = streaming
+        self.append = append
+        self.flush_every = flush_every
+        self._lines = 0
+        if streaming:
+            self.tmp_file = '{}.tmp'.format(file_path)
+            self.content = open(self.tmp_file, mode='w', encoding='utf-8', buffering=buffer_size)
+        else:
+            self.content = io.StringIO()
 
     def add_content(self, *args):
         formatted_content = self.format_line(*args)
         self.content.write(formatted_content + '\n')
+        if self.streaming:
+            self._lines += 1
+            if self._lines % self.flush_every == 0:
+                self.content.flush()
 
     def store(self):
-        with open(self.file, mode='w', encoding='utf-8') as file:
-            self.content.seek(0)
-            shutil.copyfileobj(self.content, file)
+        if self.streaming:
+            self.content.flush()
+            os.fsync(self.content.fileno())
+            self.content.close()
+            os.replace(self.tmp_file, self.file)
+        else:
+            with open(self.file, mode='a' if self.append else 'w', encoding='utf-8') as file:
+                self.content.seek(0)
+                shutil.copyfileobj(self.content, file)
+                if self.append:
+                    file.flush()
+                    os.fsync(file.fileno())
+            self.content.close()
+
+    def filter(self, keep):
+        """Drop the lines written so far for which keep is false."""
+        if not self.streaming:
+            lines = self.content.getvalue().splitlines(True)
+            self.content = io.StringIO()
+            self.content.writelines(line for line in lines if keep(line.rstrip('\n')))
+            return
+        self.content.close()
+        filtered_file = '{}.filtered'.format(self.tmp_file)
+        with open(self.tmp_file, mode='r', encoding='utf-8') as src, \
+                open(filtered_file, mode='w', encoding='utf-8') as dst:
+            dst.writelines(line for line in src if keep(line.rstrip('\n')))
+        os.replace(filtered_file, self.tmp_file)
+        self.content = open(self.tmp_file, mode='a', encoding='utf-8')
+
+    def discard(self):
         self.content.close()
+        if self.streaming and os.path.exists(self.tmp_file):
+            os.remove(self.tmp_file)
 
 
 class TranscriptionWriter(FileWriter):
 
-    def __init__(self, target_file):
-        super(TranscriptionWriter, self).__init__(target_file, transcription_formatter)
+    def __init__(self, target_file, normalizer=DEFAULT_NORMALIZER, **kwargs):
+        super(TranscriptionWriter, self).__init__(
+            target_file, functools.partial(transcription_formatter, normalizer=normalizer), **kwargs)
 
 
 class FileidWriter(FileWriter):
 
-    def __init__(self, target_file):
-        super(FileidWriter, self).__init__(target_file, '{0}/{1}'.format)
+    def __init__(self, target_file, **kwargs):
+        super(FileidWriter, self).__init__(target_file, '{0}/{1}'.format, **kwargs)
+
+
+class CopyPool(object):
+    """Run file copies in a bounded pool of threads, collecting the failures instead of raising them.
+
+    At most queue_depth copies are pending at any time, so the producer blocks instead of queueing the whole
+    corpus. With no workers, the copies run in the calling thread. With processes, the copies run in a pool of
+    processes instead, for the CPU bound ones; the copy functions must then be picklable. The value returned by
+    each copy is given to on_done, in the calling process.
+    """
+
+    def __init__(self, workers=4, queue_depth=None, processes=False, on_done=None):
+        self.workers = workers
+        self.queue_depth = queue_depth or max(1, workers) * 4
+        self.errors = []
+        self.on_done = on_done
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+        if workers <= 0:
+            self._executor = None
+        elif processes:
+            self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.join()
+
+    def submit(self, copy_func, src, dst, done=None):
+        """Copy src to dst with copy_func, calling done with its result once the copy succeeds."""
+        if self._executor is None:
+            self._copy(copy_func, src, dst, done)
+        elif isinstance(self._executor, concurrent.futures.ProcessPoolExecutor):
+            self._slots.acquire()
+            future = self._executor.submit(copy_func, src, dst)
+            future.add_done_callback(functools.partial(self._collect, src, dst, done))
+        else:
+            self._slots.acquire()
+            self._executor.submit(self._release_after, copy_func, src, dst, done)
+
+    def _release_after(self, copy_func, src, dst, done):
+        try:
+            self._copy(copy_func, src, dst, done)
+        finally:
+            self._slots.release()
+
+    def _copy(self, copy_func, src, dst, done):
+        try:
+            result = copy_func(src, dst)
+        except Exception as e:
+            self._failed(src, dst, e)
+        else:
+            self._succeeded(result, done)
+
+    def _collect(self, src, dst, done, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self._failed(src, dst, e)
+        else:
+            self._succeeded(result, done)
+        finally:
+            self._slots.release()
+
+    def _failed(self, src, dst, e):
+        # Any failure of a copy is reported as an I/O error, instead of being lost in the worker
+        error = e if isinstance(e, OSError) else OSError(errno.EIO, '{}: {}'.format(type(e).__name__, e))
+        with self._lock:
+            self.errors.append((src, dst, error))
+
+    def _succeeded(self, result, done):
+        if self.on_done is not None:
+            self.on_done(result)
+        if done is not None:
+            done(result)
+
+    def join(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        return self.errors
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import collections
+import json
+import logging
+import os
+import threading
+
+# The kinds of entries: a speaker with its ID and part, an audio ID assigned, an audio placed in the corpus, and
+# the range of audio IDs reserved by a part
+SPEAKER = 's'
+ASSIGNED = 'a'
+PLACED = 'p'
+RESERVED = 'r'
+
+
+class Journal(object):
+    """An append-only log of the IDs assigned and the audios placed by a build, one JSON array per line.
+
+    Every entry is flushed as it's written, so it survives the build process, and the file is synced every
+    sync_every entries. A build that completes removes its journal with commit; one that is interrupted leaves it
+    behind for replay to fold into the manifest of the next build.
+    """
+
+    def __init__(self, file_path, sync_every=1000):
+        self.file = file_path
+        self.sync_every = sync_every
+        self._handle = None
+        self._entries = 0
+        self._lock = threading.Lock()
+
+    def open(self, append=False):
+        self._handle = open(self.file, mode='a' if append else 'w', encoding='utf-8')
+        return self
+
+    def _append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._handle.write(line)
+            self._handle.flush()
+            self._entries += 1
+            if self._entries % self.sync_every == 0:
+                os.fsync(self._handle.fileno())
+
+    def speaker(self, spk_name, spk_id, split, files):
+        self._append([SPEAKER, spk_name, spk_id, split, files])
+
+    def assigned(self, spk_name, audio_id, source, audio_ext, prompt):
+        self._append([ASSIGNED, spk_name, audio_id, source, audio_ext, prompt])
+
+    def placed(self, spk_name, source):
+        self._append([PLACED, spk_name, source])
+
+    def reserved(self, split, start, stop):
+        self._append([RESERVED, split, start, stop])
+
+    def close(self, commit=False):
+        if self._handle is not None:
+            self._handle.flush()
+            os.fsync(self._handle.fileno())
+            self._handle.close()
+            self._handle = None
+        if commit and os.path.exists(self.file):
+            os.remove(self.file)
+
+
+def read_entries(file_path):
+    """Read the entries of a journal, up to the first one that was cut by the interruption."""
+    entries = []
+    try:
+        with open(file_path, mode='r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logging.warning('Ignoring the journal of {} after an incomplete entry.'.format(file_path))
+                    break
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def replay(file_path, manifest, spk_names):
+    """Fold the entries of an interrupted build into the manifest, for the speakers still in spk_names.
+
+    Returns the number of audios the interrupted build had placed.
+    """
+    spk_names = set(spk_names)
+    speakers = collections.OrderedDict()
+    for entry in read_entries(file_path):
+        kind, spk_name = entry[0], entry[1]
+        if kind == RESERVED or spk_name not in spk_names:
+            continue
+        if kind == SPEAKER:
+            _, _, spk_id, split, files = entry
+            speakers[spk_name] = {'id': spk_id, 'split': split, 'files': files,
+                                  'utterances': collections.OrderedDict(), 'placed': set()}
+        elif spk_name in speakers and kind == ASSIGNED:
+            speakers[spk_name]['utterances'][entry[3]] = entry[2:]
+        elif spk_name in speakers and kind == PLACED:
+            speakers[spk_name]['placed'].add(entry[2])
+    for spk_name, entry in speakers.items():
+        manifest.resume_speaker(spk_name, entry['id'], entry['split'], entry['files'],
+                                list(entry['utterances'].values()), entry['placed'])
+    return sum(len(entry['placed']) for entry in speakers.values())
+
+
+def reservations(file_path):
+    """Map each part to the last range of audio IDs, a pair (start, stop), the interrupted build reserved for it."""
+    return {entry[1]: (entry[2], entry[3]) for entry in read_entries(file_path) if entry[0] == RESERVED}
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import collections
+import json
+import logging
+import os
+
+import setupam.source
+import setupam.speaker
+
+
+class Manifest(object):
+    """Record the source files of a compiled corpus and the IDs assigned to them.
+
+    On a rebuild, the size and modification time of every file of a speaker are compared with the source tree,
+    so only the new or changed speakers are loaded again and the IDs already assigned are kept. The highest IDs
+    ever assigned are kept too, so the IDs of the speakers removed from the source tree aren't given out again.
+    """
+
+    VERSION = 1
+
+    def __init__(self, file_path):
+        self.file = file_path
+        self.speakers = {}
+        self.scans = {}
+        # The highest speaker and audio IDs assigned, including the ones of the speakers pruned since
+        self.last_ids = (0, 0)
+        # The [rate, channels, bits] the audios were converted to, or None when they were placed as they are
+        self.audio_format = None
+        self._replace_audios = False
+
+    @classmethod
+    def load(cls, file_path):
+        manifest = cls(file_path)
+        try:
+            with open(file_path, mode='r', encoding='utf-8') as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return manifest
+        except ValueError:
+            logging.warning('Ignoring the invalid manifest {}.'.format(file_path))
+            return manifest
+        if content.get('version') == cls.VERSION:
+            manifest.speakers = content['speakers']
+            manifest.last_ids = tuple(content.get('last_ids', (0, 0)))
+            manifest.audio_format = content.get('audio_format')
+        return manifest
+
+    def store(self):
+        tmp_path = self.file + '.tmp'
+        with open(tmp_path, mode='w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'last_ids': list(self.max_ids()), 'audio_format': self.audio_format,
+                       'speakers': self.speakers}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.file)
+
+    def scan(self, src_path, spk_name, index=None):
+        """Stat every file of the speaker's directory, keyed by its path relative to src_path.
+
+        The stats are taken from index, a setupam.source.SpeakerIndex of the speaker, when it's given.
+        """
+        index = index or setupam.source.SpeakerIndex.scan(os.path.join(src_path, spk_name))
+        files = self.scans[spk_name] = index.files(src_path)
+        return files
+
+    def set_audio_format(self, audio_format):
+        """Set the format the audios are converted to, or None, returning whether it changed since the last build.
+
+        When it changed, every recorded audio is placed again, so the corpus doesn't mix the two formats.
+        """
+        audio_format = list(audio_format) if audio_format is not None else None
+        changed = bool(self.speakers) and audio_format != self.audio_format
+        self._replace_audios = self._replace_audios or changed
+        self.audio_format = audio_format
+        return changed
+
+    def is_unchanged(self, spk_name):
+        entry = self.speakers.get(spk_name)
+        return bool(entry) and entry.get('complete', True) and entry['files'] == self.scans.get(spk_name)
+
+    def speaker_id(self, spk_name):
+        entry = self.speakers.get(spk_name)
+        return entry['id'] if entry else None
+
+    def split(self, spk_name):
+        entry = self.speakers.get(spk_name)
+        return entry['split'] if entry else None
+
+    def max_ids(self):
+        spk_ids = [entry['id'] for entry in self.speakers.values()]
+        audio_ids = [utt[0] for entry in self.speakers.values() for utt in entry['utterances']]
+        return max(spk_ids + [self.last_ids[0]]), max(audio_ids + [self.last_ids[1]])
+
+    def utterances(self, spk_name):
+        """Map the recorded sources of the speaker to their audio ID and whether the source is unchanged."""
+        entry = self.speakers.get(spk_name)
+        if not entry:
+            return {}
+        old_files, new_files = entry['files'], self.scans.get(spk_name, {})
+        # The audios of an archive aren't scanned one by one, but are unchanged while the archive is
+        unchanged = self.is_unchanged(spk_name)
+        pending = set(entry.get('pending', ()))
+        return {
+            source: (audio_id, not self._replace_audios and source not in pending and (
+                unchanged or (source in new_files and old_files.get(source) == new_files[source])))
+            for audio_id, source, _, _ in entry['utterances']
+        }
+
+    def restore_speaker(self, src_path, spk_name, staging_path=None):
+        """Rebuild an unchanged speaker from its recorded utterances, without reading the source files.
+
+        The audios of a speaker read from an archive are restored at their place under staging_path, but aren't
+        extracted: setupam.archive.extract_audios stages them when their content is needed.
+        """
+        entry = self.speakers[spk_name]
+        speaker = setupam.speaker.Speaker(spk_name)
+        speaker.audios = setupam.speaker.Audios()
+        speaker.prompts = setupam.speaker.Prompts()
+        root = src_path
+        if entry.get('archive'):
+            if staging_path is None:
+                raise ValueError('A staging directory is needed for restoring the speaker {}.'.format(spk_name))
+            speaker.archive, root = os.path.join(src_path, entry['archive']), staging_path
+        for _, source, audio_ext, prompt in entry['utterances']:
+            audio = setupam.speaker.Audio.from_path(os.path.join(root, source))
+            speaker.audios.append(audio)
+            speaker.prompts[audio.name] = prompt
+        return speaker
+
+    def record(self, spk_name, spk_id, split, utterances, archive=None):
+        """Record the utterances compiled for the speaker, with the path of its archive when it was read from one.
+
+        The sources of the audios of an archive are relative to the staging directory they were extracted to.
+        """
+        self.speakers[spk_name] = {
+            'id': spk_id,
+            'split': split,
+            'files': self.scans.get(spk_name, {}),
+            'utterances': [list(utterance) for utterance in utterances],
+        }
+        if archive is not None:
+            self.speakers[spk_name]['archive'] = archive
+
+    def resume_speaker(self, spk_name, spk_id, split, files, utterances, placed):
+        """Record a speaker of an interrupted build with the IDs it assigned, merged with the recorded ones.
+
+        The speaker is loaded again, like a changed one. Its audios are placed again, except the ones the
+        interrupted build placed and the ones it left unchanged.
+        """
+        old_entry = self.speakers.get(spk_name)
+        merged, pending = collections.OrderedDict(), set()
+        if old_entry:
+            for utterance in old_entry['utterances']:
+                source = utterance[1]
+                merged[source] = list(utterance)
+                if source not in placed and old_entry['files'].get(source) != files.get(source):
+                    pending.add(source)
+        for utterance in utterances:
+            merged[utterance[1]] = list(utterance)
+            if utterance[1] not in placed:
+                pending.add(utterance[1])
+        self.speakers[spk_name] = {
+            'id': spk_id,
+            'split': split,
+            'files': files,
+            'utterances': list(merged.values()),
+            'complete': False,
+            'pending': sorted(pending),
+        }
+
+    def prune(self, spk_names):
+        """Forget the speakers that are no longer in the source tree and return their IDs, by name.
+
+        Their IDs still count for max_ids, so they aren't given to new speakers.
+        """
+        self.last_ids = self.max_ids()
+        dropped = set(self.speakers) - set(spk_names)
+        return {spk_name: self.speakers.pop(spk_name)['id'] for spk_name in sorted(dropped)}
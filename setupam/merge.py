@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import functools
+import logging
+import os
+import re
+
+import setupam.corpus
+import setupam.io
+import setupam.manifest
+
+TRANSCRIPTION_ID = re.compile(r'^(.*) \((\S+)\)$')
+# The modes of setupam.io.materialize_file that can only place a file on its own filesystem
+SAME_FILESYSTEM_MODES = ('hardlink', 'reflink')
+
+
+def _read_lines(file_path):
+    try:
+        with open(file_path, mode='r', encoding='utf-8') as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def _same_filesystem(path, other_path):
+    return os.stat(path).st_dev == os.stat(other_path).st_dev
+
+
+class PartialCorpus(object):
+    """A corpus compiled by one shard of a build, with its metadata files and manifest."""
+
+    def __init__(self, model, target):
+        Corpus = setupam.corpus.Corpus
+        self.target = target
+        self.corpus_path = os.path.join(target, model)
+        self.metadata_path = os.path.join(self.corpus_path, Corpus.METADATA_DIR)
+        self.model = model
+        if not os.path.isdir(os.path.join(self.corpus_path, Corpus.AUDIO_DIR)):
+            raise ValueError('There is no corpus {} with audio files in {}.'.format(model, target))
+        self.manifest = setupam.manifest.Manifest.load(
+            os.path.join(self.metadata_path, '{}.{}'.format(model, Corpus.MANIFEST_EXT)))
+        # The extension of the audio of each ID, for finding it in the audio directory
+        self.audio_exts = {
+            utterance[0]: utterance[2] for entry in self.manifest.speakers.values() for utterance in entry['utterances']
+        }
+
+    def utterances(self, split):
+        """Yield the speaker ID, audio ID and transcription line of each utterance of the split part, in order."""
+        Corpus = setupam.corpus.Corpus
+        fileids = _read_lines(os.path.join(self.metadata_path, '{}_{}.{}'.format(self.model, split, Corpus.FILEID_EXT)))
+        transcriptions = _read_lines(
+            os.path.join(self.metadata_path, '{}_{}.{}'.format(self.model, split, Corpus.TRANSCRIPT_EXT)))
+        if len(fileids) != len(transcriptions):
+            raise ValueError('The {} fileids and transcription files of {} have different lengths.'.format(
+                split, self.corpus_path))
+        for fileid, transcription in zip(fileids, transcriptions):
+            spk_repr, audio_repr = fileid.split('/')
+            match = TRANSCRIPTION_ID.match(transcription)
+            if match is None or match.group(2) != audio_repr:
+                raise ValueError('The transcription of {} in {} is out of order.'.format(fileid, self.corpus_path))
+            yield int(spk_repr), int(audio_repr.rsplit('_', 1)[1]), match.group(1)
+
+    def audio_path(self, spk_id, audio_id):
+        Corpus = setupam.corpus.Corpus
+        spk_repr = Corpus.format_speaker_id(spk_id)
+        return os.path.join(self.corpus_path, Corpus.AUDIO_DIR, spk_repr, '{}.{}'.format(
+            Corpus.format_audio_id(spk_repr, audio_id), self.audio_exts.get(audio_id, 'wav')))
+
+
+def merge_corpora(model, target, part_targets, materialize='hardlink', workers=4):
+    """Merge the partial corpora of a sharded build, set up in part_targets, into a corpus in target.
+
+    The fileids and transcription files of the parts are concatenated, the train parts first, and the speaker and
+    audio IDs are numbered again in that order. The audios aren't copied: they're placed under their new IDs with
+    setupam.io.materialize_file in the materialize mode, a link by default. A link that can't be made isn't replaced
+    by a copy, and the hard links and reflinks are checked up front, raising a ValueError when a part is on another
+    filesystem than target; only the 'copy' mode copies the audios. The manifests of the parts are merged
+    too, so the corpus can be built incrementally afterwards. The failures to place an audio are returned. Since the
+    split of a sharded build is only about the ratio, a warning is logged when the merged test part is empty.
+    """
+    Corpus = setupam.corpus.Corpus
+    if any(os.path.abspath(part_target) == os.path.abspath(target) for part_target in part_targets):
+        raise ValueError('The merged corpus must be set up apart from the partial ones.')
+    parts = [PartialCorpus(model, part_target) for part_target in part_targets]
+    owners = {}
+    for part in parts:
+        for spk_name in part.manifest.speakers:
+            if spk_name in owners:
+                raise ValueError('The speaker {} is in both {} and {}.'.format(
+                    spk_name, owners[spk_name].corpus_path, part.corpus_path))
+            owners[spk_name] = part
+    corpus = Corpus(model, target)
+    audio_root = corpus.create_folder(Corpus.AUDIO_DIR)
+    if materialize in SAME_FILESYSTEM_MODES:
+        for part in parts:
+            if not _same_filesystem(part.corpus_path, audio_root):
+                raise ValueError('The partial corpus {} is on another filesystem than {}, so its audios can\'t be '
+                                 'placed with a {}. Copy them with the copy mode instead.'.format(
+                                     part.corpus_path, target, materialize))
+    metadata_path = corpus.create_folder(Corpus.METADATA_DIR)
+    speaker_ids, audio_ids = setupam.corpus.IdAllocator(), setupam.corpus.IdAllocator()
+    # Map the IDs of each part to the new ones
+    spk_maps, audio_maps = [{} for _ in parts], [{} for _ in parts]
+    counts = dict.fromkeys((Corpus.TRAIN_SUFFIX, Corpus.TEST_SUFFIX), 0)
+    with setupam.io.CopyPool(workers) as pool:
+        for split in (Corpus.TRAIN_SUFFIX, Corpus.TEST_SUFFIX):
+            fileids = setupam.io.FileidWriter(
+                os.path.join(metadata_path, corpus.format_filename(split, Corpus.FILEID_EXT)), streaming=True)
+            transcriptions = setupam.io.FileWriter(
+                os.path.join(metadata_path, corpus.format_filename(split, Corpus.TRANSCRIPT_EXT)),
+                '{0} ({1})'.format, streaming=True)
+            for part, spk_map, audio_map in zip(parts, spk_maps, audio_maps):
+                for spk_id, audio_id, text in part.utterances(split):
+                    if spk_id not in spk_map:
+                        spk_map[spk_id] = next(speaker_ids)
+                        corpus.create_folder(os.path.join(Corpus.AUDIO_DIR, Corpus.format_speaker_id(spk_map[spk_id])))
+                    spk_repr = Corpus.format_speaker_id(spk_map[spk_id])
+                    spk_dir_path = os.path.join(corpus.corpus_path, Corpus.AUDIO_DIR, spk_repr)
+                    audio_map[audio_id] = next(audio_ids)
+                    audio_repr = Corpus.format_audio_id(spk_repr, audio_map[audio_id])
+                    src = part.audio_path(spk_id, audio_id)
+                    pool.submit(functools.partial(setupam.io.materialize_file, mode=materialize, fallback=False), src,
+                                os.path.join(spk_dir_path, audio_repr + os.path.splitext(src)[1]))
+                    fileids.add_content(spk_repr, audio_repr)
+                    transcriptions.add_content(text, audio_repr)
+                    counts[split] += 1
+            fileids.store()
+            transcriptions.store()
+    manifest = setupam.manifest.Manifest(os.path.join(metadata_path, '{}.{}'.format(model, Corpus.MANIFEST_EXT)))
+    for part, spk_map, audio_map in zip(parts, spk_maps, audio_maps):
+        for spk_name, entry in part.manifest.speakers.items():
+            if entry['id'] in spk_map:
+                manifest.speakers[spk_name] = dict(entry, id=spk_map[entry['id']], utterances=[
+                    [audio_map[utterance[0]]] + utterance[1:]
+                    for utterance in entry['utterances'] if utterance[0] in audio_map])
+    manifest.store()
+    logging.info('Merged {} speakers and {} utterances of {} partial corpora.'.format(
+        len(manifest.speakers), sum(len(audio_map) for audio_map in audio_maps), len(parts)))
+    if not counts[Corpus.TEST_SUFFIX]:
+        logging.warning('The merged corpus has no test utterances: the hashed split gave no speaker to the test part. '
+                        'Build the shards again with another --seed or a larger --ratio.')
+    for src, dst, e in pool.errors:
+        logging.error('I/O error({0}): {1} {2} -> {3}'.format(e.errno, e.strerror, src, dst))
+    return pool.errors
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import collections
+import contextlib
+import datetime
+import json
+import logging
+import threading
+import time
+
+
+class Metrics(object):
+    """Phase timers, counters and cumulative timers of a build.
+
+    Phases are the sequential steps of the build, timed by wall clock. Timers add up the time spent in an
+    operation across threads and processes, so they can exceed the phase they happen in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.phases = collections.OrderedDict()
+            self.counters = collections.Counter()
+            self.timers = collections.Counter()
+            self.started = time.perf_counter()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timers[name] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.) + elapsed
+            logging.debug('Phase {} took {:.3f}s.'.format(name, elapsed))
+
+    def pop_updates(self):
+        """Return the counters and timers recorded since the last call and clear them, for a worker process."""
+        with self._lock:
+            updates = {'counters': dict(self.counters), 'timers': dict(self.timers)}
+            self.counters.clear()
+            self.timers.clear()
+        return updates
+
+    def update(self, updates):
+        with self._lock:
+            self.counters.update(updates.get('counters', {}))
+            self.timers.update(updates.get('timers', {}))
+
+    def as_dict(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            report = {
+                'generated': datetime.datetime.now().replace(microsecond=0).isoformat(),
+                'elapsed': round(elapsed, 4),
+                'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+                'counters': dict(sorted(self.counters.items())),
+                'timers': {name: round(seconds, 4) for name, seconds in sorted(self.timers.items())},
+            }
+            copy_time = self.phases.get('compile', 0.)
+        if copy_time:
+            report['throughput'] = {
+                'audio_files_per_s': round(report['counters'].get('audio_files', 0) / copy_time, 2),
+                'audio_mb_per_s': round(report['counters'].get('audio_bytes', 0) / 2 ** 20 / copy_time, 2),
+            }
+        return report
+
+    def store(self, file_path):
+        with open(file_path, mode='w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def summary(self):
+        return ', '.join('{} {:.2f}s'.format(name, seconds) for name, seconds in self.phases.items())
+
+
+class Progress(object):
+    """Log the progress of a task with its rate and ETA, at most once every interval seconds."""
+
+    def __init__(self, label, total, unit='items', interval=5.):
+        self.label, self.total, self.unit, self.interval = label, total, unit, interval
+        self.done = 0
+        self.started = self._last = time.perf_counter()
+
+    def update(self, value=1):
+        self.done += value
+        now = time.perf_counter()
+        if now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            logging.info(self.line(now))
+
+    def line(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.
+        eta = (self.total - self.done) / rate if rate and self.total else 0.
+        return '{}: {}/{} {} ({:.1%}), {:.1f} {}/s, ETA {}'.format(
+            self.label, self.done, self.total, self.unit, self.done / self.total if self.total else 1., rate,
+            self.unit, datetime.timedelta(seconds=round(eta)))
+
+
+# The metrics recorded by the functions used on their own. Each build records its own Metrics instead.
+METRICS = Metrics()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import glob
+import io
+import os
+import tarfile
+
+import setupam.io
+import setupam.metrics
+
+SHARD_DIR = 'shards'
+INDEX_EXT = 'shards'
+BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def shard_filename(prefix, number):
+    return '{}-{:05}.tar'.format(prefix, number)
+
+
+class ShardWriter(object):
+    """Write the utterances of a corpus into uncompressed tar shards of about max_size bytes.
+
+    Each audio is followed by its transcription in the shard, and the index file maps every audio ID to its shard
+    and to the offset and size of its data, so an audio can be read with a single seek. The failures to read an
+    audio are collected in errors, as (src, member, exception), instead of raised.
+    """
+
+    def __init__(self, shard_dir, prefix, index_file, max_size=1 << 30, normalizer=setupam.io.DEFAULT_NORMALIZER,
+                 metrics=setupam.metrics.METRICS):
+        self.shard_dir = shard_dir
+        self.prefix = prefix
+        self.max_size = max_size
+        self.normalizer = normalizer
+        self.metrics = metrics
+        self.errors = []
+        self.number = -1
+        self._tar = None
+        self.index = setupam.io.FileWriter(index_file, '{0} {1} {2} {3}'.format, streaming=True)
+        os.makedirs(shard_dir, exist_ok=True)
+        # The shards of a previous build may outnumber the new ones
+        for stale_path in glob.glob(os.path.join(glob.escape(shard_dir), '{}-*.tar'.format(glob.escape(prefix)))):
+            os.remove(stale_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    @property
+    def shard_name(self):
+        return shard_filename(self.prefix, self.number)
+
+    def _member_size(self, size):
+        return BLOCK_SIZE + -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+    def _next_shard(self):
+        if self._tar is not None:
+            self._tar.close()
+        self.number += 1
+        self._tar = tarfile.open(os.path.join(self.shard_dir, self.shard_name), mode='w', format=tarfile.GNU_FORMAT)
+
+    def _add_member(self, name, fileobj, size, mtime):
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, mtime, 0o644
+        self._tar.addfile(info, fileobj)
+        # The data is padded up to the end of its last block
+        return self._tar.offset - -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+    def add(self, src, member_name, audio_id, prompt):
+        """Append the audio src and its transcription to the current shard, starting a new one when it's full."""
+        transcription = (self.normalizer.normalize(prompt).strip() + '\n').encode('utf-8')
+        try:
+            with open(src, mode='rb') as audio:
+                stat = os.fstat(audio.fileno())
+                needed = self._member_size(stat.st_size) + self._member_size(len(transcription))
+                if self._tar is None or (self._tar.offset and self._tar.offset + needed > self.max_size):
+                    self._next_shard()
+                offset = self._add_member(member_name, audio, stat.st_size, int(stat.st_mtime))
+        except OSError as e:
+            self.errors.append((src, member_name, e))
+            return
+        self._add_member(os.path.splitext(member_name)[0] + '.txt', io.BytesIO(transcription), len(transcription),
+                         int(stat.st_mtime))
+        self.index.add_content(audio_id, self.shard_name, offset, stat.st_size)
+        self.metrics.count('audio_files')
+        self.metrics.count('audio_bytes', stat.st_size)
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        self.index.store()
+
+    def discard(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+        self.index.discard()
+
+
+def read_audio(shard_dir, index_line):
+    """Read the audio of a line of the index file."""
+    _, shard_name, offset, size = index_line.split()
+    with open(os.path.join(shard_dir, shard_name), mode='rb') as f:
+        f.seek(int(offset))
+        return f.read(int(size))
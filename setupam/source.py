@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+
+
+class SpeakerIndex(object):
+    """The files of a speaker's directory, listed in a single walk.
+
+    The builders resolve the audios and prompts from the index instead of probing the filesystem with globs and
+    existence checks. Hidden files are left out, like glob does, and so are the broken links and the links to
+    directories.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.normpath(path)
+        self.dirs = {}  # Directory path -> {filename: [size, mtime_ns]}
+
+    @classmethod
+    def scan(cls, path):
+        index = cls(path)
+        pending = [index.path]
+        while pending:
+            dir_path = pending.pop()
+            files = index.dirs[dir_path] = {}
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    # The links to directories aren't followed, so a cycle of links can't make the walk recurse
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif not entry.is_dir():
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue  # A broken link
+                        files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+        return index
+
+    def exists(self, file_path):
+        dir_path, filename = os.path.split(os.path.normpath(file_path))
+        return filename in self.dirs.get(dir_path, ())
+
+    def track_files(self, dir_path, file_format):
+        """The equivalent of setupam.io.track_files over the index, sorted by filename."""
+        dir_path = os.path.normpath(dir_path)
+        suffix = '.{}'.format(file_format)
+        return [
+            os.path.join(dir_path, filename) for filename in sorted(self.dirs.get(dir_path, ()))
+            if filename.endswith(suffix)
+        ]
+
+    def files(self, src_path):
+        """Map the path of every file, relative to src_path, to its size and mtime."""
+        return {
+            os.path.relpath(os.path.join(dir_path, filename), src_path): stat
+            for dir_path, files in self.dirs.items() for filename, stat in files.items()
+        }
+
+
+class ArchiveIndex(object):
+    """A speaker's submission packed in a tar archive, read by setupam.archive without extracting it first.
+
+    The archive is tracked as a single file, so a speaker is unchanged while its archive is.
+    """
+
+    EXTENSIONS = ('.tgz', '.tar.gz', '.tar')
+
+    def __init__(self, path, stat):
+        self.path = os.path.normpath(path)
+        self.stat = stat  # [size, mtime_ns]
+
+    @classmethod
+    def speaker_name(cls, filename):
+        for ext in cls.EXTENSIONS:
+            if filename.endswith(ext):
+                return filename[:-len(ext)]
+        return None
+
+    def files(self, src_path):
+        return {os.path.relpath(self.path, src_path): self.stat}
+
+
+def list_source(src_path, skip=()):
+    """Map every speaker of src_path to the path of its directory, or to the ArchiveIndex of its archive.
+
+    Only src_path itself is read, so the directories can be indexed one at a time. A directory is preferred to an
+    archive of the same speaker, since it's usually the archive extracted. The speakers in skip are left out.
+    """
+    speakers, archives = {}, {}
+    with os.scandir(src_path) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                if entry.name not in skip:
+                    speakers[entry.name] = entry.path
+            elif entry.is_file():
+                spk_name = ArchiveIndex.speaker_name(entry.name)
+                if spk_name and spk_name not in skip:
+                    stat = entry.stat()
+                    archives[spk_name] = ArchiveIndex(entry.path, [stat.st_size, stat.st_mtime_ns])
+    for spk_name, archive in archives.items():
+        speakers.setdefault(spk_name, archive)
+    return speakers
+
+
+def index_speaker(entry):
+    """The index of a speaker listed by list_source, walking its directory when it isn't an archive."""
+    return entry if isinstance(entry, ArchiveIndex) else SpeakerIndex.scan(entry)
+
+
+def scan_source(src_path, skip=()):
+    """Index every speaker's directory or archive of src_path, without changing the working directory.
+
+    The speakers are listed as list_source does, and the directories of the speakers not in skip are walked.
+    """
+    return {spk_name: index_speaker(entry) for spk_name, entry in list_source(src_path, skip).items()}
@@ -16,15 +16,16 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import codecs
 import collections
 import glob
 import os
 import re
 import logging
-
-import chardet.universaldetector
+import sys
 
 import setupam.io
+import setupam.metrics
 
 
 class Speaker(object):
@@ -34,12 +35,20 @@ class Speaker(object):
     def __init__(self, name):
         self.name = name
         self.metadata = self.prompts = self.audios = None
+        # The archive the speaker was read from, with its audios staged out of it
+        self.archive = None
 
 
 class SpeakerBuilder(object):
-    def __init__(self, name, source_path=None):
+    def __init__(self, name, source_path=None, index=None, encoding_cache=None, metrics=setupam.metrics.METRICS):
         self._speaker = Speaker(name)
         self.relative_path = source_path
+        # A setupam.source.SpeakerIndex to resolve the files from, instead of the filesystem
+        self.index = index
+        self._index_kwargs = {'index': index} if index is not None else {}
+        # The encoding cache and the metrics of the build, given to the readers of the text files
+        self.encoding_cache = encoding_cache
+        self.metrics = metrics
 
     @property
     def speaker(self):
@@ -55,9 +64,9 @@ class SpeakerBuilder(object):
         if not path_list:
             raise TypeError("Missing the path list of audios' directory.")
         for audios_path in path_list:
-            if len(glob.glob(os.path.join(audios_path, '*.{}'.format(audio_format)))) > 0:
+            if self._has_files(audios_path, audio_format):
                 audios_list = Audios()
-                audios_list.populate(audios_path, audio_format)
+                audios_list.populate(audios_path, audio_format, **self._index_kwargs)
                 self.speaker.audios = audios_list
                 break
         else:
@@ -75,12 +84,18 @@ class SpeakerBuilder(object):
             raise TypeError('Missing arguments. Must have at least a path for multi files.')
         else:
             prompts = Prompts()
+            prompts.encoding_cache, prompts.metrics = self.encoding_cache, self.metrics
             if not multi_path:
-                prompts.populate(*single_path_list)
+                prompts.populate(*single_path_list, **self._index_kwargs)
             else:
-                prompts.populate(*single_path_list, multi_path=multi_path)
+                prompts.populate(*single_path_list, multi_path=multi_path, **self._index_kwargs)
         self.speaker.prompts = prompts
 
+    def _has_files(self, dir_path, file_format):
+        if self.index is not None:
+            return len(self.index.track_files(dir_path, file_format)) > 0
+        return len(glob.glob(os.path.join(dir_path, '*.{}'.format(file_format)))) > 0
+
     def set_metadata(self, **kwargs):
         full_path = kwargs.get('full_path')
         if self.relative_path:
@@ -90,6 +105,7 @@ class SpeakerBuilder(object):
                 full_path = os.path.join(self.relative_path, 'etc', 'README')
         if full_path:
             metadata = Metadata()
+            metadata.encoding_cache, metadata.metrics = self.encoding_cache, self.metrics
             if 'regex' in kwargs:
                 metadata.populate(full_path, kwargs['regex'])
             else:
@@ -100,14 +116,29 @@ class SpeakerBuilder(object):
 
 
 class SpeakerFileReader(object):
-    @staticmethod
-    def _get_encoding(filename):
-        detector = chardet.universaldetector.UniversalDetector()
-        for line in open(filename, 'rb'):
-            detector.feed(line)
-            if detector.done:
-                break
-        detector.close()
+    # The setupam.cache.StatCache of the encodings detected for the files that aren't UTF-8, and the
+    # setupam.metrics.Metrics the reads are recorded in. A build gives its own to the readers of its speakers.
+    encoding_cache = None
+    metrics = setupam.metrics.METRICS
+
+    def __getstate__(self):
+        # The cache and the metrics stay with the build of the process that read the files
+        state = dict(self.__dict__)
+        state.pop('encoding_cache', None)
+        state.pop('metrics', None)
+        return state
+
+    def _get_encoding(self, filename, content):
+        # chardet is slow to import, and most builds never need it since their files are UTF-8
+        import chardet.universaldetector
+        self.metrics.count('chardet_calls')
+        with self.metrics.timer('encoding_detection'):
+            detector = chardet.universaldetector.UniversalDetector()
+            for line in content.splitlines(True):
+                detector.feed(line)
+                if detector.done:
+                    break
+            detector.close()
         logging.debug('Enconding detected for {} file: {} (confidence level: {:.2f})'.format(
             os.path.basename(filename),
             detector.result['encoding'],
@@ -118,39 +149,222 @@ class SpeakerFileReader(object):
         else:
             return 'utf-8'
 
+    def _read_text(self, filename):
+        """Read and decode the file in a single read, translating its newlines to '\\n'.
+
+        Contents that decode cleanly as UTF-8 (and so ASCII) are never given to chardet. The encodings detected
+        for the other files are kept in the encoding_cache, when there is one.
+        """
+        with open(filename, mode='rb') as f:
+            content = f.read()
+        return self._decode_text(filename, content)
+
+    def _decode_text(self, filename, content):
+        try:
+            text = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            text = self._decode_strictly(filename, content, self._cached_encoding(filename, content))
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+
+    def _decode_strictly(self, filename, content, encoding):
+        """Decode the content with the encoding guessed for it, detecting it again when the guess doesn't fit.
+
+        The guess may come from a sample of the file, another file or the cache. The encoding detected on the whole
+        content is cached in its place, and the bytes it can't decode either are replaced, with a warning.
+        """
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+        encoding = self._cached_encoding(filename, content, refresh=True)
+        try:
+            return content.decode(encoding)
+        except UnicodeDecodeError as e:
+            logging.warning('Replacing the bytes of {} that are not valid {}: {}'.format(filename, encoding, e))
+            return content.decode(encoding, errors='replace')
+
+    def _decode_texts(self, files):
+        """Decode the (filename, content) pairs of a directory, detecting the encoding of the non UTF-8 ones once.
+
+        The encoding detected for the first file that isn't UTF-8 is tried strictly on the next ones, and theirs is
+        only detected when it doesn't fit.
+        """
+        shared_encoding = None
+        for filename, content in files:
+            try:
+                text = content.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                if shared_encoding is None:
+                    shared_encoding = self._cached_encoding(filename, content)
+                text = self._decode_strictly(filename, content, shared_encoding)
+            yield text.replace('\r\n', '\n').replace('\r', '\n')
+
+    def _open_text(self, filename, sample_size=1 << 16):
+        """Open the file for reading its lines lazily, with the encoding detected from its first bytes.
+
+        The file is decoded strictly, so a UnicodeDecodeError is raised while reading when the rest of it doesn't
+        fit the encoding of the first bytes.
+        """
+        with open(filename, mode='rb') as f:
+            sample = f.read(sample_size)
+        if sample.startswith(codecs.BOM_UTF8):
+            encoding = 'utf-8-sig'
+        else:
+            try:
+                sample.decode('utf-8')
+                encoding = 'utf-8'
+            except UnicodeDecodeError as e:
+                # A multi-byte character cut at the end of the sample still counts as UTF-8
+                truncated = len(sample) == sample_size and e.start >= len(sample) - 3 and e.end == len(sample)
+                encoding = 'utf-8' if truncated else self._cached_encoding(filename, sample)
+        return open(filename, mode='r', encoding=encoding)
+
+    def _cached_encoding(self, filename, content, refresh=False):
+        cache = self.encoding_cache
+        try:
+            encoding = cache.get(filename) if cache is not None and not refresh else None
+        except OSError:
+            # The members of archives have no file of their own to validate the cache entry with
+            cache = encoding = None
+        if encoding is None:
+            encoding = self._get_encoding(filename, content)
+            if cache is not None:
+                try:
+                    cache.set(filename, encoding)
+                except OSError:
+                    pass
+        return encoding
+
 
 class Prompts(SpeakerFileReader, collections.UserDict):
     PROMPT_PATTERN = r"(?P<id>^\d+).?[ ]+(?P<prompt>\S+( \S+)*)"
+    # The pattern can't match across lines, so a multiline search over the whole content finds the same prompts
+    # as a search on each line.
+    PROMPT_REGEX = re.compile(PROMPT_PATTERN, re.MULTILINE)
+    # Files larger than this are parsed line by line instead of in a single read.
+    STREAM_THRESHOLD = 8 << 20
+    # The number of threads reading the per-utterance transcription files of a speaker.
+    READ_WORKERS = 8
 
     def _populate_from_file(self, file_path):
-        with open(file_path, mode='r', encoding=self._get_encoding(file_path)) as f:
-            for line in f.readlines():
-                m = re.search(self.PROMPT_PATTERN, line)
-                if m:
-                    self.data[m.group('id')] = m.group('prompt').lower()
-
-    def _populate_from_files(self, file_path, ext):
-        for trans_file in setupam.io.track_files(file_path, ext):
-            with open(trans_file, mode='r', encoding=self._get_encoding(trans_file)) as f:
-                first_line = f.readline().strip()
-                if first_line.strip():
-                    self.data[os.path.splitext(os.path.basename(trans_file))[0]] = first_line.lower()
+        with open(file_path, mode='rb') as f:
+            content = f.read(self.STREAM_THRESHOLD + 1)
+            if len(content) > self.STREAM_THRESHOLD:
+                self.metrics.count('text_bytes', os.fstat(f.fileno()).st_size)
+            else:
+                self.metrics.count('text_bytes', len(content))
+        self.metrics.count('text_files')
+        if len(content) > self.STREAM_THRESHOLD:
+            del content
+            try:
+                with self._open_text(file_path) as f:
+                    for line in f:
+                        m = self.PROMPT_REGEX.search(line)
+                        if m:
+                            self.data[m.group('id')] = m.group('prompt').lower()
+            except UnicodeDecodeError as e:
+                # The encoding of the first bytes doesn't fit the rest: parse it again in a single read
+                logging.info('Detecting the encoding of the whole {} again: {}'.format(file_path, e))
+                with open(file_path, mode='rb') as f:
+                    content = f.read()
+                self._parse_prompts(self._decode_text(file_path, content))
+        else:
+            self._parse_prompts(self._decode_text(file_path, content))
+
+    def _parse_prompts(self, text):
+        for m in self.PROMPT_REGEX.finditer(text):
+            self.data[m.group('id')] = m.group('prompt').lower()
+
+    def _populate_from_files(self, file_path, ext, index=None):
+        track_files = index.track_files if index is not None else setupam.io.track_files
+        trans_files = track_files(file_path, ext)
+        raw_contents = setupam.io.read_files(trans_files, self.READ_WORKERS)
+        self.metrics.count('text_files', len(trans_files))
+        self.metrics.count('text_bytes', sum(len(content) for content in raw_contents))
+        self._parse_transcriptions(zip(trans_files, raw_contents))
+
+    def _parse_transcriptions(self, contents):
+        contents = list(contents)
+        for (trans_file, _), text in zip(contents, self._decode_texts(contents)):
+            first_line = text.split('\n', 1)[0].strip()
+            if first_line:
+                self.data[os.path.splitext(os.path.basename(trans_file))[0]] = first_line.lower()
+
+    def populate_from_contents(self, prompts_file=None, trans_files=()):
+        """Populate from files already read, given as (filename, content) pairs of bytes.
+
+        The prompts file is used when it's given, like in populate; the per-utterance transcription files otherwise.
+        """
+        with self.metrics.timer('prompts_parsing'):
+            if prompts_file is not None:
+                self._parse_prompts(self._decode_text(*prompts_file))
+            else:
+                self._parse_transcriptions(trans_files)
 
     def populate(self, *args, **kwargs):
+        with self.metrics.timer('prompts_parsing'):
+            self._populate(*args, **kwargs)
+
+    def _populate(self, *args, **kwargs):
+        index = kwargs.get('index')
+        exists = index.exists if index is not None else os.path.exists
         for file_path in args:
-            if os.path.exists(file_path):
+            if exists(file_path):
                 self._populate_from_file(file_path)
                 break
         else:
-            self._populate_from_files(kwargs['multi_path'], kwargs.get('ext', 'txt'))
+            self._populate_from_files(kwargs['multi_path'], kwargs.get('ext', 'txt'), index=index)
+
+
+class Audio(object):
+    """An audio file of a speaker.
+
+    It unpacks as the (name, ext, path) tuple used before it. The directory and extension strings are interned, so
+    the audios of a speaker share them. Its header is read with setupam.stats.read_header when it's needed.
+    """
+
+    __slots__ = ('name', 'ext', 'dir_path')
+
+    def __init__(self, name, ext, dir_path):
+        self.name = name
+        self.ext = sys.intern(ext)
+        self.dir_path = sys.intern(dir_path)
+
+    @classmethod
+    def from_path(cls, file_path):
+        dir_path, filename = os.path.split(file_path)
+        name, ext = os.path.splitext(filename)
+        return cls(name, ext[1:], dir_path)
+
+    @property
+    def path(self):
+        return os.path.join(self.dir_path, '{}.{}'.format(self.name, self.ext) if self.ext else self.name)
+
+    def __iter__(self):
+        return iter((self.name, self.ext, self.path))
+
+    def __getitem__(self, item):
+        return tuple(self)[item]
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other) if isinstance(other, (Audio, tuple)) else NotImplemented
+
+    def __lt__(self, other):
+        return tuple(self) < tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return 'Audio({!r}, {!r}, {!r})'.format(self.name, self.ext, self.dir_path)
 
 
 class Audios(collections.UserList):
-    def populate(self, audios_path, audios_format):
-        audios_files = setupam.io.track_files(audios_path, audios_format)
+    def populate(self, audios_path, audios_format, index=None):
+        track_files = index.track_files if index is not None else setupam.io.track_files
+        audios_files = track_files(audios_path, audios_format)
         for file_path in audios_files:
-            filename, file_extension = os.path.splitext(os.path.basename(file_path))
-            self.data.append((filename, file_extension[1:], file_path))
+            self.data.append(Audio.from_path(file_path))
 
 
 class Metadata(SpeakerFileReader, collections.UserDict):
@@ -164,7 +378,11 @@ class Metadata(SpeakerFileReader, collections.UserDict):
     REGEX = re.compile(GLOBAL_PATTERN)
 
     def populate(self, file_path, regex=REGEX):
-        with open(file_path, mode='r', encoding=self._get_encoding(file_path)) as f:
-            content_file = f.read()
-            for m in regex.finditer(content_file):
-                self.data[m.lastgroup] = m.group(m.lastgroup).strip()
+        self._parse(self._read_text(file_path), regex)
+
+    def populate_from_content(self, file_path, content, regex=REGEX):
+        self._parse(self._decode_text(file_path, content), regex)
+
+    def _parse(self, text, regex):
+        for m in regex.finditer(text):
+            self.data[m.lastgroup] = m.group(m.lastgroup).strip()
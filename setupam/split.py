@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import hashlib
+import itertools
+import random
+
+import setupam.stats
+
+TRAIN = 'train'
+TEST = 'test'
+
+SPLIT_MODES = ('speaker', 'utterance', 'duration')
+
+
+def speaker_weights(speakers, split_by, workers=8, cache=None):
+    """Weigh each speaker by its number of transcribed utterances or their total duration in seconds.
+
+    speakers maps the names to the loaded setupam.speaker.Speaker objects. The durations come from the headers of
+    the audio files only, cached in cache (a setupam.cache.StatCache) when it's given.
+    """
+    transcribed = {
+        name: [audio.path for audio in spk.audios if audio.name in spk.prompts] for name, spk in speakers.items()
+    }
+    if split_by == 'utterance':
+        return {name: len(paths) for name, paths in transcribed.items()}
+    names = list(transcribed)
+    headers = iter(setupam.stats.read_headers(
+        list(itertools.chain.from_iterable(transcribed[name] for name in names)), workers, cache))
+    return {
+        name: sum(header.duration for header in itertools.islice(headers, len(transcribed[name])) if header)
+        for name in names
+    }
+
+
+def balanced_split(weights, ratio, seed=None, fixed=None):
+    """Split the speakers in train and test parts, with the test part as close as possible to ratio of the weight.
+
+    The speakers are kept whole. The ones in fixed (a mapping of speakers to TRAIN or TEST) keep their part, and
+    the others are added to the test part from the heaviest to the lightest while they fit in it, ties broken by a
+    shuffle seeded by seed. The test part gets at least one speaker. Both parts are returned in the order of the
+    shuffle.
+    """
+    fixed = fixed or {}
+    names = sorted(weights)
+    random.Random(seed).shuffle(names)
+    target = ratio * sum(weights.values())
+    train = [name for name in names if fixed.get(name) == TRAIN]
+    test = [name for name in names if fixed.get(name) == TEST]
+    test_weight = sum(weights[name] for name in test)
+    for name in sorted((name for name in names if name not in fixed), key=weights.get, reverse=True):
+        if test_weight + weights[name] <= target:
+            test.append(name)
+            test_weight += weights[name]
+        else:
+            train.append(name)
+    # Overshooting the target with one more speaker may still get closer to it, and the test part can't be empty
+    closest = min((name for name in train if name not in fixed),
+                  key=lambda name: abs(test_weight + weights[name] - target), default=None)
+    if closest is not None and (not test or abs(test_weight + weights[closest] - target) < target - test_weight):
+        train.remove(closest)
+        test.append(closest)
+    order = {name: i for i, name in enumerate(names)}
+    return sorted(train, key=order.get), sorted(test, key=order.get)
+
+
+def stable_hash(name, salt=None, person=b''):
+    """A hash of the name in [0, 1) that is the same on every machine and run, unlike the builtin hash."""
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=8, person=person,
+                             key=str(salt).encode('utf-8') if salt is not None else b'').digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+def parse_shard(value):
+    """Parse a shard given as i/N, with 0 <= i < N, to the pair (i, N)."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError('Invalid shard {}, expected i/N.'.format(value))
+    if not 0 <= index < count:
+        raise ValueError('Invalid shard {}, i must be from 0 to N - 1.'.format(value))
+    return index, count
+
+
+def in_shard(name, shard):
+    """Whether the speaker is in shard, a pair (i, N), partitioning the speakers by a stable hash of their names."""
+    index, count = shard
+    return int(stable_hash(name, person=b'shard') * count) == index
+
+
+def hashed_split(names, ratio, seed=None, fixed=None):
+    """Split the speakers in train and test parts, each one by a stable hash of its name seeded by seed.
+
+    A speaker's part doesn't depend on the other speakers, so the shards of a build agree on it, and the test part
+    gets about ratio of the speakers. The ratio is only approximate: unlike the other splits, the test part isn't
+    guaranteed a speaker, and on small corpora it can get none. The ones in fixed (a mapping of speakers to TRAIN or
+    TEST) keep their part. Both parts keep the order of names.
+    """
+    fixed = fixed or {}
+    parts = {
+        name: fixed.get(name) or (TEST if stable_hash(name, seed, b'split') < ratio else TRAIN) for name in names
+    }
+    return [name for name in names if parts[name] == TRAIN], [name for name in names if parts[name] == TEST]
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import collections
+import concurrent.futures
+import datetime
+import os
+import struct
+
+
+class WavHeader(collections.namedtuple('WavHeader', 'channels sample_rate bits data_size')):
+    __slots__ = ()
+
+    @property
+    def duration(self):
+        block_align = self.channels * ((self.bits + 7) // 8)
+        return self.data_size / block_align / self.sample_rate if block_align and self.sample_rate else 0.
+
+
+class HeaderError(ValueError):
+    pass
+
+
+def read_header(file_path):
+    """Parse the RIFF header of a WAV file, reading only the chunk headers and the fmt chunk."""
+    with open(file_path, mode='rb') as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise HeaderError('{} is not a WAV file.'.format(file_path))
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise HeaderError('{} has no data chunk.'.format(file_path))
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(chunk_size - 16 + chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise HeaderError('{} has no fmt chunk before its data.'.format(file_path))
+                # Headers written while recording may have no data size yet
+                if chunk_size in (0, 0xFFFFFFFF):
+                    chunk_size = os.fstat(f.fileno()).st_size - f.tell()
+                return WavHeader(fmt[1], fmt[2], fmt[5], chunk_size)
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)  # Chunks are word aligned
+
+
+def read_headers(file_paths, workers=8, cache=None):
+    """Read the headers of the files with a pool of threads, returning None for the files that can't be read.
+
+    The headers are kept in cache, a setupam.cache.StatCache, when it's given.
+    """
+    def read(file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        if cache is not None:
+            cached = cache.get(file_path, stat)
+            if cached is not None:
+                return WavHeader(*cached) if cached else None
+        try:
+            header = read_header(file_path)
+        except (HeaderError, struct.error):
+            header = None
+        if cache is not None:
+            cache.set(file_path, list(header) if header else [], stat)
+        return header
+
+    if workers > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(read, file_paths))
+    return [read(file_path) for file_path in file_paths]
+
+
+class Summary(object):
+    """Totals of a group of audios."""
+
+    def __init__(self, split=None):
+        self.split = split
+        self.files = 0
+        self.duration = 0.
+
+    def add(self, header):
+        self.files += 1
+        self.duration += header.duration
+
+    def as_dict(self):
+        return {'files': self.files, 'duration': round(self.duration, 3), 'hours': round(self.duration / 3600, 3)}
+
+
+def _audio_files(audio_dir, fileids):
+    """Resolve the fileids to the audio files of audio_dir, listing each speaker's directory once."""
+    listings = {}
+    for fileid in fileids:
+        spk_dir, audio_name = os.path.split(fileid)
+        if spk_dir not in listings:
+            try:
+                with os.scandir(os.path.join(audio_dir, spk_dir)) as entries:
+                    listings[spk_dir] = {os.path.splitext(entry.name)[0]: entry.path for entry in entries}
+            except FileNotFoundError:
+                listings[spk_dir] = {}
+        yield fileid, listings[spk_dir].get(audio_name)
+
+
+def corpus_report(corpus_path, splits, workers=8, cache=None):
+    """Report the duration and format of the audios of a compiled corpus.
+
+    splits maps the name of each part of the corpus to its fileids file. Only the headers of the audios are read.
+    """
+    audio_dir = os.path.join(corpus_path, 'wav')
+    total = Summary()
+    split_totals, speakers = {}, {}
+    sample_rates, channels, bit_depths = collections.Counter(), collections.Counter(), collections.Counter()
+    unreadable = 0
+    for split, fileids_path in sorted(splits.items()):
+        split_totals[split] = Summary()
+        if not os.path.exists(fileids_path):
+            continue
+        with open(fileids_path, mode='r', encoding='utf-8') as f:
+            fileids = [line.strip() for line in f if line.strip()]
+        resolved = list(_audio_files(audio_dir, fileids))
+        existing = [(fileid, file_path) for fileid, file_path in resolved if file_path]
+        unreadable += len(resolved) - len(existing)
+        headers = read_headers([file_path for _, file_path in existing], workers, cache)
+        for (fileid, _), header in zip(existing, headers):
+            if header is None:
+                unreadable += 1
+                continue
+            spk = os.path.dirname(fileid)
+            if spk not in speakers:
+                speakers[spk] = Summary(split)
+            for summary in (total, split_totals[split], speakers[spk]):
+                summary.add(header)
+            sample_rates[header.sample_rate] += 1
+            channels[header.channels] += 1
+            bit_depths[header.bits] += 1
+    report = {
+        'generated': datetime.datetime.now().replace(microsecond=0).isoformat(),
+        'total': total.as_dict(),
+        'splits': {split: dict(summary.as_dict(), speakers=sum(1 for spk in speakers.values() if spk.split == split))
+                   for split, summary in split_totals.items()},
+        'sample_rates': {str(key): count for key, count in sorted(sample_rates.items())},
+        'channels': {str(key): count for key, count in sorted(channels.items())},
+        'bit_depths': {str(key): count for key, count in sorted(bit_depths.items())},
+        'speakers': {spk: dict(summary.as_dict(), split=summary.split) for spk, summary in sorted(speakers.items())},
+        'unreadable': unreadable,
+    }
+    for split, summary in split_totals.items():
+        report['splits'][split]['ratio'] = round(summary.duration / total.duration, 4) if total.duration else 0.
+    return report
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import logging
+import os
+import shutil
+import time
+
+import setupam.build
+import setupam.cache
+import setupam.corpus
+import setupam.manifest
+import setupam.metrics
+import setupam.source
+
+WATCH_STAGING_DIR = '.staging-watch'
+
+
+def max_fileids(file_paths):
+    """The highest speaker and audio IDs of the fileids files, the ones missing being skipped."""
+    max_spk_id = max_audio_id = 0
+    for file_path in file_paths:
+        try:
+            with open(file_path, mode='r', encoding='utf-8') as f:
+                for line in f:
+                    spk_repr, _, audio_repr = line.strip().partition('/')
+                    if audio_repr:
+                        max_spk_id = max(max_spk_id, int(spk_repr))
+                        max_audio_id = max(max_audio_id, int(audio_repr.rsplit('_', 1)[1]))
+        except FileNotFoundError:
+            continue
+    return max_spk_id, max_audio_id
+
+
+class Watcher(object):
+    """Append the speakers that arrive in the source directory to a compiled corpus.
+
+    Each poll only stats the source directory, and does nothing more while its mtime is the same and no speaker is
+    settling or failed to load. The speakers that aren't in the manifest are indexed, and once their files are the
+    same in two polls in a row (right away without settle), they're loaded and compiled into the split part: their
+    audios are placed, their lines are appended to the fileids and transcription files, and they're recorded in the
+    manifest. The IDs continue after the highest ones of the corpus. Speakers that can't be loaded are skipped until
+    their files change.
+    """
+
+    def __init__(self, source, model, target='.', split=setupam.corpus.Corpus.TRAIN_SUFFIX, copy_workers=4,
+                 materialize='copy', settle=True):
+        Corpus = setupam.corpus.Corpus
+        self.source = os.path.abspath(source)
+        self.model, self.target, self.split = model, target, split
+        self.copy_workers, self.materialize, self.settle = copy_workers, materialize, settle
+        metadata_path = os.path.join(target, model, Corpus.METADATA_DIR)
+        manifest_path = os.path.join(metadata_path, '{}.{}'.format(model, Corpus.MANIFEST_EXT))
+        if not os.path.exists(manifest_path):
+            raise ValueError('There is no corpus {} in {} to watch for. Build it first.'.format(model, target))
+        self.manifest = setupam.manifest.Manifest.load(manifest_path)
+        # The encoding cache and the metrics are the watcher's own, as a build's are
+        self.encoding_cache = setupam.cache.StatCache.load(
+            os.path.join(metadata_path, '{}.{}'.format(model, Corpus.ENCODING_CACHE_EXT)))
+        self.metrics = setupam.metrics.Metrics()
+        recorded_ids = self.manifest.max_ids()
+        listed_ids = max_fileids(os.path.join(metadata_path, '{}_{}.{}'.format(model, suffix, Corpus.FILEID_EXT))
+                                 for suffix in (Corpus.TRAIN_SUFFIX, Corpus.TEST_SUFFIX))
+        self.speaker_ids = setupam.corpus.IdAllocator(max(recorded_ids[0], listed_ids[0]) + 1)
+        self.audio_ids = setupam.corpus.IdAllocator(max(recorded_ids[1], listed_ids[1]) + 1)
+        self.staging = os.path.join(target, model, WATCH_STAGING_DIR)
+        self.known = set(self.manifest.speakers)
+        # The files of the speakers waiting to settle, and of the ones that couldn't be loaded
+        self.pending = {}
+        self.failed = {}
+        self._source_mtime = None
+
+    def _arrived(self):
+        """Index the new speakers, returning the ones ready to be added."""
+        source_index = setupam.source.scan_source(self.source, skip=self.known)
+        self.failed = {spk_name: files for spk_name, files in self.failed.items() if spk_name in source_index}
+        ready, pending = {}, {}
+        for spk_name, index in source_index.items():
+            files = index.files(self.source)
+            if self.failed.get(spk_name) == files:
+                continue
+            if self.settle and self.pending.get(spk_name) != files:
+                pending[spk_name] = files  # Still arriving, or seen for the first time
+            else:
+                ready[spk_name] = index
+        self.pending = pending
+        return ready
+
+    def poll(self):
+        """Add the speakers that arrived since the last poll and return their names.
+
+        When some of their audios can't be placed, a setupam.corpus.CopyError is raised once the others are added.
+        The failed audios are left out of the fileids and transcription files but kept in the manifest, so the next
+        build places them.
+        """
+        source_mtime = os.stat(self.source).st_mtime_ns
+        # The files added to the directory of a speaker that couldn't be loaded don't change the source's mtime
+        if source_mtime == self._source_mtime and not self.pending and not self.failed:
+            return []
+        self._source_mtime = source_mtime
+        speakers = []
+        for spk_name, index in sorted(self._arrived().items()):
+            self.manifest.scan(self.source, spk_name, index)
+            root = self.staging if isinstance(index, setupam.source.ArchiveIndex) else self.source
+            try:
+                speakers.append(setupam.build.read_speaker(spk_name, os.path.join(root, spk_name), index,
+                                                           encoding_cache=self.encoding_cache, metrics=self.metrics))
+                self.failed.pop(spk_name, None)
+            except (ValueError, OSError) as e:
+                logging.warning('Could not load the speaker {}, skipping it until it changes: {}'.format(spk_name, e))
+                self.failed[spk_name] = self.manifest.scans.pop(spk_name)
+        if not speakers:
+            return []
+        corpus = setupam.corpus.Corpus(self.model, self.target, src_path=self.source)
+        corpus.suffix, corpus.append = self.split, True
+        corpus.manifest, corpus.staging = self.manifest, self.staging
+        corpus.copy_workers, corpus.materialize = self.copy_workers, self.materialize
+        corpus.speaker_ids, corpus.audio_ids = self.speaker_ids, self.audio_ids
+        corpus.metrics = self.metrics
+        corpus.set_up()
+        for speaker in speakers:
+            corpus.add_speaker(speaker)
+        copy_errors = corpus.compile_corpus()
+        self.manifest.store()
+        self.encoding_cache.store()
+        shutil.rmtree(self.staging, ignore_errors=True)
+        names = [speaker.name for speaker in speakers]
+        self.known.update(names)
+        logging.info('Added {} speakers to the {} corpus: {}.'.format(len(names), self.split, ', '.join(names)))
+        if copy_errors:
+            raise setupam.corpus.CopyError(copy_errors)
+        return names
+
+    def run(self, interval=2., polls=None):
+        """Poll every interval seconds, forever or the given number of polls.
+
+        The copy failures and the I/O errors of a poll are logged, and the watch goes on.
+        """
+        count = 0
+        while polls is None or count < polls:
+            started = time.monotonic()
+            try:
+                self.poll()
+            except setupam.corpus.CopyError as e:
+                # The failures were logged one by one by the corpus
+                logging.error('{} Run a build to place them.'.format(e))
+            except OSError as e:
+                logging.error('The poll failed, trying again in {}s: {}'.format(interval, e))
+            count += 1
+            if polls is None or count < polls:
+                time.sleep(max(0., interval - (time.monotonic() - started)))
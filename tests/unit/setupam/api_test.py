@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import concurrent.futures
+import errno
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock as mk
+
+import setupam.api
+import setupam.build
+import setupam.io
+import setupam.source
+import setupam.speaker
+from tests.unit.setupam.archive_test import create_archive
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class ApiTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = os.path.join(tmp_dir.name, 'src')
+        self.target = os.path.join(tmp_dir.name, 'target')
+        create_speaker(self.src, 'spk0', [('001', 'Um, dois'), ('002', 'dois')])
+        create_archive(self.src, 'spk1', [('001', 'três')])
+        create_speaker(self.src, 'spk2', [('001', 'quatro'), ('002', 'cinco')])
+
+    @mk.patch('logging.basicConfig')
+    def test_build(self, mock_basic_config):
+        result = setupam.api.build(setupam.api.BuildConfig(self.src, 'model', self.target, ratio=0.3, copy_workers=0))
+        mock_basic_config.assert_not_called()
+        self.assertTrue(result.ok)
+        self.assertEqual(result.corpus_path, os.path.join(self.target, 'model'))
+        self.assertEqual(sum(result.speakers.values()), 3)
+        self.assertEqual(sum(result.utterances.values()), 5)
+        self.assertEqual(result.metrics['counters']['audio_files'], 5)
+        self.assertIsNone(setupam.speaker.SpeakerFileReader.encoding_cache)
+
+    def test_concurrent_builds_keep_their_metrics(self):
+        started = threading.Barrier(3, timeout=10)
+        build_corpus = setupam.build.build_corpus
+
+        def concurrent_build(**kwargs):
+            started.wait()  # Every build is running before any of them starts its work
+            return build_corpus(**kwargs)
+
+        configs = [setupam.api.BuildConfig(self.src, 'model', self.target + str(i), copy_workers=0) for i in range(3)]
+        with mk.patch('setupam.build.build_corpus', side_effect=concurrent_build), \
+                concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            results = [future.result() for future in [executor.submit(setupam.api.build, config) for config in configs]]
+        self.assertEqual([result.metrics['counters']['audio_files'] for result in results], [5, 5, 5])
+        self.assertEqual([result.metrics['counters']['speakers'] for result in results], [3, 3, 3])
+
+    def test_failed_audios_are_not_counted(self):
+        failed = os.path.join(self.src, 'spk0', 'wav', '001.wav')
+
+        def materialize(src, dst, *args, **kwargs):
+            if src == failed:
+                raise OSError(errno.EIO, 'Input/output error', src)
+            shutil.copy2(src, dst)
+
+        with mk.patch('setupam.io.materialize_file', side_effect=materialize):
+            result = setupam.api.build(setupam.api.BuildConfig(self.src, 'model', self.target, copy_workers=0))
+        self.assertFalse(result.ok)
+        self.assertEqual(sum(result.utterances.values()), 4)
+
+    def test_iter_utterances_is_lazy(self):
+        with mk.patch('setupam.build.read_speaker', wraps=setupam.build.read_speaker) as mock_read, \
+                mk.patch('setupam.source.SpeakerIndex.scan', wraps=setupam.source.SpeakerIndex.scan) as mock_scan:
+            utterances = setupam.api.iter_utterances(self.src, setupam.io.DEFAULT_NORMALIZER)
+            first = next(utterances)
+            self.assertEqual(mock_read.call_count, 1)
+            self.assertEqual(mock_scan.call_count, 1)
+            rest = list(utterances)
+        self.assertEqual(first, (1, 1, os.path.join(self.src, 'spk0', 'wav', '001.wav'), 'dois'))
+        self.assertEqual([(spk_id, audio_id, transcript) for spk_id, audio_id, _, transcript in rest],
+                         [(1, 2, 'dois'), (2, 3, 'três'), (3, 4, 'quatro'), (3, 5, 'cinco')])
+        # The audios extracted from the archive are removed with the generator
+        self.assertFalse(os.path.exists(rest[1][2]))
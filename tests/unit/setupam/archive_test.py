@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock as mk
+
+import setupam.archive
+import setupam.build
+import setupam.cli
+import setupam.manifest
+import setupam.source
+from tests.unit.setupam.cli_test import create_speaker
+
+
+def create_archive(src, name, prompts):
+    """Pack a speaker created by create_speaker in src/name.tgz, removing its directory."""
+    spk_path = os.path.join(src, name)
+    create_speaker(src, name, prompts)
+    with open(os.path.join(spk_path, 'etc', 'README'), mode='wb') as f:
+        f.write('User Name:josé\nGender: Masculino\n'.encode('utf-16'))
+    with tarfile.open(os.path.join(src, '{}.tgz'.format(name)), mode='w:gz') as archive:
+        archive.add(spk_path, arcname=name)
+    shutil.rmtree(spk_path)
+
+
+class LoadArchiveTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = os.path.join(tmp_dir.name, 'src')
+        self.staging = os.path.join(tmp_dir.name, 'staging', 'spk1')
+        create_archive(self.src, 'spk1', [('001', 'Um'), ('002', 'dois')])
+
+    def test_prompts_file(self):
+        speaker = setupam.archive.load_speaker(
+            'spk1', os.path.join(self.src, 'spk1.tgz'), self.staging, metadata=True)
+        self.assertEqual(dict(speaker.prompts), {'001': 'um', '002': 'dois'})
+        self.assertEqual([audio.path for audio in speaker.audios],
+                         [os.path.join(self.staging, 'wav', '{}.wav'.format(i)) for i in ('001', '002')])
+        self.assertTrue(all(os.path.exists(audio.path) for audio in speaker.audios))
+        self.assertEqual(speaker.metadata['USERNAME'], 'josé')
+
+    def test_transcription_files(self):
+        spk_path = os.path.join(self.src, 'spk2')
+        os.makedirs(spk_path)
+        for audio_id, prompt in (('a', 'Três'), ('b', 'quatro')):
+            with open(os.path.join(spk_path, '{}.wav'.format(audio_id)), mode='wb') as f:
+                f.write(b'RIFF')
+            with open(os.path.join(spk_path, '{}.txt'.format(audio_id)), mode='wb') as f:
+                f.write('{}\n'.format(prompt).encode('utf-8'))
+        with tarfile.open(os.path.join(self.src, 'spk2.tar.gz'), mode='w:gz') as archive:
+            archive.add(spk_path, arcname='spk2')
+        shutil.rmtree(spk_path)
+        speaker = setupam.archive.load_speaker('spk2', os.path.join(self.src, 'spk2.tar.gz'), self.staging)
+        self.assertEqual(dict(speaker.prompts), {'a': 'três', 'b': 'quatro'})
+        self.assertEqual([audio.name for audio in speaker.audios], ['a', 'b'])
+
+    def test_scan_prefers_directories(self):
+        create_speaker(self.src, 'spk1', [('001', 'um')])
+        create_archive(self.src, 'spk3', [('001', 'um')])
+        index = setupam.source.scan_source(self.src)
+        self.assertIsInstance(index['spk1'], setupam.source.SpeakerIndex)
+        self.assertIsInstance(index['spk3'], setupam.source.ArchiveIndex)
+        self.assertEqual(index['spk3'].files(self.src), {'spk3.tgz': index['spk3'].stat})
+
+
+class BuildFromArchivesTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = os.path.join(tmp_dir.name, 'src')
+        self.target = os.path.join(tmp_dir.name, 'target')
+        for i in range(4):
+            create_archive(self.src, 'spk{}'.format(i), [('{:03}'.format(j), 'prompt {}'.format(j)) for j in range(2)])
+
+    def build(self, **kwargs):
+        setupam.cli.build_corpus('WARNING', 0.25, self.src, 'model', self.target, jobs=2, copy_workers=0, stats=False,
+                                 **kwargs)
+        audios = []
+        for dir_path, _, filenames in os.walk(os.path.join(self.target, 'model', 'wav')):
+            audios.extend(os.path.join(dir_path, filename) for filename in filenames)
+        return sorted(audios)
+
+    def test_build(self):
+        audios = self.build()
+        self.assertEqual(len(audios), 8)
+        self.assertFalse(os.path.exists(os.path.join(self.target, 'model', setupam.build.STAGING_DIR)))
+        mtimes = [os.stat(path).st_mtime_ns for path in audios]
+        # The unchanged archives aren't read again
+        self.assertEqual(self.build(), audios)
+        self.assertEqual([os.stat(path).st_mtime_ns for path in audios], mtimes)
+
+    def test_restored_archives_are_extracted_when_needed(self):
+        audios = self.build()
+        manifest = setupam.manifest.Manifest.load(os.path.join(self.target, 'model', 'etc', 'model.manifest'))
+        self.assertEqual(manifest.speakers['spk0']['archive'], 'spk0.tgz')
+        os.remove(audios[0])
+        with mk.patch('setupam.build._load_speaker') as mock_load, \
+                mk.patch('setupam.archive.extract_audios', wraps=setupam.archive.extract_audios) as mock_extract:
+            # Only the speaker of the missing audio is extracted again, to place it
+            self.assertEqual(self.build(), audios)
+            self.assertEqual(mock_extract.call_count, 1)
+            # The dedup reads every audio, so they're all extracted
+            metrics_path = os.path.join(self.target, 'metrics.json')
+            self.assertEqual(self.build(dedup='skip', metrics_out=metrics_path), audios)
+            mock_load.assert_not_called()
+        with open(metrics_path, mode='r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['counters']['duplicate_audios'], 7)
+        with open(audios[0], mode='rb') as f:
+            self.assertEqual(f.read(), b'RIFF')
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import math
+import os
+import struct
+import tempfile
+import unittest
+import wave
+
+import setupam.audio
+import setupam.cli
+import setupam.corpus
+import setupam.speaker
+import setupam.stats
+from tests.unit.setupam.cli_test import create_speaker
+
+
+def write_wav(file_path, sample_rate, channels, sample_width, frames):
+    with wave.open(file_path, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(sample_width)
+        f.setframerate(sample_rate)
+        f.writeframes(frames)
+
+
+def sine(sample_rate, seconds, freq=440.):
+    count = int(sample_rate * seconds)
+    return [math.sin(2 * math.pi * freq * i / sample_rate) for i in range(count)]
+
+
+class NormalizeFileTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir, name)
+
+    def test_skip_matching(self):
+        frames = struct.pack('<8h', *range(8))
+        write_wav(self.path('in.wav'), 16000, 1, 2, frames)
+        converted, size = setupam.audio.normalize_file(self.path('in.wav'), self.path('out.wav'), 'hardlink')
+        self.assertFalse(converted)
+        self.assertEqual(os.stat(self.path('in.wav')).st_ino, os.stat(self.path('out.wav')).st_ino)
+        self.assertEqual(size, os.path.getsize(self.path('in.wav')))
+
+    @unittest.skipIf(not setupam.audio.has_numpy(), 'NumPy is not installed')
+    def test_convert(self):
+        samples = sine(44100, .5)
+        # 8-bit stereo, with the tone in both channels
+        frames = bytes(int(128 + 100 * value) for value in samples for _ in range(2))
+        write_wav(self.path('in.wav'), 44100, 2, 1, frames)
+        converted, _ = setupam.audio.normalize_file(self.path('in.wav'), self.path('out.wav'), 'move')
+        self.assertTrue(converted)
+        self.assertFalse(os.path.exists(self.path('in.wav')))
+        with wave.open(self.path('out.wav'), 'rb') as f:
+            self.assertEqual((f.getnchannels(), f.getsampwidth(), f.getframerate()), (1, 2, 16000))
+            self.assertEqual(f.getnframes(), 8000)
+            out = struct.unpack('<8000h', f.readframes(8000))
+        expected = sine(16000, .5)
+        # Away from the edges of the filter, the tone is kept
+        error = max(abs(out[i] / 32768 - 100 / 128 * expected[i]) for i in range(100, 7900))
+        self.assertLess(error, .05)
+
+    @unittest.skipIf(not setupam.audio.has_numpy(), 'NumPy is not installed')
+    def test_decode_24_bits(self):
+        frames = b''.join(value.to_bytes(3, 'little', signed=True) for value in (-8388608, -1, 0, 8388607))
+        decoded = setupam.audio._decode(frames, 3)
+        self.assertEqual(list(decoded), [-1., -1 / 8388608, 0., 8388607 / 8388608])
+
+
+class CompileConvertTest(unittest.TestCase):
+    def test_process_pool(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        src = os.path.join(tmp_dir.name, 'src')
+        os.makedirs(src)
+        speaker = setupam.speaker.Speaker('spk')
+        speaker.audios = setupam.speaker.Audios()
+        speaker.prompts = setupam.speaker.Prompts()
+        for name in ('a', 'b'):
+            write_wav(os.path.join(src, name + '.wav'), 16000, 1, 2, b'\x00\x00' * 16)
+            speaker.audios.append(setupam.speaker.Audio.from_path(os.path.join(src, name + '.wav')))
+            speaker.prompts[name] = 'prompt'
+        corpus = setupam.corpus.Corpus('model', os.path.join(tmp_dir.name, 'target'), src_path=src)
+        corpus.suffix = setupam.corpus.Corpus.TRAIN_SUFFIX
+        corpus.convert_audio, corpus.convert_workers = True, 2
+        corpus.set_up()
+        corpus.add_speaker(speaker)
+        self.assertEqual(corpus.compile_corpus(), [])
+        spk_dir = os.path.join(corpus.corpus_path, 'wav', os.listdir(os.path.join(corpus.corpus_path, 'wav'))[0])
+        self.assertEqual(len(os.listdir(spk_dir)), 2)
+
+    @unittest.skipIf(not setupam.audio.has_numpy(), 'NumPy is not installed')
+    def test_turning_normalization_on_places_the_audios_again(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        src, target = os.path.join(tmp_dir.name, 'src'), os.path.join(tmp_dir.name, 'target')
+        for name in ('spk0', 'spk1'):
+            create_speaker(src, name, [('001', 'um')])
+            write_wav(os.path.join(src, name, 'wav', '001.wav'), 8000, 1, 2, b'\x00\x00' * 80)
+
+        def sample_rates(normalize_audio):
+            setupam.cli.build_corpus('WARNING', 0.5, src, 'model', target, copy_workers=0, stats=False,
+                                     normalize_audio=normalize_audio, audio_workers=1)
+            wav_path = os.path.join(target, 'model', 'wav')
+            return sorted(setupam.stats.read_header(os.path.join(wav_path, spk, audio)).sample_rate
+                          for spk in os.listdir(wav_path) for audio in os.listdir(os.path.join(wav_path, spk)))
+
+        self.assertEqual(sample_rates(False), [8000, 8000])
+        self.assertEqual(sample_rates(True), [16000, 16000])
+        self.assertEqual(sample_rates(False), [8000, 8000])
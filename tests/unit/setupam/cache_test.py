@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+import unittest
+
+import setupam.cache
+
+
+class StatCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_path = os.path.join(tmp_dir.name, 'cache')
+        self.file_path = os.path.join(tmp_dir.name, 'file')
+        with open(self.file_path, mode='w') as f:
+            f.write('content')
+
+    def test_persistence(self):
+        cache = setupam.cache.StatCache.load(self.cache_path)
+        self.assertIsNone(cache.get(self.file_path))
+        cache.set(self.file_path, 'ISO-8859-1')
+        cache.store()
+        cache = setupam.cache.StatCache.load(self.cache_path)
+        self.assertEqual(cache.get(self.file_path), 'ISO-8859-1')
+
+    def test_invalidated_by_changes(self):
+        cache = setupam.cache.StatCache()
+        cache.set(self.file_path, 'ISO-8859-1')
+        with open(self.file_path, mode='a') as f:
+            f.write(' changed')
+        self.assertIsNone(cache.get(self.file_path))
+
+    def test_updates(self):
+        worker_cache, cache = setupam.cache.StatCache(), setupam.cache.StatCache()
+        worker_cache.set(self.file_path, 'ascii')
+        cache.update(worker_cache.pop_updates())
+        self.assertEqual(cache.get(self.file_path), 'ascii')
+        self.assertEqual(worker_cache.pop_updates(), {})
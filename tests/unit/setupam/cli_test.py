@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+import unittest
+
+import setupam.build
+import setupam.cli
+import setupam.corpus
+
+
+def create_speaker(src, name, prompts):
+    os.makedirs(os.path.join(src, name, 'wav'))
+    os.makedirs(os.path.join(src, name, 'etc'))
+    with open(os.path.join(src, name, 'etc', 'prompts-original'), mode='w', encoding='utf-8') as f:
+        for audio_id, prompt in prompts:
+            f.write('{} {}\n'.format(audio_id, prompt))
+            with open(os.path.join(src, name, 'wav', '{}.wav'.format(audio_id)), mode='wb') as audio:
+                audio.write(b'RIFF')
+
+
+class LoadSpeakerContentTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = tmp_dir.name
+        self.names = ['spk{}'.format(i) for i in range(5)]
+        for i, name in enumerate(self.names):
+            create_speaker(self.src, name, [('{:03}'.format(j), 'prompt {} {}'.format(i, j)) for j in range(3)])
+
+    def load(self, jobs):
+        corpus = setupam.corpus.Corpus('test', self.src, src_path=self.src)
+        setupam.build.load_spk_content(corpus, self.names, jobs)
+        return [(spk.name, dict(spk.prompts), sorted(spk.audios)) for _, spk in corpus.speakers]
+
+    def test_parallel_matches_serial(self):
+        serial = self.load(1)
+        self.assertEqual([name for name, _, _ in serial], self.names)
+        self.assertEqual(self.load(2), serial)
+        self.assertEqual(self.load(0), serial)
+
+
+class BuildCorpusTest(unittest.TestCase):
+    def test_parts_get_sequential_ids(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src, target = os.path.join(tmp_dir, 'src'), os.path.join(tmp_dir, 'target')
+            for i in range(4):
+                create_speaker(src, 'spk{}'.format(i), [('{:03}'.format(j), 'prompt {}'.format(j)) for j in range(2)])
+            setupam.cli.build_corpus('WARNING', 0.25, src, 'model', target, copy_workers=2)
+            audio_ids = []
+            for suffix in ('train', 'test'):
+                with open(os.path.join(target, 'model', 'etc', 'model_{}.fileids'.format(suffix))) as f:
+                    audio_ids += [int(line.rsplit('_', 1)[1]) for line in f.read().splitlines()]
+        # The test corpus continues the IDs of the train one, as if they were compiled one after the other
+        self.assertEqual(audio_ids, list(range(1, 9)))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import concurrent.futures
+import os
+import tempfile
+import unittest
+
+import setupam.corpus
+import setupam.speaker
+
+
+class IdAllocatorTest(unittest.TestCase):
+    def test_reserve(self):
+        ids = setupam.corpus.IdAllocator(5)
+        reserved = ids.reserve(2)
+        self.assertEqual(next(ids), 7)
+        self.assertEqual([next(reserved), next(reserved)], [5, 6])
+
+    def test_exhausted(self):
+        ids = setupam.corpus.IdAllocator(1, 2)
+        next(ids)
+        with self.assertRaises(ValueError):
+            next(ids)
+        with self.assertRaises(ValueError):
+            ids.reserve(1)
+
+    def test_threads(self):
+        ids = setupam.corpus.IdAllocator()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            values = list(executor.map(lambda _: next(ids), range(1000)))
+        self.assertEqual(sorted(values), list(range(1, 1001)))
+
+
+class CompileCorpusTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp = tmp_dir.name
+        self.audios = []
+        for name in ('001', '002', '003'):
+            audio_path = os.path.join(self.tmp, '{}.wav'.format(name))
+            with open(audio_path, mode='wb') as f:
+                f.write(b'RIFF' + name.encode())
+            self.audios.append(audio_path)
+        self.speaker = setupam.speaker.Speaker('spk')
+        self.speaker.audios = setupam.speaker.Audios()
+        self.speaker.audios.populate(self.tmp, 'wav')
+        self.speaker.prompts = setupam.speaker.Prompts({'001': 'um', '002': 'dois', '003': 'três'})
+        self.corpus = setupam.corpus.Corpus('model', self.tmp)
+        self.corpus.suffix = setupam.corpus.Corpus.TRAIN_SUFFIX
+        self.corpus.set_up()
+        self.corpus.add_speaker(self.speaker)
+
+    def read_metadata(self, ext):
+        filename = self.corpus.format_filename(self.corpus.suffix, ext)
+        with open(os.path.join(self.corpus.corpus_path, 'etc', filename), encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_compile(self):
+        self.assertEqual(self.corpus.compile_corpus(), [])
+        fileids = self.read_metadata(setupam.corpus.Corpus.FILEID_EXT)
+        self.assertEqual(len(fileids), 3)
+        self.assertEqual(len(self.read_metadata(setupam.corpus.Corpus.TRANSCRIPT_EXT)), 3)
+        for fileid in fileids:
+            self.assertTrue(os.path.exists(os.path.join(self.corpus.corpus_path, 'wav', fileid + '.wav')))
+
+    def test_copy_errors_are_collected(self):
+        os.remove(self.audios[1])
+        errors = self.corpus.compile_corpus()
+        self.assertEqual([src for src, _, _ in errors], [self.audios[1]])
+        # The metadata of the audio that couldn't be copied is left out
+        fileids = self.read_metadata(setupam.corpus.Corpus.FILEID_EXT)
+        self.assertEqual(len(fileids), 2)
+        self.assertEqual(len(self.read_metadata(setupam.corpus.Corpus.TRANSCRIPT_EXT)), 2)
+        for fileid in fileids:
+            self.assertTrue(os.path.exists(os.path.join(self.corpus.corpus_path, 'wav', fileid + '.wav')))
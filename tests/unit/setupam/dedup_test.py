@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+import unittest
+from unittest import mock as mk
+
+import setupam.cache
+import setupam.cli
+import setupam.dedup
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class FindDuplicatesTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.paths = []
+        for name, content in (('a', b'same'), ('b', b'diff'), ('c', b'same'), ('d', b'longer'), ('e', b''),
+                              ('f', b'')):
+            self.paths.append(os.path.join(tmp_dir.name, name))
+            with open(self.paths[-1], mode='wb') as f:
+                f.write(content)
+        self.cache = setupam.cache.StatCache(os.path.join(tmp_dir.name, 'hashes'))
+
+    def test_duplicates(self):
+        a, b, c, d, e, f = self.paths
+        duplicates = setupam.dedup.find_duplicates(self.paths + [a + '.missing'], 2, self.cache)
+        self.assertEqual(duplicates, {c: a, f: e})
+
+    @mk.patch('setupam.dedup.file_hash', wraps=setupam.dedup.file_hash)
+    def test_size_prefilter_and_cache(self, file_hash):
+        setupam.dedup.find_duplicates(self.paths, 1, self.cache)
+        # The file of a unique size is never hashed
+        self.assertNotIn(mk.call(self.paths[3]), file_hash.call_args_list)
+        self.assertEqual(file_hash.call_count, 5)
+        file_hash.reset_mock()
+        self.assertEqual(len(setupam.dedup.find_duplicates(self.paths, 1, self.cache)), 2)
+        file_hash.assert_not_called()
+
+
+class BuildDedupTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = os.path.join(tmp_dir.name, 'src')
+        self.target = os.path.join(tmp_dir.name, 'target')
+        for i in range(4):
+            create_speaker(self.src, 'spk{}'.format(i), [('001', 'um'), ('002', 'dois')])
+            with open(os.path.join(self.src, 'spk{}'.format(i), 'wav', '002.wav'), mode='wb') as f:
+                f.write('unique {}'.format(i).encode())
+
+    def build(self, dedup):
+        setupam.cli.build_corpus('WARNING', 0.25, self.src, 'model', self.target, copy_workers=0, stats=False,
+                                 dedup=dedup, rebuild=True)
+        fileids = []
+        for part in ('train', 'test'):
+            with open(os.path.join(self.target, 'model', 'etc', 'model_{}.fileids'.format(part))) as f:
+                fileids.extend(line.strip() for line in f)
+        return fileids
+
+    def test_skip(self):
+        self.assertEqual(len(self.build('skip')), 5)
+        with open(os.path.join(self.target, 'model', 'etc', 'model.duplicates')) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_link(self):
+        fileids = self.build('link')
+        self.assertEqual(len(fileids), 8)
+        inodes = {os.stat(os.path.join(self.target, 'model', 'wav', fileid + '.wav')).st_ino for fileid in fileids}
+        self.assertEqual(len(inodes), 5)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+# The modules only some code paths need, which the command line must not import on startup
+LAZY_MODULES = ('chardet', 'numpy', 'cProfile')
+
+
+def import_times(module):
+    """Map the modules imported by module, in a fresh interpreter, to their cumulative import time.
+
+    The time itself depends on the machine, so it's measured against its budget by benchmarks.import_bench.
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)], cwd=ROOT,
+                             stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+class ImportTimeTest(unittest.TestCase):
+    def test_cli_imports(self):
+        times = import_times('setupam.cli')
+        self.assertIn('setupam.cli', times)
+        loaded = sorted(name for name in times if name.split('.')[0] in LAZY_MODULES)
+        self.assertEqual(loaded, [])
@@ -4,7 +4,10 @@ Unauthorized copying of this file, via any medium is strictly prohibited
 Proprietary and confidential
 File created by Gabriel Araujo <gabrielaraujof@outlook.com>, Agosto 2015
 """
+import errno
 from os import path
+import re
+import tempfile
 import unittest
 from unittest import mock as mk
 
@@ -28,3 +31,126 @@ class FileWriterTest(unittest.TestCase):
         fileid = setupam.io.FileidWriter('test')
         fileid.add_content(*text)
         self.assertEqual(fileid.content.getvalue(), '{0}/{1}'.format(*text) + '\n')
+
+    def test_streaming(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = path.join(tmp_dir, 'test.fileids')
+            fileid = setupam.io.FileidWriter(file_path, streaming=True, flush_every=2)
+            for i in range(3):
+                fileid.add_content('spk', i)
+            self.assertFalse(path.exists(file_path))
+            with open(fileid.tmp_file) as f:
+                self.assertEqual(f.read(), 'spk/0\nspk/1\n')  # Flushed every two lines
+            fileid.store()
+            self.assertFalse(path.exists(fileid.tmp_file))
+            with open(file_path) as f:
+                self.assertEqual(f.read(), 'spk/0\nspk/1\nspk/2\n')
+
+    def test_append(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = path.join(tmp_dir, 'test.fileids')
+            with open(file_path, mode='w') as f:
+                f.write('spk/0\n')
+            fileid = setupam.io.FileidWriter(file_path, append=True)
+            fileid.add_content('spk', 1)
+            fileid.store()
+            with open(file_path) as f:
+                self.assertEqual(f.read(), 'spk/0\nspk/1\n')
+        with self.assertRaises(ValueError):
+            setupam.io.FileidWriter(file_path, streaming=True, append=True)
+
+    def test_filter(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for streaming in (False, True):
+                file_path = path.join(tmp_dir, 'test.fileids')
+                fileid = setupam.io.FileidWriter(file_path, streaming=streaming)
+                for i in range(3):
+                    fileid.add_content('spk', i)
+                fileid.filter(lambda line: line != 'spk/1')
+                fileid.add_content('spk', 3)
+                fileid.store()
+                with open(file_path) as f:
+                    self.assertEqual(f.read(), 'spk/0\nspk/2\nspk/3\n')
+
+
+class TranscriptNormalizerTest(unittest.TestCase):
+    prompts = ["vou tomar um pouquinho d'água.", 'para onde, a senhora quer ir?', 'que horas são', '']
+
+    def test_matches_legacy_substitution(self):
+        for cache_size in (0, 16):
+            normalizer = setupam.io.TranscriptNormalizer(cache_size=cache_size)
+            for prompt in self.prompts:
+                self.assertEqual(normalizer.normalize(prompt), re.sub(r'\S*[,.?!]+\S*', ' ', prompt))
+                self.assertEqual(normalizer.normalize(prompt.upper()), normalizer.normalize(prompt))
+
+    def test_batch(self):
+        normalizer = setupam.io.TranscriptNormalizer()
+        self.assertEqual(normalizer.normalize_batch(self.prompts), [normalizer.normalize(p) for p in self.prompts])
+
+    def test_custom_rules(self):
+        normalizer = setupam.io.TranscriptNormalizer(rules=[(r'\s+', ' ')], lower=False)
+        self.assertEqual(normalizer.normalize('Que   horas'), 'Que horas')
+        self.assertEqual(setupam.io.transcription_formatter('Que   horas', 'id', normalizer=normalizer),
+                         '<s> Que horas </s> (id)')
+
+
+class CopyPoolTest(unittest.TestCase):
+
+    def test_copies_and_collects_errors(self):
+        copied = []
+
+        def copy_func(src, dst):
+            if src == 'bad':
+                raise OSError(5, 'Input/output error', src)
+            copied.append((src, dst))
+
+        for workers in (0, 2):
+            del copied[:]
+            with setupam.io.CopyPool(workers, queue_depth=1) as pool:
+                for src in ('a', 'bad', 'b'):
+                    pool.submit(copy_func, src, src + '.new')
+            self.assertEqual(sorted(copied), [('a', 'a.new'), ('b', 'b.new')])
+            self.assertEqual([(src, dst) for src, dst, _ in pool.errors], [('bad', 'bad.new')])
+
+    def test_other_failures_are_collected(self):
+        def copy_func(src, dst):
+            raise KeyError(src)
+
+        for workers in (0, 2):
+            with setupam.io.CopyPool(workers) as pool:
+                pool.submit(copy_func, 'a', 'a.new')
+            self.assertEqual(len(pool.errors), 1)
+            self.assertEqual(pool.errors[0][2].errno, errno.EIO)
+
+
+class MaterializeFileTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = path.join(tmp_dir.name, 'src.wav')
+        self.dst = path.join(tmp_dir.name, 'dst.wav')
+        with open(self.src, mode='wb') as f:
+            f.write(b'RIFF')
+
+    def read_dst(self):
+        with open(self.dst, mode='rb') as f:
+            return f.read()
+
+    def test_modes(self):
+        for mode in sorted(setupam.io.MATERIALIZERS):
+            setupam.io.materialize_file(self.src, self.dst, mode)
+            self.assertEqual(self.read_dst(), b'RIFF')
+        setupam.io.materialize_file(self.src, self.dst, 'hardlink')
+        self.assertTrue(path.samefile(self.src, self.dst))
+        setupam.io.materialize_file(self.src, self.dst, 'symlink')
+        self.assertTrue(path.islink(self.dst))
+
+    def test_falls_back_to_copy(self):
+        def cross_device(src, dst):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link', dst)
+
+        with mk.patch.dict(setupam.io.MATERIALIZERS, {'hardlink': cross_device}):
+            setupam.io.materialize_file(self.src, self.dst, 'hardlink')
+        self.assertFalse(path.samefile(self.src, self.dst))
+        self.assertEqual(self.read_dst(), b'RIFF')
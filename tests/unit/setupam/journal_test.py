@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock as mk
+
+import setupam.cli
+import setupam.io
+import setupam.journal
+import setupam.manifest
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.journal_path = os.path.join(tmp_dir.name, 'journal')
+
+    def test_replay(self):
+        journal = setupam.journal.Journal(self.journal_path).open()
+        files = {'spk/wav/a.wav': [4, 1], 'spk/wav/b.wav': [4, 1]}
+        journal.speaker('spk', 7, 'train', files)
+        journal.speaker('gone', 8, 'train', {})
+        journal.assigned('spk', 11, 'spk/wav/a.wav', 'wav', 'um')
+        journal.assigned('spk', 12, 'spk/wav/b.wav', 'wav', 'dois')
+        journal.placed('spk', 'spk/wav/a.wav')
+        journal.close()
+        with open(self.journal_path, mode='a', encoding='utf-8') as f:
+            f.write('["p","spk","spk/w')  # Cut by the interruption
+        manifest = setupam.manifest.Manifest(None)
+        manifest.scans['spk'] = files
+        self.assertEqual(setupam.journal.replay(self.journal_path, manifest, ['spk']), 1)
+        self.assertEqual(sorted(manifest.speakers), ['spk'])
+        self.assertFalse(manifest.is_unchanged('spk'))
+        self.assertEqual(manifest.speaker_id('spk'), 7)
+        self.assertEqual(manifest.utterances('spk'), {'spk/wav/a.wav': (11, True), 'spk/wav/b.wav': (12, False)})
+        self.assertEqual(manifest.max_ids(), (7, 12))
+
+
+class ResumeBuildTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = os.path.join(tmp_dir.name, 'src')
+        self.target = os.path.join(tmp_dir.name, 'target')
+        for i in range(4):
+            create_speaker(self.src, 'spk{}'.format(i), [('001', 'um'), ('002', 'dois')])
+
+    def build(self, resume=False):
+        setupam.cli.build_corpus('WARNING', 0.25, self.src, 'model', self.target, copy_workers=0, stats=False,
+                                 resume=resume)
+
+    def fileids(self):
+        fileids = []
+        for part in ('train', 'test'):
+            with open(os.path.join(self.target, 'model', 'etc', 'model_{}.fileids'.format(part))) as f:
+                fileids.extend(line.strip() for line in f)
+        return fileids
+
+    def test_resume(self):
+        materialize_file = setupam.io.materialize_file
+        placed = []
+
+        self.build()
+        uninterrupted = self.fileids()
+        shutil.rmtree(self.target)
+
+        def interrupted(src, dst, mode='copy'):
+            # The two parts are compiled concurrently, so the count can go past 3 between two checks
+            if len(placed) >= 3:
+                raise KeyboardInterrupt
+            materialize_file(src, dst, mode)
+            placed.append(os.path.relpath(dst, os.path.join(self.target, 'model', 'wav')))
+
+        with mk.patch('setupam.io.materialize_file', side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.build()
+        journal_path = os.path.join(self.target, 'model', 'etc', 'model.journal')
+        self.assertTrue(os.path.exists(journal_path))
+        with mk.patch('setupam.io.materialize_file', wraps=materialize_file) as resumed:
+            self.build(resume=True)
+        self.assertEqual(resumed.call_count, 8 - len(placed))
+        fileids = self.fileids()
+        self.assertEqual(len(fileids), 8)
+        for path in placed:
+            self.assertIn(os.path.splitext(path)[0], fileids)
+        # The audios the interrupted build didn't reach get the IDs they would have had
+        self.assertEqual(fileids, uninterrupted)
+        self.assertFalse(os.path.exists(journal_path))
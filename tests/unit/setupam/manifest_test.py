@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock as mk
+
+import setupam.build
+import setupam.cli
+import setupam.manifest
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = os.path.join(tmp_dir.name, 'src')
+        self.target = os.path.join(tmp_dir.name, 'target')
+        for i in range(4):
+            create_speaker(self.src, 'spk{}'.format(i), [('{:03}'.format(j), 'prompt {}'.format(j)) for j in range(2)])
+
+    def build(self):
+        setupam.cli.build_corpus('WARNING', 0.25, self.src, 'model', self.target, copy_workers=0)
+
+    def read_metadata(self):
+        lines = {}
+        for suffix in ('train', 'test'):
+            for ext in ('fileids', 'transcription'):
+                with open(os.path.join(self.target, 'model', 'etc', 'model_{}.{}'.format(suffix, ext))) as f:
+                    lines[suffix, ext] = f.read()
+        return lines
+
+    def test_rebuild_is_incremental(self):
+        self.build()
+        first = self.read_metadata()
+        manifest = setupam.manifest.Manifest.load(os.path.join(self.target, 'model', 'etc', 'model.manifest'))
+        self.assertEqual(len(manifest.speakers), 4)
+
+        with mk.patch('setupam.build._load_speaker') as mock_load, mk.patch('setupam.io.materialize_file') as mock_copy:
+            self.build()
+            mock_load.assert_not_called()
+            mock_copy.assert_not_called()
+        self.assertEqual(self.read_metadata(), first)
+
+        create_speaker(self.src, 'spk9', [('001', 'novo')])
+        self.build()
+        second = self.read_metadata()
+        for key, content in first.items():
+            self.assertTrue(second[key].startswith(content))
+        manifest = setupam.manifest.Manifest.load(manifest.file)
+        self.assertEqual(manifest.speaker_id('spk9'), 5)
+        self.assertEqual(manifest.speakers['spk9']['utterances'][0][0], 9)
+
+    def test_changed_speaker_is_reloaded(self):
+        self.build()
+        manifest = setupam.manifest.Manifest.load(os.path.join(self.target, 'model', 'etc', 'model.manifest'))
+        ids = {name: manifest.speaker_id(name) for name in manifest.speakers}
+        with open(os.path.join(self.src, 'spk1', 'wav', '000.wav'), mode='ab') as f:
+            f.write(b'data')
+        with mk.patch('setupam.build._load_speaker', wraps=setupam.build._load_speaker) as mock_load:
+            self.build()
+            self.assertEqual(mock_load.call_count, 1)
+        manifest = setupam.manifest.Manifest.load(manifest.file)
+        self.assertEqual({name: manifest.speaker_id(name) for name in manifest.speakers}, ids)
+
+    def test_ids_of_removed_speakers_are_not_reused(self):
+        self.build()
+        manifest = setupam.manifest.Manifest.load(os.path.join(self.target, 'model', 'etc', 'model.manifest'))
+        last_name = max(manifest.speakers, key=manifest.speaker_id)
+        last_ids = manifest.max_ids()
+        shutil.rmtree(os.path.join(self.src, last_name))
+        create_speaker(self.src, 'spk9', [('001', 'novo')])
+        self.build()
+        manifest = setupam.manifest.Manifest.load(manifest.file)
+        self.assertNotIn(last_name, manifest.speakers)
+        self.assertEqual(manifest.speaker_id('spk9'), last_ids[0] + 1)
+        self.assertEqual(manifest.speakers['spk9']['utterances'][0][0], last_ids[1] + 1)
+        # The audios of the removed speaker are deleted with it
+        self.assertFalse(os.path.exists(os.path.join(self.target, 'model', 'wav', '{:06}'.format(last_ids[0]))))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+import unittest
+from unittest import mock as mk
+
+import setupam.cli
+import setupam.io
+import setupam.manifest
+import setupam.merge
+import setupam.split
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class ShardedBuildTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp = tmp_dir.name
+        self.src = os.path.join(self.tmp, 'src')
+        self.names = ['spk{}'.format(i) for i in range(8)]
+        for i, name in enumerate(self.names):
+            create_speaker(self.src, name, [('{:03}'.format(j), 'prompt {} {}'.format(i, j)) for j in range(2)])
+        self.parts = [os.path.join(self.tmp, 'part{}'.format(i)) for i in range(3)]
+        for i, part in enumerate(self.parts):
+            setupam.cli.build_corpus('WARNING', 0.3, self.src, 'model', part, copy_workers=0, stats=False, seed=5,
+                                     shard=(i, len(self.parts)))
+
+    def read(self, target, filename):
+        with open(os.path.join(target, 'model', 'etc', filename), encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def manifest(self, target):
+        return setupam.manifest.Manifest.load(os.path.join(target, 'model', 'etc', 'model.manifest'))
+
+    def test_shards_partition_the_speakers(self):
+        manifests = [self.manifest(part) for part in self.parts]
+        self.assertEqual(sorted(name for manifest in manifests for name in manifest.speakers), self.names)
+        train, test = setupam.split.hashed_split(self.names, 0.3, seed=5)
+        for manifest in manifests:
+            for name in manifest.speakers:
+                self.assertEqual(manifest.split(name), 'test' if name in test else 'train')
+
+    def test_merge(self):
+        target = os.path.join(self.tmp, 'merged')
+        self.assertEqual(setupam.merge.merge_corpora('model', target, self.parts, 'hardlink', workers=0), [])
+        fileids = self.read(target, 'model_train.fileids') + self.read(target, 'model_test.fileids')
+        transcriptions = self.read(target, 'model_train.transcription') + self.read(target, 'model_test.transcription')
+        self.assertEqual([int(fileid.rsplit('_', 1)[1]) for fileid in fileids], list(range(1, 17)))
+        self.assertEqual([fileid.split('/')[1] for fileid in fileids],
+                         [line.rsplit('(', 1)[1][:-1] for line in transcriptions])
+        self.assertEqual(sorted(line.split(' (')[0] for line in transcriptions),
+                         sorted(line.split(' (')[0] for part in self.parts for split in ('train', 'test')
+                                for line in self.read(part, 'model_{}.transcription'.format(split))))
+        manifest = self.manifest(target)
+        self.assertEqual(sorted(manifest.speakers), self.names)
+        for name, entry in manifest.speakers.items():
+            spk_repr = '{:06}'.format(entry['id'])
+            for audio_id, source, _, _ in entry['utterances']:
+                audio_path = os.path.join(target, 'model', 'wav', spk_repr, '{}_{:03}.wav'.format(spk_repr, audio_id))
+                # The audio is linked to the one of the partial corpus, not copied
+                self.assertEqual(os.stat(audio_path).st_nlink, 2)
+                self.assertIn('{0}/{0}_{1:03}'.format(spk_repr, audio_id), fileids)
+
+    def test_empty_test_part_is_warned(self):
+        parts = [os.path.join(self.tmp, 'small{}'.format(i)) for i in range(2)]
+        for i, part in enumerate(parts):
+            setupam.cli.build_corpus('WARNING', 0.1, self.src, 'model', part, copy_workers=0, stats=False, seed=2,
+                                     shard=(i, len(parts)))
+        target = os.path.join(self.tmp, 'merged')
+        with self.assertLogs(level='WARNING') as cm:
+            setupam.merge.merge_corpora('model', target, parts, workers=0)
+        self.assertIn('no test utterances', cm.output[0])
+        self.assertEqual(self.read(target, 'model_test.fileids'), [])
+
+    def test_links_across_filesystems_fail(self):
+        target = os.path.join(self.tmp, 'merged')
+        with mk.patch('setupam.merge._same_filesystem', return_value=False):
+            with self.assertRaises(ValueError):
+                setupam.merge.merge_corpora('model', target, self.parts, 'hardlink', workers=0)
+            self.assertEqual(setupam.merge.merge_corpora('model', target, self.parts, 'copy', workers=0), [])
+        # A link that can't be made is reported instead of copied
+        with mk.patch.dict(setupam.io.MATERIALIZERS, {'symlink': mk.Mock(side_effect=OSError(1, 'Not permitted'))}):
+            self.assertEqual(len(setupam.merge.merge_corpora('model', target, self.parts, 'symlink', workers=0)), 16)
+
+    def test_overlapping_parts(self):
+        with self.assertRaises(ValueError):
+            setupam.merge.merge_corpora('model', os.path.join(self.tmp, 'merged'), self.parts + self.parts[:1])
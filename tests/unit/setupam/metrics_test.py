@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import setupam.cli
+import setupam.metrics
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class MetricsTest(unittest.TestCase):
+    def test_worker_updates(self):
+        worker, parent = setupam.metrics.Metrics(), setupam.metrics.Metrics()
+        worker.count('chardet_calls', 2)
+        worker.add_time('encoding_detection', .5)
+        parent.count('chardet_calls')
+        parent.update(worker.pop_updates())
+        self.assertEqual(worker.pop_updates(), {'counters': {}, 'timers': {}})
+        report = parent.as_dict()
+        self.assertEqual(report['counters'], {'chardet_calls': 3})
+        self.assertEqual(report['timers'], {'encoding_detection': .5})
+
+    def test_phases(self):
+        metrics = setupam.metrics.Metrics()
+        with metrics.phase('scan'):
+            pass
+        with metrics.phase('compile'):
+            metrics.count('audio_files', 10)
+        report = metrics.as_dict()
+        self.assertEqual(list(report['phases']), ['scan', 'compile'])
+        self.assertIn('throughput', report)
+
+
+class ProgressTest(unittest.TestCase):
+    @mock.patch('setupam.metrics.time.perf_counter')
+    def test_rate_and_eta(self, perf_counter):
+        perf_counter.return_value = 0.
+        progress = setupam.metrics.Progress('Loading', 100, 'speakers', interval=5.)
+        perf_counter.return_value = 10.
+        with mock.patch('setupam.metrics.logging.info') as info:
+            progress.update(25)
+            progress.update(0)
+        info.assert_called_once_with('Loading: 25/100 speakers (25.0%), 2.5 speakers/s, ETA 0:00:30')
+
+
+class BuildMetricsTest(unittest.TestCase):
+    def test_metrics_out_and_profile(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        src, target = os.path.join(tmp_dir.name, 'src'), os.path.join(tmp_dir.name, 'target')
+        create_speaker(src, 'spk0', [('001', 'um'), ('002', 'dois')])
+        create_speaker(src, 'spk1', [('001', 'três')])
+        os.remove(os.path.join(src, 'spk1', 'etc', 'prompts-original'))
+        metrics_path = os.path.join(tmp_dir.name, 'metrics.json')
+        setupam.cli.main(['-l', 'WARNING', '-s', src, '-t', target, '-r', '0.5', '--copy-workers', '0', '--no-stats',
+                          '--metrics-out', metrics_path, '--profile', 'model'])
+        with open(metrics_path, encoding='utf-8') as f:
+            report = json.load(f)
+        self.assertEqual(list(report['phases']),
+                         ['scan', 'manifest', 'load', 'split', 'compile', 'manifest_store'])
+        self.assertEqual(report['counters']['speakers'], 2)
+        self.assertEqual(report['counters']['audio_files'], 2)
+        self.assertEqual(report['counters']['untranscribed_utterances'], 1)
+        self.assertTrue(os.path.exists(os.path.join(target, 'model', 'etc', 'model.prof')))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tarfile
+import tempfile
+import unittest
+
+import setupam.cli
+import setupam.shards
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class ShardWriterTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = tmp_dir.name
+        self.shard_dir = os.path.join(self.tmp_dir, 'shards')
+        self.index_path = os.path.join(self.tmp_dir, 'index')
+        self.sources = []
+        for i in range(5):
+            src = os.path.join(self.tmp_dir, '{}.wav'.format(i))
+            with open(src, mode='wb') as f:
+                f.write(bytes([i]) * (1000 + i))
+            self.sources.append(src)
+
+    def write(self, max_size):
+        with setupam.shards.ShardWriter(self.shard_dir, 'model_train', self.index_path, max_size) as writer:
+            for i, src in enumerate(self.sources):
+                writer.add(src, 'spk/{}.wav'.format(i), 'spk_{:03}'.format(i), 'Prompt, {}'.format(i))
+            writer.add(os.path.join(self.tmp_dir, 'missing.wav'), 'spk/missing.wav', 'spk_999', 'missing')
+        with open(self.index_path, encoding='utf-8') as f:
+            return writer, [line.strip() for line in f]
+
+    def test_offsets(self):
+        writer, index = self.write(4096)
+        self.assertEqual(len(writer.errors), 1)
+        self.assertEqual(len(index), 5)
+        for i, line in enumerate(index):
+            self.assertEqual(setupam.shards.read_audio(self.shard_dir, line), bytes([i]) * (1000 + i))
+        shards = sorted(os.listdir(self.shard_dir))
+        # Each audio takes 2560 bytes with its transcription, so only one fits in 4096
+        self.assertEqual(len(shards), 5)
+        with tarfile.open(os.path.join(self.shard_dir, shards[0])) as shard:
+            self.assertEqual(shard.getnames()[:2], ['spk/0.wav', 'spk/0.txt'])
+            self.assertEqual(shard.extractfile('spk/0.txt').read(), b'0\n')
+
+    def test_stale_shards(self):
+        self.write(4096)
+        self.write(1 << 20)
+        self.assertEqual(os.listdir(self.shard_dir), ['model_train-00000.tar'])
+
+
+class BuildShardsTest(unittest.TestCase):
+    def test_build(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        src, target = os.path.join(tmp_dir.name, 'src'), os.path.join(tmp_dir.name, 'target')
+        for i in range(4):
+            create_speaker(src, 'spk{}'.format(i), [('001', 'um'), ('002', 'dois')])
+        setupam.cli.build_corpus('WARNING', 0.25, src, 'model', target, copy_workers=0, output_format='shards')
+        corpus_path = os.path.join(target, 'model')
+        self.assertFalse(os.path.exists(os.path.join(corpus_path, 'wav')))
+        with open(os.path.join(corpus_path, 'etc', 'model_train.shards'), encoding='utf-8') as f:
+            index = [line.split()[0] for line in f]
+        with open(os.path.join(corpus_path, 'etc', 'model_train.fileids'), encoding='utf-8') as f:
+            fileids = [line.strip().split('/')[1] for line in f]
+        self.assertEqual(index, fileids)
+        self.assertEqual(sorted(os.listdir(os.path.join(corpus_path, 'shards'))),
+                         ['model_test-00000.tar', 'model_train-00000.tar'])
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+import unittest
+from unittest import mock as mk
+
+import setupam.source
+import setupam.speaker
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class ScanSourceTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = tmp_dir.name
+        create_speaker(self.src, 'spk1', [('001', 'um'), ('002', 'dois')])
+        create_speaker(self.src, 'spk2', [('001', 'três')])
+        os.makedirs(os.path.join(self.src, '.hidden'))
+        open(os.path.join(self.src, 'spk1', 'wav', '.003.wav'), mode='w').close()
+        self.index = setupam.source.scan_source(self.src)
+
+    def test_scan(self):
+        self.assertEqual(sorted(self.index), ['spk1', 'spk2'])
+        spk_index = self.index['spk1']
+        wav_path = os.path.join(self.src, 'spk1', 'wav')
+        self.assertEqual(
+            spk_index.track_files(wav_path, 'wav'),
+            [os.path.join(wav_path, '001.wav'), os.path.join(wav_path, '002.wav')])
+        self.assertTrue(spk_index.exists(os.path.join(self.src, 'spk1', 'etc', 'prompts-original')))
+        self.assertFalse(spk_index.exists(os.path.join(self.src, 'spk1', 'etc', 'README')))
+        self.assertEqual(
+            sorted(spk_index.files(self.src)),
+            [os.path.join('spk1', 'etc', 'prompts-original'), os.path.join('spk1', 'wav', '001.wav'),
+             os.path.join('spk1', 'wav', '002.wav')])
+
+    def test_links_are_skipped(self):
+        spk_path = os.path.join(self.src, 'spk2')
+        os.symlink(os.path.join(self.src, 'nonexistent'), os.path.join(spk_path, 'etc', 'old-link'))
+        os.symlink(spk_path, os.path.join(spk_path, 'wav', 'cycle'))
+        self.assertEqual(
+            sorted(setupam.source.SpeakerIndex.scan(spk_path).files(self.src)),
+            [os.path.join('spk2', 'etc', 'prompts-original'), os.path.join('spk2', 'wav', '001.wav')])
+
+    @mk.patch('setupam.speaker.os.path.exists', side_effect=AssertionError('Filesystem probed'))
+    @mk.patch('setupam.speaker.glob.glob', side_effect=AssertionError('Filesystem probed'))
+    def test_builder_uses_index(self, *_):
+        builder = setupam.speaker.SpeakerBuilder('spk1', os.path.join(self.src, 'spk1'), self.index['spk1'])
+        builder.set_audios()
+        builder.set_prompts()
+        self.assertEqual([audio[0] for audio in builder.speaker.audios], ['001', '002'])
+        self.assertEqual(dict(builder.speaker.prompts), {'001': 'um', '002': 'dois'})
@@ -15,11 +15,17 @@
 # You should have received a copy of the GNU General Public License along
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+import setupam.cache
 import setupam.io
 import setupam.speaker
 
 __author__ = 'Gabriel Araujo'
 
+import codecs
+import os
+import pickle
+import re
+import tempfile
 import unittest
 from unittest import mock as mk
 
@@ -45,7 +51,7 @@ class PromptsTest(unittest.TestCase):
         with mk.patch('setupam.corpus.os.path.exists', return_value=False):
             prompts = setupam.speaker.Prompts()
             prompts.populate('', multi_path='')
-            mock_multi_files.assert_called_with('', 'txt')
+            mock_multi_files.assert_called_with('', 'txt', index=None)
             mock_single_file.assert_has_calls([])
             mock_multi_files.reset_mock()
 
@@ -61,21 +67,66 @@ class SingleFilePromptsTest(unittest.TestCase):
                     '096': 'que horas são?', '097': 'amanhã é sexta.', '16': 'para onde a senhora quer ir?'}
 
         with mk.patch('setupam.speaker.os.path.exists', return_value=True):
-            with mk.patch('setupam.speaker.open', mk.mock_open(read_data=data), create=True):
+            with mk.patch('setupam.speaker.open', mk.mock_open(read_data=data.encode('utf-8')), create=True):
                 self.prompts.populate('', multi_path='')
                 self.assertEqual(self.prompts, exp_dict)
 
     def test_invalid_single(self):
         data = "094   \nPara onde a senhora quer ir?\n096Que horas são?\n\n"
         with mk.patch('setupam.speaker.os.path.exists', return_value=True):
-            with mk.patch('setupam.speaker.open', mk.mock_open(read_data=data), create=True):
+            with mk.patch('setupam.speaker.open', mk.mock_open(read_data=data.encode('utf-8')), create=True):
                 self.prompts.populate('', multi_path='')
                 self.assertEqual(self.prompts, {})
 
 
+class LargeSingleFilePromptsTest(unittest.TestCase):
+    lines = ['{:05}  Para onde a senhora quer ir?', '{:05}. Amanhã   é sexta.  ', '{:05}Que horas são?',
+             '{:05}\t tab', '  {:05} indented', '{:05}   ', '', '{:05} duplicated id']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.content = '\r\n'.join(line.format(i % 50000) for i in range(10000) for line in cls.lines)
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.file_path = os.path.join(tmp_dir.name, 'prompts-original')
+
+    def legacy_parse(self):
+        expected = {}
+        for line in self.content.splitlines():
+            m = re.search(setupam.speaker.Prompts.PROMPT_PATTERN, line)
+            if m:
+                expected[m.group('id')] = m.group('prompt').lower()
+        return expected
+
+    def check_parse(self, encoding):
+        with open(self.file_path, mode='wb') as f:
+            f.write(self.content.encode(encoding))
+        expected = self.legacy_parse()
+        for threshold in (setupam.speaker.Prompts.STREAM_THRESHOLD, 1024):
+            with mk.patch.object(setupam.speaker.Prompts, 'STREAM_THRESHOLD', threshold):
+                prompts = setupam.speaker.Prompts()
+                prompts.populate(self.file_path)
+                self.assertEqual(prompts, expected)
+
+    def test_utf8(self):
+        self.check_parse('utf-8')
+
+    def test_utf16(self):
+        self.check_parse('utf-16')
+
+    def test_encoding_changes_after_the_sample(self):
+        self.content = '{}\r\n00001 Amanhã é sexta.'.format(self.content.replace('ã', 'a').replace('é', 'e'))
+        with mk.patch.object(setupam.speaker.SpeakerFileReader, '_get_encoding', return_value='latin-1') as mock_detect:
+            self.check_parse('latin-1')
+        # The encoding is detected on the whole content, not on the UTF-8 sample
+        self.assertEqual(len(mock_detect.call_args[0][1]), len(self.content))
+
+
 class MultiFilePromptsTest(unittest.TestCase):
     @mk.patch('setupam.io.track_files', return_value=['/home/user/test.txt'])
-    @mk.patch('setupam.speaker.open', mk.mock_open(read_data="Vou tomar um pouquinho d'água"), create=True)
+    @mk.patch('setupam.io.open', mk.mock_open(read_data="Vou tomar um pouquinho d'água".encode()), create=True)
     def test_multi(self, mock_track_files):
         multi = setupam.speaker.Prompts()
         multi.populate(multi_path='/home/user/')
@@ -84,6 +135,31 @@ class MultiFilePromptsTest(unittest.TestCase):
         self.assertEqual(multi['test'], "vou tomar um pouquinho d'água")
 
 
+class BulkMultiFilePromptsTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dir_path = tmp_dir.name
+        self.expected = {}
+        for i in range(40):
+            prompt = 'Ação número {}\nsegunda linha'.format(i)
+            with open(os.path.join(self.dir_path, '{:03}.txt'.format(i)), mode='wb') as f:
+                f.write(prompt.encode('utf-8' if i % 2 else 'utf-16'))
+            self.expected['{:03}'.format(i)] = 'ação número {}'.format(i)
+
+    def test_bulk_read(self):
+        get_encoding = setupam.speaker.SpeakerFileReader._get_encoding
+        for workers in (0, 8):
+            with mk.patch.object(setupam.speaker.Prompts, 'READ_WORKERS', workers), \
+                    mk.patch.object(setupam.speaker.SpeakerFileReader, '_get_encoding', autospec=True,
+                                    side_effect=get_encoding) as mock_detect:
+                prompts = setupam.speaker.Prompts()
+                prompts.populate(multi_path=self.dir_path)
+                self.assertEqual(prompts, self.expected)
+                self.assertEqual(mock_detect.call_count, 1)  # Detected once for the directory
+
+
 class AudiosTest(unittest.TestCase):
 
     def setUp(self):
@@ -98,6 +174,20 @@ class AudiosTest(unittest.TestCase):
                 (('001', 'wav', '/home/001.wav'), ('audio', 'raw', '/home/audio.raw'), ('file', 'mp3', 'file.mp3')))
 
 
+class AudioTest(unittest.TestCase):
+
+    def setUp(self):
+        self.file_path = os.path.join('home', 'spk', 'wav', '001.wav')
+
+    def test_record(self):
+        audio = setupam.speaker.Audio.from_path(self.file_path)
+        self.assertEqual(audio.path, self.file_path)
+        self.assertEqual(tuple(audio), ('001', 'wav', self.file_path))
+        self.assertEqual(pickle.loads(pickle.dumps(audio)), audio)
+        with self.assertRaises(AttributeError):
+            audio.other = None
+
+
 class MetadataTest(unittest.TestCase):
 
     def setUp(self):
@@ -120,9 +210,60 @@ class MetadataTest(unittest.TestCase):
             'AGE': 'desconhecido',
             'LANGUAGE': 'PT_BR'
         }
-        with mk.patch('setupam.speaker.open', mk.mock_open(read_data=content_file), create=True):
+        with mk.patch('setupam.speaker.open', mk.mock_open(read_data=content_file.encode('utf-8')), create=True):
             self.metadata.populate('')
             self.assertEqual(self.metadata, exp_dict)
 
+
+class ReadTextTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.file_path = os.path.join(tmp_dir.name, 'prompts')
+        self.reader = setupam.speaker.SpeakerFileReader()
+
+    def write(self, content):
+        with open(self.file_path, mode='wb') as f:
+            f.write(content)
+
+    @mk.patch('setupam.speaker.SpeakerFileReader._get_encoding')
+    def test_utf8_skips_detection(self, mock_detect):
+        self.write('001 Amanhã é sexta.\r\n002 Que horas são?\r'.encode('utf-8'))
+        self.assertEqual(self.reader._read_text(self.file_path),
+                         '001 Amanhã é sexta.\n002 Que horas são?\n')
+        self.write(codecs.BOM_UTF8 + b'ascii')
+        self.assertEqual(self.reader._read_text(self.file_path), 'ascii')
+        mock_detect.assert_not_called()
+
+    def test_detected_encoding_is_cached(self):
+        text = 'Ação, coração e emoção.\n' * 5
+        self.write(text.encode('utf-16'))
+        cache = self.reader.encoding_cache = setupam.cache.StatCache()
+        self.assertEqual(self.reader._read_text(self.file_path), text)
+        self.assertIsNotNone(cache.get(self.file_path))
+        with mk.patch('setupam.speaker.SpeakerFileReader._get_encoding') as mock_detect:
+            self.assertEqual(self.reader._read_text(self.file_path), text)
+            mock_detect.assert_not_called()
+
+    def test_wrong_guess_is_detected_again(self):
+        text = 'Ação, coração e emoção.\n'
+        self.write(text.encode('latin-1'))
+        with mk.patch('setupam.speaker.SpeakerFileReader._get_encoding', side_effect=['utf-8', 'latin-1']):
+            self.assertEqual(self.reader._read_text(self.file_path), text)
+        with mk.patch('setupam.speaker.SpeakerFileReader._get_encoding', return_value='ascii'), \
+                self.assertLogs(level='WARNING'):
+            self.assertEqual(self.reader._read_text(self.file_path),
+                             text.encode('latin-1').decode('ascii', errors='replace'))
+
+    @mk.patch('setupam.speaker.SpeakerFileReader._get_encoding', side_effect=['utf-16', 'latin-1'])
+    def test_shared_guess_is_checked(self, mock_detect):
+        texts = ['Ação número 1', 'Ação número 2', 'Ação 03', 'Ação número 4']
+        files = [('001.txt', texts[0].encode('utf-16')), ('002.txt', texts[1].encode('utf-16')),
+                 ('003.txt', texts[2].encode('latin-1')), ('004.txt', texts[3].encode('utf-8'))]
+        self.assertEqual(list(self.reader._decode_texts(files)), texts)
+        self.assertEqual([call[0][0] for call in mock_detect.call_args_list], ['001.txt', '003.txt'])
+
+
 if __name__ == "__main__":
     unittest.main()
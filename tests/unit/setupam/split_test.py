@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import random
+import unittest
+
+import setupam.speaker
+import setupam.split
+
+
+class BalancedSplitTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(1)
+        self.weights = {'spk{}'.format(i): rng.expovariate(1 / 600.) for i in range(2000)}
+
+    def test_ratio(self):
+        train, test = setupam.split.balanced_split(self.weights, 0.1, seed=7)
+        self.assertEqual(sorted(train + test), sorted(self.weights))
+        self.assertFalse(set(train) & set(test))
+        test_weight = sum(self.weights[name] for name in test)
+        self.assertAlmostEqual(test_weight / sum(self.weights.values()), 0.1, places=3)
+
+    def test_deterministic(self):
+        self.assertEqual(setupam.split.balanced_split(self.weights, 0.2, seed=3),
+                         setupam.split.balanced_split(self.weights, 0.2, seed=3))
+
+    def test_fixed(self):
+        fixed = {'spk0': setupam.split.TEST, 'spk1': setupam.split.TRAIN}
+        train, test = setupam.split.balanced_split(self.weights, 0.1, seed=7, fixed=fixed)
+        self.assertIn('spk0', test)
+        self.assertIn('spk1', train)
+
+    def test_at_least_one_test_speaker(self):
+        train, test = setupam.split.balanced_split({'a': 10., 'b': 20.}, 0.01)
+        self.assertEqual(test, ['a'])
+        self.assertEqual(train, ['b'])
+
+
+class ShardTest(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(setupam.split.parse_shard('2/8'), (2, 8))
+        for value in ('8/8', '-1/8', '2', 'a/b'):
+            with self.assertRaises(ValueError):
+                setupam.split.parse_shard(value)
+
+    def test_shards_partition(self):
+        names = ['spk{}'.format(i) for i in range(1000)]
+        shards = [[name for name in names if setupam.split.in_shard(name, (i, 4))] for i in range(4)]
+        self.assertEqual(sorted(name for shard in shards for name in shard), sorted(names))
+        self.assertTrue(all(200 < len(shard) < 300 for shard in shards))
+
+    def test_hashed_split(self):
+        names = ['spk{}'.format(i) for i in range(1000)]
+        train, test = setupam.split.hashed_split(names, 0.1, seed=3)
+        self.assertTrue(50 < len(test) < 150)
+        # The part of a speaker doesn't depend on the others
+        self.assertEqual(setupam.split.hashed_split(names[::3], 0.1, seed=3)[1],
+                         [name for name in names[::3] if name in test])
+        fixed = {test[0]: setupam.split.TRAIN}
+        self.assertIn(test[0], setupam.split.hashed_split(names, 0.1, 3, fixed)[0])
+
+    def test_hashed_split_can_leave_the_test_part_empty(self):
+        # The ratio is only approximate, so a small corpus can get no test speaker
+        self.assertEqual(setupam.split.hashed_split(list('abcdefgh'), 0.3, seed=3), (list('abcdefgh'), []))
+
+
+class SpeakerWeightsTest(unittest.TestCase):
+    def test_utterances(self):
+        speaker = setupam.speaker.Speaker('spk')
+        speaker.audios = setupam.speaker.Audios(
+            [setupam.speaker.Audio(name, 'wav', '/src/spk/wav') for name in ('001', '002', '003')])
+        speaker.prompts = setupam.speaker.Prompts({'001': 'um', '003': 'três'})
+        self.assertEqual(setupam.split.speaker_weights({'spk': speaker}, 'utterance'), {'spk': 2})
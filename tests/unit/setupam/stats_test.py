@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+import unittest
+import wave
+from unittest import mock as mk
+
+import setupam.cache
+import setupam.stats
+
+
+def write_wav(file_path, channels, sample_width, sample_rate, seconds):
+    with wave.open(file_path, 'wb') as f:
+        f.setparams((channels, sample_width, sample_rate, 0, 'NONE', 'not compressed'))
+        f.writeframes(b'\x00' * int(channels * sample_width * sample_rate * seconds))
+
+
+class ReadHeaderTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp = tmp_dir.name
+
+    def test_header(self):
+        file_path = os.path.join(self.tmp, 'a.wav')
+        write_wav(file_path, 2, 2, 44100, 1.5)
+        header = setupam.stats.read_header(file_path)
+        self.assertEqual((header.channels, header.sample_rate, header.bits), (2, 44100, 16))
+        self.assertAlmostEqual(header.duration, 1.5)
+
+    def test_not_wav(self):
+        file_path = os.path.join(self.tmp, 'a.mp3')
+        with open(file_path, mode='wb') as f:
+            f.write(b'ID3' + b'\x00' * 32)
+        with self.assertRaises(setupam.stats.HeaderError):
+            setupam.stats.read_header(file_path)
+        self.assertEqual(setupam.stats.read_headers([file_path], workers=1), [None])
+
+
+class CorpusReportTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.corpus_path = tmp_dir.name
+        self.splits = {}
+        audios = {'train': [('000001', '000001_001', 16000, 2.), ('000001', '000001_002', 16000, 1.),
+                            ('000002', '000002_003', 8000, 1.)],
+                  'test': [('000003', '000003_004', 16000, 4.)]}
+        for split, split_audios in audios.items():
+            self.splits[split] = os.path.join(self.corpus_path, '{}.fileids'.format(split))
+            with open(self.splits[split], mode='w') as f:
+                for spk, audio, rate, seconds in split_audios:
+                    os.makedirs(os.path.join(self.corpus_path, 'wav', spk), exist_ok=True)
+                    write_wav(os.path.join(self.corpus_path, 'wav', spk, audio + '.wav'), 1, 2, rate, seconds)
+                    f.write('{}/{}\n'.format(spk, audio))
+
+    def test_report(self):
+        report = setupam.stats.corpus_report(self.corpus_path, self.splits, workers=2)
+        self.assertEqual(report['total']['files'], 4)
+        self.assertAlmostEqual(report['total']['duration'], 8.)
+        self.assertEqual(report['splits']['train']['speakers'], 2)
+        self.assertAlmostEqual(report['splits']['test']['ratio'], .5)
+        self.assertEqual(report['sample_rates'], {'8000': 1, '16000': 3})
+        self.assertEqual(report['speakers']['000001']['files'], 2)
+        self.assertEqual(report['unreadable'], 0)
+
+    def test_cached(self):
+        cache = setupam.cache.StatCache()
+        first = setupam.stats.corpus_report(self.corpus_path, self.splits, workers=1, cache=cache)
+        with mk.patch('setupam.stats.read_header') as mock_read:
+            second = setupam.stats.corpus_report(self.corpus_path, self.splits, workers=1, cache=cache)
+            mock_read.assert_not_called()
+        self.assertEqual(first['speakers'], second['speakers'])
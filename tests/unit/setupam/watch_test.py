@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014  Gabriel F. Araujo
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import tempfile
+import unittest
+from unittest import mock as mk
+
+import setupam.cli
+import setupam.corpus
+import setupam.io
+import setupam.manifest
+import setupam.watch
+from tests.unit.setupam.archive_test import create_archive
+from tests.unit.setupam.cli_test import create_speaker
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.src = os.path.join(tmp_dir.name, 'src')
+        self.target = os.path.join(tmp_dir.name, 'target')
+        for i in range(2):
+            create_speaker(self.src, 'spk{}'.format(i), [('{:03}'.format(j), 'prompt {}'.format(j)) for j in range(2)])
+        setupam.cli.build_corpus('WARNING', 0.5, self.src, 'model', self.target, copy_workers=0, stats=False)
+        self.etc = os.path.join(self.target, 'model', 'etc')
+
+    def read(self, filename):
+        with open(os.path.join(self.etc, filename), encoding='utf-8') as f:
+            return f.read()
+
+    def test_appends_new_speakers(self):
+        fileids, transcription = self.read('model_train.fileids'), self.read('model_train.transcription')
+        watcher = setupam.watch.Watcher(self.src, 'model', self.target, copy_workers=0, settle=False)
+        self.assertEqual(watcher.poll(), [])
+        create_speaker(self.src, 'spk2', [('001', 'novo')])
+        create_archive(self.src, 'spk3', [('001', 'outro'), ('002', 'mais')])
+        self.assertEqual(watcher.poll(), ['spk2', 'spk3'])
+        new_fileids = self.read('model_train.fileids')
+        self.assertEqual(new_fileids, fileids + '000003/000003_005\n000004/000004_006\n000004/000004_007\n')
+        self.assertEqual(self.read('model_train.transcription'),
+                         transcription + '<s> novo </s> (000003_005)\n<s> outro </s> (000004_006)\n'
+                                         '<s> mais </s> (000004_007)\n')
+        for line in new_fileids.splitlines()[-3:]:
+            self.assertTrue(os.path.exists(os.path.join(self.target, 'model', 'wav', line + '.wav')))
+        manifest = setupam.manifest.Manifest.load(os.path.join(self.etc, 'model.manifest'))
+        self.assertEqual(manifest.speaker_id('spk3'), 4)
+        self.assertEqual(manifest.split('spk2'), 'train')
+        # Nothing changed since the last poll, so the source isn't scanned again
+        with mk.patch('setupam.source.scan_source') as mock_scan:
+            self.assertEqual(watcher.poll(), [])
+            mock_scan.assert_not_called()
+
+    def test_waits_for_speakers_to_settle(self):
+        watcher = setupam.watch.Watcher(self.src, 'model', self.target, copy_workers=0)
+        create_speaker(self.src, 'spk2', [('001', 'novo')])
+        self.assertEqual(watcher.poll(), [])
+        with open(os.path.join(self.src, 'spk2', 'wav', '002.wav'), mode='wb') as f:
+            f.write(b'RIFF')
+        self.assertEqual(watcher.poll(), [])
+        self.assertEqual(watcher.poll(), ['spk2'])
+
+    def test_skips_invalid_speakers(self):
+        watcher = setupam.watch.Watcher(self.src, 'model', self.target, copy_workers=0, settle=False)
+        os.makedirs(os.path.join(self.src, 'empty'))
+        self.assertEqual(watcher.poll(), [])
+        with mk.patch('setupam.build.read_speaker', side_effect=ValueError('No audios')) as mock_read:
+            os.makedirs(os.path.join(self.src, 'other'))
+            watcher.poll()
+            self.assertEqual([c[0][0] for c in mock_read.call_args_list], ['other'])
+
+    def test_retries_speakers_filled_after_failing(self):
+        watcher = setupam.watch.Watcher(self.src, 'model', self.target, copy_workers=0, settle=False)
+        for dir_name in ('wav', 'etc'):
+            os.makedirs(os.path.join(self.src, 'spk2', dir_name))
+        self.assertEqual(watcher.poll(), [])
+        self.assertIn('spk2', watcher.failed)
+        # Filling the speaker's directories leaves the mtime of the source as it was
+        source_mtime = os.stat(self.src).st_mtime_ns
+        with open(os.path.join(self.src, 'spk2', 'wav', '001.wav'), mode='wb') as f:
+            f.write(b'RIFF')
+        with open(os.path.join(self.src, 'spk2', 'etc', 'prompts-original'), mode='w', encoding='utf-8') as f:
+            f.write('001 novo\n')
+        self.assertEqual(os.stat(self.src).st_mtime_ns, source_mtime)
+        self.assertEqual(watcher.poll(), ['spk2'])
+        self.assertEqual(watcher.failed, {})
+
+    def test_copy_errors_are_raised(self):
+        fileids = self.read('model_train.fileids')
+        watcher = setupam.watch.Watcher(self.src, 'model', self.target, copy_workers=0, settle=False)
+        create_speaker(self.src, 'spk2', [('001', 'novo'), ('002', 'outro')])
+        materialize_file = setupam.io.materialize_file
+
+        def failing_copy(src, dst, mode='copy'):
+            if src.endswith('001.wav'):
+                raise OSError(5, 'Input/output error', src)
+            materialize_file(src, dst, mode)
+
+        with mk.patch('setupam.io.materialize_file', side_effect=failing_copy):
+            with self.assertRaises(setupam.corpus.CopyError) as cm:
+                watcher.poll()
+        self.assertEqual(len(cm.exception.errors), 1)
+        # The failed audio is left out of the metadata, but keeps its ID for the next build
+        self.assertEqual(self.read('model_train.fileids'), fileids + '000003/000003_006\n')
+        manifest = setupam.manifest.Manifest.load(os.path.join(self.etc, 'model.manifest'))
+        self.assertEqual([utterance[0] for utterance in manifest.speakers['spk2']['utterances']], [5, 6])
+
+    def test_run_goes_on_after_errors(self):
+        watcher = setupam.watch.Watcher(self.src, 'model', self.target, copy_workers=0, settle=False)
+        errors = [setupam.corpus.CopyError([('a', 'b', OSError(5, 'Input/output error'))]), OSError(2, 'Gone'), []]
+        with mk.patch.object(watcher, 'poll', side_effect=errors) as mock_poll, self.assertLogs(level='ERROR'):
+            watcher.run(interval=0., polls=3)
+        self.assertEqual(mock_poll.call_count, 3)